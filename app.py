@@ -1,30 +1,101 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
 import sqlite3
-from transformers import pipeline
+import io
 import json
 import os
+import time
+import numpy as np
+import assets
+import db
+import logs
+import metrics
+import migrations
+import rollups
+import archive
+import badges
+import score_ingest
+import leaderboard
+import events
+import pools
+import response_cache
+import bulk
+import quiz_store
+import paging
+from translation_cache import translate_cached, get_stats as get_translation_stats
+import pretranslate
+from translation_service import TranslationUnavailable, get_stats as get_service_stats
+from model_registry import get_translator, supported_languages, loaded_models, preload as preload_models
+
+# Translation models are loaded on first use by model_registry; add languages
+# there (or via TRANSLATION_MODELS) instead of loading pipelines here.
+# TRANSLATION_PRELOAD=fr,de loads them at import instead, which together with
+# gunicorn's preload_app (see gunicorn.conf.py) shares the weights between workers.
+if os.environ.get('TRANSLATION_PRELOAD'):
+    preload_models([l.strip() for l in os.environ['TRANSLATION_PRELOAD'].split(',') if l.strip()])
 
-print("Loading English to French translation model...")
-translator_en_fr = pipeline("translation_en_to_fr", model="Helsinki-NLP/opus-mt-en-fr")
-print("Translation model loaded successfully.")
-
-# You can add more models for other languages here
-# print("Loading English to German translation model...")
-# translator_en_de = pipeline("translation_en_to_de", model="Helsinki-NLP/opus-mt-en-de")
-# print("German model loaded.")
 app = Flask(__name__, static_folder='static', static_url_path='')
+db.init_app(app)
+migrations.migrate(db.get_connection())
+badge_engine = badges.load_engine(db.get_connection())
+# Built here, not by the first leaderboard request (with preload_app, once in
+# the master for every worker); requests only catch up from here on
+leaderboard.service.rebuild(db.get_connection())
+
+pretranslate.start(get_translator)
+assets.load()
+
+log = logs.get_logger('app')
+
+# --- Instrumentation: per-route latency, /metrics and the opt-in profiler (see metrics.py) ---
+metrics.collector('translation_cache', get_translation_stats)
+metrics.collector('response_cache', response_cache.get_stats)
+metrics.collector('pool', pools.get_stats)
+metrics.collector('events', events.get_stats)
+metrics.collector('score_ingest', score_ingest.get_stats)
+metrics.collector('translation_service', get_service_stats)
+metrics.start_profiler()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_seconds.observe(time.perf_counter() - started, route, request.method, response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profile', methods=['GET'])
+def sampled_profile():
+    """Collapsed stacks from the sampling profiler (PROFILE_SAMPLE_MS)."""
+    stacks = metrics.profile(reset=request.args.get('reset') == '1')
+    if stacks is None:
+        return jsonify({"error": "The profiler is off; set PROFILE_SAMPLE_MS to enable it."}), 404
+    return Response(stacks, mimetype='text/plain')
 
 def db_connection():
-    """Helper function to connect to the database."""
-    conn = sqlite3.connect('mydatabase.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Returns the current thread's pooled database connection (see db.py).
+
+    Routes must not close it; uncommitted work is rolled back at teardown.
+    """
+    return db.get_connection()
 
 # --- Main Page ---
 @app.route('/')
 def index():
-    """Serve the main HTML file from the 'static' folder."""
-    return app.send_static_file('index.html')
+    """Serve the main HTML file, with fingerprinted asset links (see assets.py)."""
+    return assets.send_page('index.html', lambda: app.send_static_file('index.html'))
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Minified, precompressed, immutable scripts and styles (see assets.py)."""
+    return assets.send_asset(filename)
 
 # --- API for User Registration ---
 @app.route('/api/register', methods=['POST'])
@@ -44,8 +115,6 @@ def register():
         return jsonify({"success": True, "message": "User registered!"}), 201
     except sqlite3.IntegrityError:
         return jsonify({"success": False, "message": "Username already taken."}), 409
-    finally:
-        conn.close()
 
 # --- API for User Login ---
 @app.route('/api/login', methods=['POST'])
@@ -59,7 +128,6 @@ def login():
         "SELECT * FROM users WHERE username = ? AND password = ?",
         (username, password)
     ).fetchone()
-    conn.close()
 
     if user:
         return jsonify({"success": True, "user_id": user['id'], "username": user['username']})
@@ -67,52 +135,61 @@ def login():
         return jsonify({"success": False, "message": "Invalid credentials."}), 401
 
 
-def check_and_award_badges(user_id, subject, score):
-    """Checks achievements and awards badges to a user."""
-    conn = db_connection()
-    cursor = conn.cursor()
-
-    # Rule 1: Award subject master badge for a perfect score
-    if score == 20: # Assuming 20 questions
-        badge_name = f"{subject} Master" if subject != "Physics" else "Physics Phenom"
-        cursor.execute("SELECT id FROM badges WHERE name = ?", (badge_name,))
-        badge = cursor.fetchone()
-        if badge:
-            cursor.execute("INSERT OR IGNORE INTO user_badges (user_id, badge_id) VALUES (?, ?)", (user_id, badge['id']))
-
-    # Rule 2: Award enthusiast badge after 3 quizzes
-    total_quizzes = cursor.execute("SELECT COUNT(*) FROM scores WHERE user_id = ?", (user_id,)).fetchone()[0]
-    if total_quizzes >= 3:
-        cursor.execute("SELECT id FROM badges WHERE name = 'Quiz Enthusiast'")
-        badge = cursor.fetchone()
-        if badge:
-            cursor.execute("INSERT OR IGNORE INTO user_badges (user_id, badge_id) VALUES (?, ?)", (user_id, badge['id']))
+# --- Backpressure: a full pool answers 503 rather than queueing without limit ---
+@app.errorhandler(pools.PoolBusy)
+def pool_busy(e):
+    response = jsonify({"error": "The server is busy, please retry shortly.", "pool": e.pool})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
-    conn.commit()
-    conn.close()
+@app.errorhandler(paging.BadPage)
+def bad_page(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(score_ingest.BadSubmission)
+def bad_submission(e):
+    return jsonify({"success": False, "message": str(e)}), 400
+
+def bounded(translator):
+    """Routes model calls through the inference pool. Cache hits never reach it."""
+    return lambda texts: pools.inference.run(translator, texts)
+
+
+def check_and_award_badges(conn, user_id, subject, score):
+    """Checks achievements and awards badges to a user.
+
+    Rules come from badge_rules.json (see badges.py) and are evaluated in one
+    read of the user's stats. Runs inside the caller's transaction; the
+    caller commits. New badges are pushed to the student's event stream.
+    Returns the names of newly awarded badges.
+    """
+    new_badges = badge_engine.award(conn, user_id)
+    if new_badges:
+        events.publish(conn, 'badge', [f"user:{user_id}"], {
+            "user_id": user_id, "badges": [badge_engine.details[name] for name in new_badges],
+        })
+    return new_badges
+
+score_ingest.configure(check_and_award_badges)
+score_ingest.recover()
 
 # --- API to Save Score ---
 @app.route('/api/scores', methods=['POST'])
 def save_score():
-    data = request.get_json()
-    user_id = data['user_id']
-    subject = data['subject']
-    score = data['score']
+    user_id, subject, score = score_ingest.parse_submission(request.get_json(silent=True))
+    if db_connection().execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is None:
+        return jsonify({"success": False, "message": f"User {user_id} does not exist."}), 400
 
-    conn = db_connection()
-    conn.execute(
-        "INSERT INTO scores (user_id, subject, score) VALUES (?, ?, ?)",
-        (user_id, subject, score)
-    )
-    conn.commit()
-    conn.close()
+    # Journaled and acknowledged now; score_ingest writes it (and checks for
+    # new badges) in the next batch
+    submission_id = score_ingest.submit(user_id, subject, score)
     
-    check_and_award_badges(user_id, subject, score) # Check for new badges
-    
-    return jsonify({"success": True, "message": "Score saved!"})
+    return jsonify({"success": True, "message": "Score saved!", "submission_id": submission_id}), 202
 
 
 @app.route('/api/get_badges/<int:user_id>', methods=['GET'])
+@response_cache.cached(lambda user_id: [f"user:{user_id}"])
 def get_user_badges(user_id):
     conn = db_connection()
     badges = conn.execute("""
@@ -121,20 +198,47 @@ def get_user_badges(user_id):
         JOIN user_badges ub ON b.id = ub.badge_id
         WHERE ub.user_id = ?
     """, (user_id,)).fetchall()
-    conn.close()
     return jsonify([dict(row) for row in badges])
 
 @app.route('/api/get_scores/<int:user_id>', methods=['GET'])
+@response_cache.cached(lambda user_id: [f"user:{user_id}"])
 def get_scores(user_id):
+    """A page of a student's score history, newest first (see paging.py).
+
+    Filters: subject, since and until (dates, inclusive). Past the live
+    scores, the history continues into the archive (archive.py).
+    """
+    limit, after, fields = paging.page_args(request.args, ('id', 'subject', 'score', 'timestamp'),
+                                            ('subject', 'score', 'timestamp'), key_size=2)
+    since, until = paging.date_arg(request.args, 'since'), paging.date_arg(request.args, 'until')
+    sql = "SELECT id, subject, score, timestamp FROM scores WHERE user_id = ?"
+    params = [user_id]
+    if request.args.get('subject'):
+        sql += " AND subject = ?"
+        params.append(request.args['subject'])
+    if since:
+        sql += " AND timestamp >= ?"
+        params.append(since)
+    if until:
+        sql += " AND timestamp < date(?, '+1 day')"
+        params.append(until)
+    if after:
+        # Keyset on (timestamp, id): a range read on idx_scores_user_time from the last row sent
+        sql += " AND timestamp <= ? AND (timestamp < ? OR id < ?)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
     conn = db_connection()
-    scores = conn.execute(
-        "SELECT subject, score, timestamp FROM scores WHERE user_id = ? ORDER BY timestamp DESC",
-        (user_id,)
-    ).fetchall()
-    conn.close()
-    # Convert the database rows to a list of dictionaries
-    scores_list = [dict(row) for row in scores]
-    return jsonify(scores_list)
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    if len(rows) <= limit:
+        last = [rows[-1]['timestamp'], rows[-1]['id']] if rows else after
+        rows += archive.history(conn, user_id, limit + 1 - len(rows), last, request.args.get('subject'), since, until)
+    return Response(paging.stream_page(rows, limit, fields, lambda row: [row['timestamp'], row['id']]),
+                    mimetype='application/json')
+
+@app.route('/api/get_score_summary/<int:user_id>', methods=['GET'])
+def get_score_summary(user_id):
+    """Per-subject quiz count, average, best and worst score for a student."""
+    return jsonify(rollups.user_summary(db_connection(), user_id))
 
 # ===============================================
 # ========== TEACHER DASHBOARD ROUTES ===========
@@ -143,7 +247,7 @@ def get_scores(user_id):
 @app.route('/teacher')
 def teacher_portal():
     """Serves the main teacher dashboard HTML file."""
-    return app.send_static_file('teacher.html')
+    return assets.send_page('teacher.html', lambda: app.send_static_file('teacher.html'))
 
 @app.route('/api/teacher/login', methods=['POST'])
 def teacher_login():
@@ -163,7 +267,6 @@ def teacher_login():
             "SELECT id, class_name FROM classes WHERE teacher_id = ?",
             (teacher['id'],)
         ).fetchall()
-        conn.close()
         return jsonify({
             "success": True,
             "teacher_id": teacher['id'],
@@ -171,59 +274,128 @@ def teacher_login():
             "classes": [dict(c) for c in classes]
         })
     else:
-        conn.close()
         return jsonify({"success": False, "message": "Invalid credentials"}), 401
 
 
-@app.route('/api/teacher/analytics/<int:class_id>', methods=['GET'])
-def get_class_analytics(class_id):
-    conn = db_connection()
-    analytics_data = conn.execute("""
+def query_class_averages(conn, class_ids, start=None, end=None):
+    """Average score per (student, subject) for students in any of class_ids.
+
+    start/end are optional 'YYYY-MM-DD' dates; both ends are inclusive.
+    Without a date range the averages come straight from score_rollups; a
+    range reaching back into the archive is merged with it (archive.py).
+    """
+    placeholders = ",".join("?" * len(class_ids))
+    if not start and not end:
+        return conn.execute(f"""
+            SELECT
+                u.username,
+                r.subject,
+                CAST(r.score_sum AS REAL) / r.quiz_count as average_score
+            FROM score_rollups r
+            JOIN users u ON r.user_id = u.id
+            WHERE r.user_id IN (SELECT user_id FROM enrollments WHERE class_id IN ({placeholders}))
+            ORDER BY u.username, r.subject
+        """, class_ids).fetchall()
+    if archive.overlaps(conn, start, end):
+        return archive.class_averages(conn, class_ids, start, end)
+
+    sql = f"""
         SELECT
             u.username,
             s.subject,
             AVG(s.score) as average_score
         FROM scores s
         JOIN users u ON s.user_id = u.id
-        JOIN enrollments e ON u.id = e.user_id
-        WHERE e.class_id = ?
-        GROUP BY u.username, s.subject
-        ORDER BY u.username
-    """, (class_id,)).fetchall()
-    conn.close()
+        WHERE s.user_id IN (SELECT user_id FROM enrollments WHERE class_id IN ({placeholders}))
+    """
+    params = list(class_ids)
+    if start:
+        sql += " AND s.timestamp >= ?"
+        params.append(start)
+    if end:
+        sql += " AND s.timestamp < date(?, '+1 day')"
+        params.append(end)
+    sql += " GROUP BY u.username, s.subject ORDER BY u.username"
+    return conn.execute(sql, params).fetchall()
+
+def read_class_averages(class_ids, start=None, end=None):
+    # Runs in the sqlite pool, possibly on another thread, so it takes that thread's connection
+    return query_class_averages(db_connection(), class_ids, start, end)
+
+def build_chart_data(analytics_data):
+    """Pivots (username, subject, average_score) rows into a Chart.js payload.
+
+    Each row is placed into a subjects x students grid by dict lookup, so the
+    cost is linear in the number of rows; missing pairs stay 0.
+    """
+    # Format the data for Chart.js
+    labels = list(dict.fromkeys(row['username'] for row in analytics_data))
+    subjects = list(dict.fromkeys(row['subject'] for row in analytics_data))
+    label_index = {label: i for i, label in enumerate(labels)}
+    subject_index = {subject: i for i, subject in enumerate(subjects)}
+
+    grid = np.zeros((len(subjects), len(labels)))
+    grid[
+        [subject_index[row['subject']] for row in analytics_data],
+        [label_index[row['username']] for row in analytics_data]
+    ] = [row['average_score'] for row in analytics_data]
+
+    datasets = [{
+        'label': subject,
+        'data': grid[i].tolist(),
+        'backgroundColor': f'rgba({hash(subject) % 255}, {hash(subject*2) % 255}, {hash(subject*3) % 255}, 0.5)'
+    } for i, subject in enumerate(subjects)]
+
+    return {
+        'labels': labels,
+        'datasets': datasets
+    }
+
+@app.route('/api/teacher/analytics/<int:class_id>', methods=['GET'])
+def get_class_analytics(class_id):
+    analytics_data = pools.sqlite.run(read_class_averages, [class_id])
 
     if not analytics_data:
         return jsonify({"error": "No data found for this class."}), 404
 
-    # Format the data for Chart.js
-    labels = []
-    datasets = {} # Using a dict to group scores by subject
-    
-    for row in analytics_data:
-        if row['username'] not in labels:
-            labels.append(row['username'])
-        
-        if row['subject'] not in datasets:
-            datasets[row['subject']] = {
-                'label': row['subject'],
-                'data': [],
-                'backgroundColor': f'rgba({hash(row["subject"]) % 255}, {hash(row["subject"]*2) % 255}, {hash(row["subject"]*3) % 255}, 0.5)'
-            }
-    
-    # Fill in the data for each student
-    for label in labels:
-        for subject in datasets:
-            # Find the score for this student and subject, or default to 0
-            score_row = next((r for r in analytics_data if r['username'] == label and r['subject'] == subject), None)
-            score = score_row['average_score'] if score_row else 0
-            datasets[subject]['data'].append(score)
-
-    chart_data = {
-        'labels': labels,
-        'datasets': list(datasets.values())
-    }
-    
-    return jsonify(chart_data)
+    return jsonify(build_chart_data(analytics_data))
+
+@app.route('/api/teacher/analytics', methods=['GET'])
+def get_multi_class_analytics():
+    """Analytics across several classes and an optional date range.
+
+    Query string: class_id (repeatable or comma-separated), start, end (YYYY-MM-DD).
+    """
+    try:
+        class_ids = [int(c) for value in request.args.getlist('class_id') for c in value.split(',') if c]
+    except ValueError:
+        return jsonify({"error": "class_id must be an integer."}), 400
+    if not class_ids:
+        return jsonify({"error": "At least one class_id is required."}), 400
+
+    start, end = paging.date_arg(request.args, 'start'), paging.date_arg(request.args, 'end')
+    analytics_data = pools.sqlite.run(read_class_averages, class_ids, start, end)
+
+    if not analytics_data:
+        return jsonify({"error": "No data found for these classes."}), 404
+
+    return jsonify(build_chart_data(analytics_data))
+
+def read_class_report(class_id, by, start=None, end=None):
+    return archive.class_report(db_connection(), class_id, by, start, end)
+
+@app.route('/api/teacher/report/<int:class_id>', methods=['GET'])
+def get_class_report(class_id):
+    """Quizzes and average score per period and subject, live and archived scores together.
+
+    Query string: by (month or year, default year), start, end (YYYY-MM-DD).
+    """
+    by = request.args.get('by', 'year')
+    if by not in ('month', 'year'):
+        return jsonify({"error": "by must be 'month' or 'year'."}), 400
+    start, end = paging.date_arg(request.args, 'start'), paging.date_arg(request.args, 'end')
+    rows = pools.sqlite.run(read_class_report, class_id, by, start, end)
+    return jsonify({"class_id": class_id, "by": by, "rows": rows})
 
 
 # ====== QUIZ CREATION & ASSIGNMENT ROUTES ======
@@ -231,6 +403,7 @@ def get_class_analytics(class_id):
 import json
 
 @app.route('/api/teacher/quizzes', methods=['GET', 'POST'])
+@response_cache.cached(lambda: [f"teacher:{request.args.get('teacher_id')}"])
 def handle_quizzes():
     # POST: Create a new quiz
     if request.method == 'POST':
@@ -240,9 +413,9 @@ def handle_quizzes():
             "INSERT INTO quizzes (name, teacher_id) VALUES (?, ?)",
             (data['name'], data['teacher_id'])
         )
+        response_cache.bump(conn, f"teacher:{data['teacher_id']}")
         conn.commit()
         new_quiz_id = cursor.lastrowid
-        conn.close()
         return jsonify({"success": True, "quiz_id": new_quiz_id, "name": data['name']}), 201
     
     # GET: Fetch all quizzes for a teacher
@@ -250,22 +423,24 @@ def handle_quizzes():
         teacher_id = request.args.get('teacher_id')
         conn = db_connection()
         quizzes = conn.execute("SELECT id, name FROM quizzes WHERE teacher_id = ?", (teacher_id,)).fetchall()
-        conn.close()
         return jsonify([dict(q) for q in quizzes])
 
 @app.route('/api/teacher/questions', methods=['POST'])
 def add_question():
     data = request.get_json()
-    # Convert options list to a JSON string for storage
-    options_json = json.dumps(data['options'])
+    options = data['options']
+    # The right option by position; correct_answer (its text) is still accepted
+    correct_index = data.get('correct_index')
+    if correct_index is None and data.get('correct_answer') in options:
+        correct_index = options.index(data['correct_answer'])
+    if not isinstance(correct_index, int) or not 0 <= correct_index < len(options):
+        return jsonify({"success": False, "message": "The correct answer must be one of the options."}), 400
     
     conn = db_connection()
-    conn.execute(
-        "INSERT INTO questions (quiz_id, question_text, options, correct_answer) VALUES (?, ?, ?, ?)",
-        (data['quiz_id'], data['question_text'], options_json, data['correct_answer'])
-    )
+    quiz_store.add_questions(conn, [(data['quiz_id'], data['question_text'], options, correct_index)])
+    response_cache.bump(conn, f"quiz:{data['quiz_id']}")
     conn.commit()
-    conn.close()
+    pretranslate.enqueue_quiz(data['quiz_id'])
     return jsonify({"success": True, "message": "Question added successfully."})
 
 @app.route('/api/teacher/assign', methods=['POST'])
@@ -273,15 +448,21 @@ def assign_quiz():
     data = request.get_json()
     conn = db_connection()
     conn.execute("INSERT INTO assignments (quiz_id, class_id) VALUES (?, ?)", (data['quiz_id'], data['class_id']))
+    response_cache.bump(conn, f"class:{data['class_id']}")
     conn.commit()
-    conn.close()
+    pretranslate.enqueue_quiz(data['quiz_id'])
     return jsonify({"success": True, "message": "Quiz assigned successfully."})
 
 # --- Student-facing routes for custom quizzes ---
 
+def assignment_scopes(user_id):
+    # A student's assignments change with their enrollments and their classes' assignments
+    class_ids = db_connection().execute("SELECT class_id FROM enrollments WHERE user_id = ?", (user_id,)).fetchall()
+    return [f"user:{user_id}"] + [f"class:{row[0]}" for row in class_ids]
+
 @app.route('/api/student/assignments/<int:user_id>', methods=['GET'])
+@response_cache.cached(assignment_scopes)
 def get_student_assignments(user_id):
-    print(f"\n--- DEBUG: Fetching assignments for user_id: {user_id} ---")
     conn = db_connection()
     assignments = conn.execute("""
         SELECT q.id, q.name
@@ -290,83 +471,116 @@ def get_student_assignments(user_id):
         JOIN enrollments e ON a.class_id = e.class_id
         WHERE e.user_id = ?
     """, (user_id,)).fetchall()
-    conn.close()
     
     assignments_list = [dict(a) for a in assignments]
     
-    if assignments_list:
-        print(f"--- DEBUG: Found {len(assignments_list)} assignments: {assignments_list} ---")
-    else:
-        print("--- DEBUG: Found NO assignments for this user. ---")
-        
-    return jsonify(assignments_list)
+    log.debug("Found %d assignments for user %s: %s", len(assignments_list), user_id, assignments_list)
 
-@app.route('/api/quiz/<int:quiz_id>', methods=['GET'])
-def get_quiz_questions(quiz_id):
+    return jsonify(assignments_list)
 
-    target_lang = request.args.get('lang', 'en')
-    
-    conn = db_connection()
-    questions_raw = conn.execute("SELECT question_text, options, correct_answer FROM questions WHERE quiz_id = ?", (quiz_id,)).fetchall()
-    conn.close()
-
-    if target_lang == 'en':
-        questions_processed = []
-        for q in questions_raw:
-            questions_processed.append({
-                "q": q['question_text'],
-                "o": json.loads(q['options']),
-                "a": q['correct_answer']
-            })
-        return jsonify(questions_processed)
-
-    # --- AI TRANSLATION LOGIC ---
-    print(f"--- AI: Translating custom quiz ID {quiz_id} to '{target_lang}' ---")
-    
+def translate_questions(translator, model_name, target_lang, questions):
+    """Translates loaded questions (see quiz_store.load_quiz) in one cached, batched model call."""
     # 1. Collect all texts to be translated
     texts_to_translate = []
-    original_questions = []
-    for q in questions_raw:
-        question_data = {
-            "q": q['question_text'],
-            "o": json.loads(q['options']),
-            "a": q['correct_answer']
-        }
-        original_questions.append(question_data)
-        texts_to_translate.append(question_data['q'])
-        texts_to_translate.extend(question_data['o'])
-
-    # 2. Use the AI translator model
-    if target_lang == 'fr' and 'translator_en_fr' in globals():
-        translated = translator_en_fr(texts_to_translate)
-    else:
-        # If model for the target lang doesn't exist, return English
-        return jsonify(original_questions) 
-        
-    translated_texts = [item['translation_text'] for item in translated]
-    
+    for question_text, options, _ in questions:
+        texts_to_translate.append(question_text)
+        texts_to_translate.extend(options)
+
+    # 2. Serve pre-translated text, running the model only for stragglers
+    translated_texts = translate_cached(bounded(translator), model_name, target_lang, texts_to_translate)
+
     # 3. Reconstruct the quiz with translated text
     text_index = 0
     translated_quiz = []
-    for original_q in original_questions:
+    for _, options, correct_index in questions:
         translated_q_text = translated_texts[text_index]
         text_index += 1
         
         translated_options = []
-        for _ in original_q['o']:
+        for _ in options:
             translated_options.append(translated_texts[text_index])
             text_index += 1
-            
-        correct_index = original_q['o'].index(original_q['a'])
-        translated_correct_answer = translated_options[correct_index]
         
-        translated_quiz.append({
-            "q": translated_q_text,
-            "o": translated_options,
-            "a": translated_correct_answer
-        })
-        
-    return jsonify(translated_quiz)
+        translated_quiz.append((translated_q_text, translated_options, correct_index))
+    # The answer is picked by position, so it can't be lost if translation changes its text
+    return quiz_store.as_payload(translated_quiz)
+
+STREAM_CHUNK_MAX = 16
+
+def stream_quiz(translator, model_name, target_lang, questions, first):
+    """Yields NDJSON: {"total": n}, then one question per line as it is ready.
+
+    The first question is translated by the caller (so a full inference pool
+    can still answer 503). The rest go in chunks of 2, 4, 8... so the model
+    batches well without holding up the questions the student is about to
+    reach. If the pool fills up (or the translation service fails) mid-quiz,
+    the remaining questions are sent in English rather than cutting the quiz
+    short.
+    """
+    yield json.dumps({"total": len(questions)}) + "\n"
+    for question in first:
+        yield json.dumps(question) + "\n"
+    start, size = len(first), 2
+    while start < len(questions):
+        chunk = questions[start:start + size]
+        payload = None
+        if translator is not None:
+            try:
+                payload = translate_questions(translator, model_name, target_lang, chunk)
+            except (pools.PoolBusy, TranslationUnavailable):
+                translator = None
+        for question in payload or quiz_store.as_payload(chunk):
+            yield json.dumps(question) + "\n"
+        start += size
+        size = min(size * 2, STREAM_CHUNK_MAX)
+
+@app.route('/api/quiz/<int:quiz_id>', methods=['GET'])
+@response_cache.cached(lambda quiz_id: [f"quiz:{quiz_id}"])
+def get_quiz_questions(quiz_id):
+    """A quiz's questions, translated if ?lang= isn't English.
+
+    With ?stream=1 the questions are sent as NDJSON as soon as each is
+    translated (see stream_quiz), so the quiz can start before the last one
+    is ready. Anything not being translated (English, or a language with no
+    model) is served from the quiz's pre-encoded payload; English is also the
+    fallback when the translation service is unavailable.
+    """
+    target_lang = request.args.get('lang', 'en')
+    streaming = request.args.get('stream') == '1'
+    
+    translator, model_name = None, None
+    if target_lang != 'en':
+        # --- AI TRANSLATION LOGIC ---
+        log.debug("Translating custom quiz %s to '%s'", quiz_id, target_lang)
+        # If model for the target lang doesn't exist, the quiz is served in English
+        translator, model_name = get_translator(target_lang)
+
+    conn = db_connection()
+    if translator is None and not streaming:
+        return Response(quiz_store.quiz_payload(conn, quiz_id), mimetype='application/json')
+    original_questions = quiz_store.load_quiz(conn, quiz_id)
+
+    if streaming:
+        translating = translator is not None
+        first = original_questions[:1]
+        if translator is not None and first:
+            try:
+                first = translate_questions(translator, model_name, target_lang, first)
+            except TranslationUnavailable:
+                translator, first = None, quiz_store.as_payload(first)
+        else:
+            first = quiz_store.as_payload(first)
+        response = Response(stream_quiz(translator, model_name, target_lang, original_questions, first),
+                            mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+        # May switch to English part way through, so it can't be revalidated later
+        return response_cache.uncacheable(response) if translating else response
+
+    try:
+        return jsonify(translate_questions(translator, model_name, target_lang, original_questions))
+    except TranslationUnavailable:
+        # The translation service is down or slow: English it is, but only
+        # until it is back, so this answer mustn't be cached or revalidated
+        return response_cache.uncacheable(jsonify(quiz_store.as_payload(original_questions)))
 
 @app.route('/api/translate', methods=['POST'])
 def translate_text():
@@ -377,33 +591,105 @@ def translate_text():
     if not text_to_translate:
         return jsonify({"error": "No text provided"}), 400
 
-    if target_lang == 'fr':
-        translator = translator_en_fr
-    # elif target_lang == 'de':
-    #     translator = translator_en_de
-    else:
-        return jsonify({"error": f"Translation to '{target_lang}' not supported."}), 400
+    translator, model_name = get_translator(target_lang)
+    if translator is None:
+        return jsonify({"error": f"Translation to '{target_lang}' not supported.", "supported": supported_languages()}), 400
 
 
     texts = text_to_translate if isinstance(text_to_translate, list) else [text_to_translate]
     
-    translated = translator(texts)    
-    translated_texts = [item['translation_text'] for item in translated]
+    try:
+        translated_texts = translate_cached(bounded(translator), model_name, target_lang, texts)
+    except TranslationUnavailable:
+        return jsonify({"translated_texts": texts, "fallback": "en"})
     
     return jsonify({"translated_texts": translated_texts})
 
+@app.route('/api/translate/languages', methods=['GET'])
+def translation_languages():
+    """Lists the languages quizzes can be translated into."""
+    return jsonify({"languages": supported_languages()})
+
+@app.route('/api/translate/stats', methods=['GET'])
+def translation_stats():
+    """Reports translation cache hit/miss counters."""
+    stats = get_translation_stats()
+    stats["pretranslate_queue"] = pretranslate.queue_depth()
+    stats["models"] = loaded_models()
+    stats["pools"] = pools.get_stats()
+    stats["service"] = get_service_stats()
+    return jsonify(stats)
+
+
+# ============ LEADERBOARDS ============
+def leaderboard_response(key):
+    """Serves one leaderboard page, or 304 if the client's copy is current.
+
+    Query string: limit (default 10, at least 1, capped at 100), offset, user_id (adds "me").
+    """
+    try:
+        limit = min(int(request.args.get('limit', 10)), 100)
+        offset = int(request.args.get('offset', 0))
+        user_id = request.args.get('user_id', type=int)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers."}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({"error": "limit must be at least 1 and offset not negative."}), 400
+
+    conn = db_connection()
+    leaderboard.service.refresh(conn)
+    etag = leaderboard.service.etag(key, limit, offset, user_id)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    response = jsonify(leaderboard.service.query(conn, key, limit, offset, user_id))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_global_leaderboard():
+    return leaderboard_response(('global',))
+
+@app.route('/api/leaderboard/class/<int:class_id>', methods=['GET'])
+def get_class_leaderboard(class_id):
+    return leaderboard_response(('class', class_id))
+
+@app.route('/api/leaderboard/subject/<subject>', methods=['GET'])
+def get_subject_leaderboard(subject):
+    return leaderboard_response(('subject', subject))
+
+@app.route('/api/leaderboard/window/<window>', methods=['GET'])
+def get_window_leaderboard(window):
+    if window not in leaderboard.WINDOWS:
+        return jsonify({"error": f"window must be one of {', '.join(leaderboard.WINDOWS)}."}), 400
+    return leaderboard_response(('window', window))
+
 
 # ======== CLASS ENROLLMENT MANAGEMENT ========
 @app.route('/api/teacher/unassigned_students/<int:class_id>', methods=['GET'])
 def get_unassigned_students(class_id):
-    """Fetches all students who are NOT already in the specified class."""
-    conn = db_connection()
-    students = conn.execute("""
-        SELECT id, username FROM users
-        WHERE id NOT IN (SELECT user_id FROM enrollments WHERE class_id = ?)
-    """, (class_id,)).fetchall()
-    conn.close()
-    return jsonify([dict(s) for s in students])
+    """A page of the students who are NOT in the specified class, by id (see paging.py).
+
+    q filters to usernames starting with it.
+    """
+    limit, after, fields = paging.page_args(request.args, ('id', 'username'), ('id', 'username'), key_size=1)
+    # Anti-join: one enrollments primary-key probe per user, walking users by id from the cursor
+    sql = """
+        SELECT u.id, u.username FROM users u
+        LEFT JOIN enrollments e ON e.user_id = u.id AND e.class_id = ?
+        WHERE e.user_id IS NULL AND u.id > ?
+    """
+    params = [class_id, after[0] if after else 0]
+    if request.args.get('q'):
+        sql += " AND u.username LIKE ? ESCAPE '\\'"
+        params.append(request.args['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    sql += " ORDER BY u.id LIMIT ?"
+    rows = db_connection().execute(sql, params + [limit + 1])
+    return Response(paging.stream_page(rows, limit, fields, lambda row: [row['id']]),
+                    mimetype='application/json')
 
 @app.route('/api/teacher/enroll', methods=['POST'])
 def enroll_student_api():
@@ -415,12 +701,87 @@ def enroll_student_api():
     conn = db_connection()
     try:
         conn.execute("INSERT INTO enrollments (user_id, class_id) VALUES (?, ?)", (user_id, class_id))
+        events.publish(conn, 'enrollment', [f"class:{class_id}", f"user:{user_id}"], {"user_id": user_id, "class_id": class_id})
+        response_cache.bump(conn, f"user:{user_id}", f"class:{class_id}")
         conn.commit()
         return jsonify({"success": True, "message": "Student enrolled successfully."})
     except sqlite3.IntegrityError:
+        conn.rollback()
         return jsonify({"success": False, "message": "Student is already in this class."}), 409
-    finally:
-        conn.close()
+
+
+# ======== LIVE EVENTS (SERVER-SENT EVENTS) ========
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Streams live events for a student (user_id) and/or classes (class_id).
+
+    Students get badge awards and enrollments; teachers get per-student
+    average changes to apply to the chart. Browsers reconnect on their own
+    and send Last-Event-ID, and anything missed in between is replayed.
+    Needs an async worker (gevent, the default in gunicorn.conf.py) so idle
+    streams don't each hold a worker.
+    """
+    try:
+        channels = [f"user:{int(u)}" for u in request.args.getlist('user_id')]
+        channels += [f"class:{int(c)}" for value in request.args.getlist('class_id') for c in value.split(',') if c]
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        return jsonify({"error": "user_id, class_id and Last-Event-ID must be integers."}), 400
+    if not channels:
+        return jsonify({"error": "At least one user_id or class_id is required."}), 400
+
+    # Subscribe before reading the backlog so nothing committed in between is lost
+    subscription = events.subscribe(channels)
+    backlog = events.replay(db_connection(), channels, last_event_id) if last_event_id else []
+    return Response(events.stream(subscription, backlog), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let a proxy buffer the stream
+    })
+
+# ======== BULK IMPORT / EXPORT ========
+def after_bulk_import(kind, values):
+    """Runs after each committed import chunk."""
+    if kind == 'questions':
+        for quiz_id in dict.fromkeys(question[0] for question in values):
+            pretranslate.enqueue_quiz(quiz_id)
+
+@app.route('/api/bulk/<kind>/import', methods=['POST'])
+def bulk_import(kind):
+    """Imports a CSV or JSONL request body (see bulk.py). Reports errors per line.
+
+    The format comes from ?format=csv|jsonl or the Content-Type.
+    """
+    if kind not in bulk.KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(bulk.KINDS)}."}), 404
+    try:
+        fmt = bulk.detect_format(request.args.get('format'), request.content_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Read as a stream, so a large upload is never held in memory whole
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = bulk.import_rows(db_connection(), kind, bulk.read_rows(stream, fmt), on_chunk=after_bulk_import)
+    return jsonify(report)
+
+@app.route('/api/bulk/<kind>/export', methods=['GET'])
+def bulk_export(kind):
+    """Streams a table as CSV or JSONL (?format=, default jsonl), with optional filters."""
+    if kind not in bulk.KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(bulk.KINDS)}."}), 404
+    try:
+        fmt = bulk.detect_format(request.args.get('format', 'jsonl'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = {name: request.args.get(name) for name in bulk.EXPORTS[kind][2]}
+    try:
+        filters.update({name: int(value) for name, value in filters.items() if value and name.endswith('_id')})
+    except ValueError:
+        return jsonify({"error": "quiz_id, class_id and user_id must be integers."}), 400
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(bulk.export_rows(db_connection(), kind, fmt, filters), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{kind}.{fmt}"',
+    })
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8000))
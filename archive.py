@@ -0,0 +1,399 @@
+"""Columnar archive of old scores, and analytics over archive plus live rows.
+
+The scores table only grows. archive_scores() moves rows older than a
+cutoff out of it into Parquet files, partitioned by month and class:
+
+    score_archive/month=2024-03/class=7/<first id>-<last id>.parquet
+
+Each run works in chunks of CHUNK_ROWS scores. A chunk's files are written
+first. Then one transaction deletes its rows from scores and records the
+chunk in score_archive, so a row is always in exactly one of the two:
+files of a chunk that never committed are ignored and removed by the next
+run. The same transaction records which files hold each student's scores
+(score_archive_users), so a student's history opens only those. A student
+in several classes is stored under each of them, with one copy flagged
+`primary`; readers that aren't scoped to a class read only the primary
+copies.
+
+What stays correct without the archived rows: score_rollups (and with them
+summaries, all-time leaderboards and badge totals) keep counting them, and
+rollups.rebuild() folds the archive back in. Windowed leaderboards read at
+most the current month, which is why the cutoff can't be later than
+MIN_KEEP_DAYS ago. Streak badges only see live scores.
+
+The read side, for reports that span years:
+
+    read(conn, ...)                 archived rows as a pandas DataFrame, with
+                                    partition pruning and pushed-down filters
+    history(conn, user_id, ...)     a student's older scores, after the live ones
+    class_averages(conn, ...)       per (student, subject) over a date range
+    class_report(conn, class_id)    per month or year and subject, e.g. year
+                                    over year
+
+The merged queries aggregate the live rows in SQLite and the archived ones
+with pandas, then combine the sums and counts. Class membership of archived
+scores is the one at the time they were archived.
+
+    python archive.py [--before YYYY-MM-DD]     (default: KEEP_DAYS ago)
+    python archive.py report <class_id> [--by year]
+
+Needs pyarrow. On hosts with an ephemeral filesystem (Heroku), point
+SCORE_ARCHIVE_DIR at persistent storage.
+"""
+import fcntl
+import os
+from datetime import datetime, timedelta, timezone
+
+import logs
+
+ARCHIVE_DIR = os.environ.get('SCORE_ARCHIVE_DIR', 'score_archive')
+KEEP_DAYS = int(os.environ.get('SCORE_ARCHIVE_KEEP_DAYS', 180))
+MIN_KEEP_DAYS = 62
+CHUNK_ROWS = int(os.environ.get('SCORE_ARCHIVE_CHUNK', 100_000))
+ROW_GROUP_ROWS = 65_536
+
+COLUMNS = ('id', 'user_id', 'subject', 'score', 'timestamp', 'submission_id')
+
+log = logs.get_logger('scores')
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('id', pa.int64()), ('user_id', pa.int64()), ('subject', pa.string()), ('score', pa.int64()),
+        ('timestamp', pa.string()), ('submission_id', pa.string()), ('primary', pa.bool_()),
+    ])
+
+
+def _day_after(date):
+    return (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+# --- Moving scores into the archive ---
+def _class_rows(conn, rows):
+    """rows as a DataFrame with one copy per class of the student (class 0 if none)."""
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    frame['user_id'] = frame['user_id'].astype('Int64')
+    user_ids = frame['user_id'].dropna().unique().tolist()
+    enrolled = []
+    for start in range(0, len(user_ids), 500):
+        batch = user_ids[start:start + 500]
+        enrolled += conn.execute(
+            f"SELECT DISTINCT user_id, class_id FROM enrollments WHERE user_id IN ({','.join('?' * len(batch))})",
+            batch).fetchall()
+    classes = pd.DataFrame.from_records(enrolled, columns=['user_id', 'class_id'])
+    classes['user_id'] = classes['user_id'].astype('Int64')
+    frame = frame.merge(classes, on='user_id', how='left')
+    frame['class_id'] = frame['class_id'].fillna(0).astype('int64')
+    frame['primary'] = frame['class_id'] == frame.groupby('id')['class_id'].transform('min')
+    frame['month'] = frame['timestamp'].str[:7]
+    return frame
+
+
+def _write_chunk(frame, chunk):
+    """Writes one file per (month, class) of the chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema()
+    for (month, class_id), part in frame.groupby(['month', 'class_id']):
+        directory = os.path.join(ARCHIVE_DIR, f"month={month}", f"class={class_id}")
+        os.makedirs(directory, exist_ok=True)
+        # Sorted by student, so row-group statistics let a history read skip most of the file
+        part = part.sort_values(['user_id', 'timestamp'])
+        table = pa.Table.from_pandas(part[list(schema.names)], schema=schema, preserve_index=False)
+        path = os.path.join(directory, f"{chunk}.parquet")
+        pq.write_table(table, path + '.tmp', compression='zstd', row_group_size=ROW_GROUP_ROWS)
+        os.replace(path + '.tmp', path)
+
+
+def _committed(conn):
+    return {chunk for (chunk,) in conn.execute("SELECT chunk FROM score_archive")}
+
+
+def _remove_uncommitted(conn):
+    """Removes the files of chunks an interrupted run wrote but never committed."""
+    committed = _committed(conn)
+    for directory, _, names in os.walk(ARCHIVE_DIR):
+        for name in names:
+            if name.endswith('.tmp') or (name.endswith('.parquet') and name[:-len('.parquet')] not in committed):
+                os.remove(os.path.join(directory, name))
+
+
+def archive_scores(conn, before):
+    """Moves scores with timestamp < before ('YYYY-MM-DD') into the archive. Returns the count."""
+    latest = (datetime.now(timezone.utc) - timedelta(days=MIN_KEEP_DAYS)).strftime('%Y-%m-%d')
+    if before > latest:
+        raise ValueError(f"the cutoff can't be later than {latest} (leaderboard windows read the live table)")
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, '.lock'), 'w') as lock:
+        # One run at a time; the web workers only ever read
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _remove_uncommitted(conn)
+        moved, last_id = 0, 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, user_id, subject, score, timestamp, submission_id FROM scores "
+                "WHERE timestamp < ? AND id > ? ORDER BY id LIMIT ?",
+                (before, last_id, CHUNK_ROWS)).fetchall()
+            if not rows:
+                return moved
+            first_id, last_id = rows[0][0], rows[-1][0]
+            chunk = f"{first_id}-{last_id}"
+            frame = _class_rows(conn, rows)
+            _write_chunk(frame, chunk)
+            primary = frame[frame['primary'] & frame['user_id'].notna()]
+            index = primary[['user_id', 'month', 'class_id']].drop_duplicates()
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = conn.execute("DELETE FROM scores WHERE id BETWEEN ? AND ? AND timestamp < ?",
+                                       (first_id, last_id, before)).rowcount
+                if deleted != len(rows):
+                    raise RuntimeError(f"scores {chunk} changed while being archived")
+                conn.execute(
+                    "INSERT INTO score_archive (chunk, first_id, last_id, rows, min_timestamp, max_timestamp, indexed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 1)",
+                    (chunk, first_id, last_id, len(rows), min(r[4] for r in rows), max(r[4] for r in rows)))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO score_archive_users (user_id, month, class_id, chunk) VALUES (?, ?, ?, ?)",
+                    [(int(r.user_id), r.month, int(r.class_id), chunk) for r in index.itertuples()])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            moved += len(rows)
+            log.info("Archived scores %s (%d rows)", chunk, len(rows))
+
+
+# --- Reading it back ---
+def overlaps(conn, start=None, end=None):
+    """Whether any archived score can fall in [start, end] (dates, inclusive)."""
+    row = conn.execute(
+        "SELECT 1 FROM score_archive WHERE max_timestamp >= ? AND min_timestamp < ? LIMIT 1",
+        (start or '', _day_after(end) if end else '9999-12-31')).fetchone()
+    return row is not None
+
+
+def _partition_files(class_ids=None, start=None, end=None):
+    """(path, class_id) of the files in the partitions that can hold [start, end]."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    for month_dir in sorted(os.listdir(ARCHIVE_DIR)):
+        month = month_dir.partition('=')[2]
+        if not month or (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        for class_dir in os.listdir(os.path.join(ARCHIVE_DIR, month_dir)):
+            class_id = int(class_dir.partition('=')[2])
+            if class_ids is not None and class_id not in class_ids:
+                continue
+            directory = os.path.join(ARCHIVE_DIR, month_dir, class_dir)
+            for name in os.listdir(directory):
+                if name.endswith('.parquet'):
+                    yield os.path.join(directory, name), class_id
+
+
+def _filters(class_ids, start, end, equal):
+    filters = [(name, '=', value) for name, value in equal.items() if value is not None]
+    if class_ids is None:
+        filters.append(('primary', '=', True))
+    if start:
+        filters.append(('timestamp', '>=', start))
+    if end:
+        filters.append(('timestamp', '<', _day_after(end)))
+    return filters or None
+
+
+def _scan(files, columns, filters):
+    """One Arrow table per (path, class_id) in files, plus a class_id column."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for path, class_id in files:
+        table = pq.read_table(path, columns=list(columns), filters=filters)
+        yield table.append_column('class_id', pa.array([class_id] * table.num_rows, pa.int64()))
+
+
+def _read_files(conn, columns, class_ids, start, end, equal):
+    """One Arrow table per committed archive file that can match, plus a class_id column."""
+    committed = _committed(conn)
+    files = [(path, class_id) for path, class_id in _partition_files(class_ids, start, end)
+             if os.path.basename(path)[:-len('.parquet')] in committed]
+    if files:
+        yield from _scan(files, columns, _filters(class_ids, start, end, equal))
+
+
+def _user_files(conn, user_id, since=None, until=None):
+    """(path, class_id) of the files holding a student's archived scores between two dates."""
+    rows = conn.execute(
+        "SELECT month, class_id, chunk FROM score_archive_users WHERE user_id = ? AND month BETWEEN ? AND ?",
+        (user_id, since[:7] if since else '', until[:7] if until else '9999-12')).fetchall()
+    files = [(os.path.join(ARCHIVE_DIR, f"month={month}", f"class={class_id}", f"{chunk}.parquet"), class_id)
+             for month, class_id, chunk in rows]
+    # Chunks archived before the index existed: any of their files may hold the student's scores
+    unindexed = {chunk for (chunk,) in conn.execute("SELECT chunk FROM score_archive WHERE indexed = 0")}
+    if unindexed:
+        files += [(path, class_id) for path, class_id in _partition_files(None, since, until)
+                  if os.path.basename(path)[:-len('.parquet')] in unindexed]
+    return files
+
+
+def read(conn, columns=COLUMNS, class_ids=None, start=None, end=None, **equal):
+    """Archived scores as a DataFrame, plus a class_id column.
+
+    class_ids picks class partitions; without it only primary copies are
+    read, so each score appears once. start/end are dates, both inclusive;
+    equal filters columns by value, e.g. user_id=7 (None is ignored).
+    """
+    import pandas as pd
+
+    tables = list(_read_files(conn, columns, class_ids, start, end, equal))
+    if not tables:
+        return pd.DataFrame({name: pd.Series(dtype=object) for name in tuple(columns) + ('class_id',)})
+    import pyarrow as pa
+    return pa.concat_tables(tables).to_pandas()
+
+
+def rollup_rows(conn):
+    """(user_id, subject, count, sum, min, max, last timestamp) over every archived score."""
+    import pandas as pd
+
+    aggregate = dict(count=('score', 'size'), total=('score', 'sum'), low=('score', 'min'),
+                     high=('score', 'max'), last=('timestamp', 'max'))
+    # Aggregated file by file, so memory follows the number of students, not of scores
+    parts = [table.to_pandas().groupby(['user_id', 'subject'], as_index=False).agg(**aggregate)
+             for table in _read_files(conn, ('user_id', 'subject', 'score', 'timestamp'), None, None, None, {})]
+    if not parts:
+        return []
+    merged = pd.concat(parts).groupby(['user_id', 'subject'], as_index=False).agg(
+        count=('count', 'sum'), total=('total', 'sum'), low=('low', 'min'), high=('high', 'max'), last=('last', 'max'))
+    return [(int(r.user_id), r.subject, int(r.count), int(r.total), int(r.low), int(r.high), r.last)
+            for r in merged.itertuples()]
+
+
+def history(conn, user_id, limit, after=None, subject=None, since=None, until=None):
+    """Up to limit archived scores of a student, newest first, after the (timestamp, id) key.
+
+    Opens only the files the student has scores in: one indexed lookup for
+    a student with nothing archived.
+    """
+    files = _user_files(conn, user_id, since, until)
+    if not files:
+        return []
+    import pyarrow as pa
+
+    filters = _filters(None, since, until, {"user_id": user_id, "subject": subject or None})
+    frame = pa.concat_tables(list(_scan(files, ('id', 'subject', 'score', 'timestamp'), filters))).to_pandas()
+    if after:
+        frame = frame[(frame['timestamp'] < after[0]) | ((frame['timestamp'] == after[0]) & (frame['id'] < after[1]))]
+    frame = frame.sort_values(['timestamp', 'id'], ascending=False).head(limit)
+    return frame.drop(columns='class_id').to_dict('records')
+
+
+def _usernames(conn, user_ids):
+    names = {}
+    user_ids = [int(u) for u in user_ids]
+    for start in range(0, len(user_ids), 500):
+        batch = user_ids[start:start + 500]
+        names.update(conn.execute(
+            f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall())
+    return names
+
+
+def class_averages(conn, class_ids, start=None, end=None):
+    """Average score per (student, subject) over archived and live scores in a date range.
+
+    Same rows as app.query_class_averages: username, subject, average_score.
+    """
+    import pandas as pd
+
+    placeholders = ",".join("?" * len(class_ids))
+    sql = f"""
+        SELECT user_id, subject, SUM(score) AS total, COUNT(*) AS count
+        FROM scores
+        WHERE user_id IN (SELECT user_id FROM enrollments WHERE class_id IN ({placeholders}))
+    """
+    params = list(class_ids)
+    if start:
+        sql += " AND timestamp >= ?"
+        params.append(start)
+    if end:
+        sql += " AND timestamp < date(?, '+1 day')"
+        params.append(end)
+    live = pd.DataFrame.from_records(conn.execute(sql + " GROUP BY user_id, subject", params).fetchall(),
+                                     columns=['user_id', 'subject', 'total', 'count'])
+
+    archived = read(conn, ('id', 'user_id', 'subject', 'score'), class_ids=set(class_ids), start=start, end=end)
+    # A student in two of the classes has a copy of each score under both
+    archived = archived.drop_duplicates('id').groupby(['user_id', 'subject'], as_index=False).agg(
+        total=('score', 'sum'), count=('score', 'size'))
+
+    merged = pd.concat([live, archived]).groupby(['user_id', 'subject'], as_index=False)[['total', 'count']].sum()
+    if merged.empty:
+        return []
+    merged['username'] = merged['user_id'].map(_usernames(conn, merged['user_id'].unique()))
+    merged['average_score'] = merged['total'] / merged['count']
+    merged = merged.dropna(subset=['username']).sort_values(['username', 'subject'])
+    return merged[['username', 'subject', 'average_score']].to_dict('records')
+
+
+def class_report(conn, class_id, by='month', start=None, end=None):
+    """Quizzes and average score per period ('month' or 'year') and subject for a class."""
+    import pandas as pd
+
+    width = 7 if by == 'month' else 4
+    sql = """
+        SELECT substr(timestamp, 1, ?) AS period, subject, SUM(score) AS total, COUNT(*) AS count
+        FROM scores
+        WHERE user_id IN (SELECT user_id FROM enrollments WHERE class_id = ?)
+    """
+    params = [width, class_id]
+    if start:
+        sql += " AND timestamp >= ?"
+        params.append(start)
+    if end:
+        sql += " AND timestamp < date(?, '+1 day')"
+        params.append(end)
+    live = pd.DataFrame.from_records(conn.execute(sql + " GROUP BY period, subject", params).fetchall(),
+                                     columns=['period', 'subject', 'total', 'count'])
+
+    archived = read(conn, ('subject', 'score', 'timestamp'), class_ids={class_id}, start=start, end=end)
+    archived['period'] = archived['timestamp'].str[:width]
+    archived = archived.groupby(['period', 'subject'], as_index=False).agg(
+        total=('score', 'sum'), count=('score', 'size'))
+
+    merged = pd.concat([live, archived]).groupby(['period', 'subject'], as_index=False)[['total', 'count']].sum()
+    merged['average_score'] = merged['total'] / merged['count']
+    merged = merged.sort_values(['period', 'subject'])
+    return [{"period": row.period, "subject": row.subject, "quizzes": int(row.count),
+             "average_score": float(row.average_score)} for row in merged.itertuples()]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import db
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Move old scores into the Parquet archive, or report on a class.")
+    parser.add_argument('command', nargs='?', default='archive', choices=('archive', 'report'))
+    parser.add_argument('class_id', nargs='?', type=int)
+    parser.add_argument('--before', help="archive scores before this date (YYYY-MM-DD)")
+    parser.add_argument('--by', default='year', choices=('month', 'year'))
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    migrations.migrate(conn)
+    if args.command == 'report':
+        if args.class_id is None:
+            parser.error("report needs a class_id")
+        print(f"{'period':<8} {'subject':<20} {'quizzes':>8} {'average':>8}")
+        for row in class_report(conn, args.class_id, by=args.by):
+            print(f"{row['period']:<8} {row['subject']:<20} {row['quizzes']:>8} {row['average_score']:>8.2f}")
+    else:
+        before = args.before or (datetime.now(timezone.utc) - timedelta(days=KEEP_DAYS)).strftime('%Y-%m-%d')
+        print(f"--- Archiving scores before {before} from {db.DB_PATH} into {ARCHIVE_DIR} ---")
+        print(f"Archived {archive_scores(conn, before)} scores.")
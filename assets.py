@@ -0,0 +1,213 @@
+"""Fingerprinted, precompressed static assets for the student and teacher pages.
+
+build() writes, for each of ASSETS, into static/dist/:
+
+    script.<hash>.js        minified (with rjsmin / rcssmin when installed)
+    script.<hash>.js.gz     gzip -9
+    script.<hash>.js.br     brotli, when the Brotli package is installed
+
+plus index.html and teacher.html with their asset references rewritten to
+/assets/<built name>, compressed the same way, and manifest.json.
+
+A built asset's name changes whenever its content does, so /assets/ serves
+it with a one-year immutable Cache-Control and returning browsers don't
+even revalidate. The pages keep their names and are revalidated on each
+visit (a 304 when unchanged); that is how new asset names reach browsers.
+Compression happens once here, never per request, and the response is the
+file as is. The .gz/.br siblings are also the layout nginx's
+gzip_static/brotli_static expect, if a proxy is put in front.
+
+The build runs once per deploy, never in the workers: gunicorn.conf.py
+calls prebuild() in the master before it forks, and `python assets.py` does
+the same at deploy time. Workers only read the manifest in load(). Outside
+gunicorn (e.g. `python app.py`), load() rebuilds when the sources changed
+since the last build. ASSETS_BUILD_ON_START=0 turns all of that off; the
+source files are then served as before until `python assets.py` is run.
+
+A built file that has gone missing (a half-finished deploy, dist/ cleaned
+by hand) is answered from its unhashed source, revalidated on every visit,
+rather than with an error.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_file
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+BUILD_ON_START = os.environ.get('ASSETS_BUILD_ON_START', '1') != '0'
+
+ASSETS = ('script.js', 'teacher.js', 'style.css')
+PAGES = ('index.html', 'teacher.html')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_manifest = None
+
+
+def _minify(name, text):
+    try:
+        if name.endswith('.js'):
+            from rjsmin import jsmin
+            return jsmin(text)
+        if name.endswith('.css'):
+            from rcssmin import cssmin
+            return cssmin(text)
+    except ImportError:
+        pass
+    return text
+
+
+def _write(path, data):
+    # Written under a temporary name and renamed, so a worker never serves half a file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write_encodings(path, data):
+    """Writes path, path.gz and (if Brotli is installed) path.br. Returns the file names."""
+    _write(path, data)
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    names = [os.path.basename(path), os.path.basename(path) + '.gz']
+    try:
+        import brotli
+    except ImportError:
+        return names
+    _write(path + '.br', brotli.compress(data, quality=11))
+    return names + [os.path.basename(path) + '.br']
+
+
+def _read_sources():
+    sources = {}
+    for name in ASSETS + PAGES:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            sources[name] = f.read()
+    return sources
+
+
+def _source_digest(sources):
+    digest = hashlib.sha256()
+    for name in sorted(sources):
+        digest.update(name.encode('utf-8') + b'\0' + sources[name])
+    return digest.hexdigest()
+
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build():
+    """Builds static/dist from the sources. Returns the manifest."""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    sources = _read_sources()
+    previous = _read_manifest() or {}
+
+    assets, files = {}, []
+    for name in ASSETS:
+        data = _minify(name, sources[name].decode('utf-8')).encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        built = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        files += _write_encodings(os.path.join(DIST_DIR, built), data)
+        assets[name] = built
+
+    reference = re.compile(r'\b(src|href)="(' + "|".join(re.escape(name) for name in ASSETS) + r')"')
+    for name in PAGES:
+        page = reference.sub(lambda m: f'{m.group(1)}="/assets/{assets[m.group(2)]}"', sources[name].decode('utf-8'))
+        files += _write_encodings(os.path.join(DIST_DIR, name), page.encode('utf-8'))
+
+    manifest = {"source": _source_digest(sources), "assets": assets, "files": files}
+    _write(MANIFEST_PATH, json.dumps(manifest, indent=2).encode('utf-8'))
+
+    # Keep the previous build's files too: pages already in browsers still reference them
+    keep = set(files) | set(previous.get("files", ())) | {'manifest.json'}
+    for name in os.listdir(DIST_DIR):
+        if name not in keep and not name.endswith('.tmp'):
+            os.remove(os.path.join(DIST_DIR, name))
+    return manifest
+
+
+def prebuild():
+    """Rebuilds if the sources changed, then leaves load() to only read the manifest.
+
+    For the gunicorn master: the workers it forks inherit the flag, so they
+    don't each rebuild (and race each other cleaning up dist/).
+    """
+    global BUILD_ON_START
+    load()
+    BUILD_ON_START = False
+
+
+def load():
+    """Reads the manifest, rebuilding first if the sources changed. None without a build."""
+    global _manifest
+    manifest = _read_manifest()
+    if BUILD_ON_START:
+        try:
+            if manifest is None or manifest.get("source") != _source_digest(_read_sources()):
+                manifest = build()
+        except OSError:
+            # e.g. a read-only deploy: serve whatever build there is, or the sources
+            pass
+    _manifest = manifest
+    return manifest
+
+
+def _send(name, cache_control):
+    """Sends static/dist/<name> in the best encoding the client accepts."""
+    path = os.path.join(DIST_DIR, name)
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.exists(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def send_asset(name):
+    """Serves a built asset, cached by browsers for good."""
+    sources = {built: source for source, built in _manifest["assets"].items()} if _manifest else {}
+    if name not in sources:
+        abort(404)
+    try:
+        return _send(name, IMMUTABLE)
+    except FileNotFoundError:
+        # The source may differ from what the name promises, so it mustn't be kept for good
+        response = send_file(os.path.join(STATIC_DIR, sources[name]), conditional=True, etag=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+def send_page(name, fallback):
+    """Serves a built page, revalidated on every visit; fallback() without a build."""
+    if _manifest is None:
+        return fallback()
+    try:
+        return _send(name, 'no-cache')
+    except FileNotFoundError:
+        return fallback()
+
+
+if __name__ == '__main__':
+    manifest = build()
+    print(f"--- Built {len(manifest['assets'])} assets into {DIST_DIR} ---")
+    for name, built in manifest["assets"].items():
+        sizes = [os.path.getsize(os.path.join(DIST_DIR, built + suffix))
+                 for suffix in ('', '.gz', '.br') if os.path.exists(os.path.join(DIST_DIR, built + suffix))]
+        original = os.path.getsize(os.path.join(STATIC_DIR, name))
+        print(f"{name:<12} -> {built:<28} {original:>7} B source, " + " / ".join(f"{s} B" for s in sizes))
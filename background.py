@@ -0,0 +1,37 @@
+"""Daemon threads started on first use, once per process.
+
+Threads don't survive fork(), and with preload_app a gunicorn worker
+inherits modules the master has already used, so the background threads
+(events poller, score writer, pre-translation, translation batchers) are
+started by the first caller in each process rather than at import, and
+started again if one has died.
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+_threads = {}  # target -> (pid, Thread)
+
+
+def start_worker_thread(name, target):
+    """Runs target() on a daemon thread named name, unless this process already does.
+
+    Returns the running thread.
+    """
+    with _lock:
+        pid, thread = _threads.get(target, (None, None))
+        if thread is None or pid != os.getpid() or not thread.is_alive():
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            _threads[target] = (os.getpid(), thread)
+        return thread
+
+
+def stop_worker_thread(target):
+    """Forgets target's thread, which the caller has told to exit.
+
+    The next start_worker_thread(target) starts a new one even if the old
+    one is still finishing.
+    """
+    with _lock:
+        _threads.pop(target, None)
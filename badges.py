@@ -0,0 +1,253 @@
+"""Rule-driven badge engine.
+
+Badge rules live in badge_rules.json. Each rule names a badge (created in
+the badges table if missing) and one condition:
+
+    score       best score >= min_score            (optional "subject")
+    quiz_count  quizzes completed >= min_quizzes   (optional "subject")
+    average     average score >= min_average,
+                after at least min_quizzes quizzes (optional "subject")
+    streak      the last `length` quizzes, in any subject,
+                all scored >= min_score
+
+Rules are compiled once into predicates over a user's stats. Stats come from
+score_rollups (plus recent scores when a streak rule exists), read in a
+single query, so adding badges adds no per-save queries.
+
+To award newly defined badges to everyone who already qualifies:
+
+    python badges.py --backfill
+"""
+import json
+import os
+import sqlite3
+from itertools import groupby
+from operator import itemgetter
+
+import response_cache
+
+RULES_PATH = os.environ.get('BADGE_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'badge_rules.json'))
+BACKFILL_CHUNK = 1000
+
+
+def _subject_stats(stats, subject):
+    if subject is None:
+        return stats["total"]
+    return stats["subjects"].get(subject)
+
+
+def _compile_rule(rule):
+    kind = rule["type"]
+    subject = rule.get("subject")
+
+    if kind == "score":
+        min_score = rule["min_score"]
+
+        def check(stats):
+            s = _subject_stats(stats, subject)
+            return s is not None and s["max"] >= min_score
+    elif kind == "quiz_count":
+        min_quizzes = rule["min_quizzes"]
+
+        def check(stats):
+            s = _subject_stats(stats, subject)
+            return s is not None and s["count"] >= min_quizzes
+    elif kind == "average":
+        min_average = rule["min_average"]
+        min_quizzes = rule.get("min_quizzes", 1)
+
+        def check(stats):
+            s = _subject_stats(stats, subject)
+            return s is not None and s["count"] >= min_quizzes and s["sum"] / s["count"] >= min_average
+    elif kind == "streak":
+        if subject is not None:
+            raise ValueError(f"Badge '{rule['badge']}': streak rules apply across all subjects")
+        length = rule["length"]
+        min_score = rule["min_score"]
+
+        def check(stats):
+            return stats["streaks"].get((length, min_score), 0) >= length
+    else:
+        raise ValueError(f"Badge '{rule['badge']}': unknown rule type '{kind}'")
+    return check
+
+
+def _empty_stats():
+    return {"subjects": {}, "total": None, "streaks": {}}
+
+
+def _add_rollup(stats, count, total, low, high):
+    # Folds one subject's rollup into the all-subjects total
+    t = stats["total"]
+    if t is None:
+        stats["total"] = {"count": count, "sum": total, "min": low, "max": high}
+    else:
+        t["count"] += count
+        t["sum"] += total
+        t["min"] = min(t["min"], low)
+        t["max"] = max(t["max"], high)
+
+
+class BadgeEngine:
+    """Compiled badge rules, evaluated against per-user stats."""
+
+    def __init__(self, conn, rules):
+        self.rules = []  # (badge_id, badge_name, predicate)
+        self.details = {}  # badge_name -> {"name", "description", "icon"}
+        self.streaks = sorted({(r["length"], r["min_score"]) for r in rules if r["type"] == "streak"})
+        self.recent_window = max((length for length, _ in self.streaks), default=0)
+
+        for rule in rules:
+            conn.execute(
+                "INSERT OR IGNORE INTO badges (name, description, icon) VALUES (?, ?, ?)",
+                (rule["badge"], rule.get("description"), rule.get("icon"))
+            )
+            badge_id = conn.execute("SELECT id FROM badges WHERE name = ?", (rule["badge"],)).fetchone()[0]
+            self.rules.append((badge_id, rule["badge"], _compile_rule(rule)))
+            self.details[rule["badge"]] = {"name": rule["badge"], "description": rule.get("description"), "icon": rule.get("icon")}
+        conn.commit()
+
+        # One read returns the user's rollups, earned badges and (only if a
+        # streak rule needs them) their most recent scores.
+        self.stats_sql = """
+            SELECT 'rollup', subject, quiz_count, score_sum, min_score, max_score
+            FROM score_rollups WHERE user_id = :user_id
+            UNION ALL
+            SELECT 'earned', NULL, badge_id, NULL, NULL, NULL
+            FROM user_badges WHERE user_id = :user_id
+        """
+        if self.recent_window:
+            self.stats_sql += """
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'recent', NULL, score, NULL, NULL, NULL
+                FROM scores WHERE user_id = :user_id
+                ORDER BY timestamp DESC LIMIT :window
+            )
+            """
+
+    def _read_stats(self, conn, user_id):
+        stats = _empty_stats()
+        earned = set()
+        recent = []
+        for kind, subject, a, b, c, d in conn.execute(self.stats_sql, {"user_id": user_id, "window": self.recent_window}):
+            if kind == 'rollup':
+                stats["subjects"][subject] = {"count": a, "sum": b, "min": c, "max": d}
+                _add_rollup(stats, a, b, c, d)
+            elif kind == 'earned':
+                earned.add(a)
+            else:
+                recent.append(a)
+        # Current streak: leading run of qualifying scores, newest first
+        for length, min_score in self.streaks:
+            run = 0
+            for score in recent:
+                if score < min_score:
+                    break
+                run += 1
+            stats["streaks"][(length, min_score)] = run
+        return stats, earned
+
+    def evaluate(self, stats, earned=()):
+        """Returns [(badge_id, badge_name)] of rules met and not yet earned."""
+        return [(badge_id, name) for badge_id, name, check in self.rules if badge_id not in earned and check(stats)]
+
+    def award(self, conn, user_id):
+        """Awards every newly met badge to a user. Returns their names. Does not commit."""
+        stats, earned = self._read_stats(conn, user_id)
+        new_badges = self.evaluate(stats, earned)
+        if new_badges:
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_badges (user_id, badge_id) VALUES (?, ?)",
+                [(user_id, badge_id) for badge_id, _ in new_badges]
+            )
+        return [name for _, name in new_badges]
+
+    def backfill(self, conn):
+        """Awards badges to the whole user base in one streaming pass.
+
+        Rollups (and, for streak rules, scores) are streamed in user order
+        and merged, so memory stays flat however many users there are. For
+        streak rules the best streak in a user's history counts. Awards are
+        written in chunks. Returns the number of badges awarded.
+        """
+        read = sqlite3.connect(f"file:{_db_path(conn)}?mode=ro", uri=True)
+        rollup_rows = read.execute("""
+            SELECT user_id, subject, quiz_count, score_sum, min_score, max_score
+            FROM score_rollups ORDER BY user_id
+        """)
+        score_groups = None
+        if self.streaks:
+            score_rows = read.execute("SELECT user_id, score FROM scores ORDER BY user_id, timestamp")
+            score_groups = groupby(score_rows, key=itemgetter(0))
+        next_scores = next(score_groups, None) if score_groups else None
+
+        changes_before = conn.total_changes
+        pending = []
+        for user_id, rows in groupby(rollup_rows, key=itemgetter(0)):
+            stats = _empty_stats()
+            for _, subject, count, total, low, high in rows:
+                stats["subjects"][subject] = {"count": count, "sum": total, "min": low, "max": high}
+                _add_rollup(stats, count, total, low, high)
+
+            while next_scores is not None and next_scores[0] < user_id:
+                next_scores = next(score_groups, None)
+            if next_scores is not None and next_scores[0] == user_id:
+                stats["streaks"] = self._best_streaks(score for _, score in next_scores[1])
+                next_scores = next(score_groups, None)
+
+            pending.extend((user_id, badge_id) for badge_id, _ in self.evaluate(stats))
+            if len(pending) >= BACKFILL_CHUNK:
+                self._write_awards(conn, pending)
+                pending = []
+
+        if pending:
+            self._write_awards(conn, pending)
+        read.close()
+        return conn.total_changes - changes_before
+
+    def _write_awards(self, conn, pending):
+        changes_before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO user_badges (user_id, badge_id) VALUES (?, ?)", pending)
+        if conn.total_changes != changes_before:
+            response_cache.bump(conn, *{f"user:{user_id}" for user_id, _ in pending})
+        conn.commit()
+
+    def _best_streaks(self, scores):
+        """Longest run of qualifying scores per streak rule, oldest to newest."""
+        best = {key: 0 for key in self.streaks}
+        runs = dict(best)
+        for score in scores:
+            for key in self.streaks:
+                runs[key] = runs[key] + 1 if score >= key[1] else 0
+                best[key] = max(best[key], runs[key])
+        return best
+
+
+def _db_path(conn):
+    return conn.execute("PRAGMA database_list").fetchall()[0][2]
+
+
+def load_rules(path=RULES_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_engine(conn, path=RULES_PATH):
+    """Reads and compiles the badge rules. Call once at startup."""
+    return BadgeEngine(conn, load_rules(path))
+
+
+if __name__ == '__main__':
+    import sys
+    import db
+    import migrations
+
+    if '--backfill' not in sys.argv:
+        print("Usage: python badges.py --backfill")
+        sys.exit(1)
+    conn = db.get_connection()
+    migrations.migrate(conn)
+    engine = load_engine(conn)
+    print(f"--- Backfilling {len(engine.rules)} badge rules in {db.DB_PATH} ---")
+    print(f"Awarded {engine.backfill(conn)} badges.")
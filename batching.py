@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from background import start_worker_thread, stop_worker_thread
+from pools import run_blocking
+
+BATCH_WINDOW_MS = float(os.environ.get('TRANSLATION_BATCH_WINDOW_MS', 15))
+BATCH_MAX_SENTENCES = int(os.environ.get('TRANSLATION_BATCH_MAX', 64))
+BATCH_SIZE = int(os.environ.get('TRANSLATION_BATCH_SIZE', 16))
+TORCH_THREADS = os.environ.get('TRANSLATION_TORCH_THREADS')
+
+
+class BatchingTranslator:
+    """Gathers strings from concurrent requests into shared forward passes.
+
+    Call it like a transformers pipeline: translator(texts) returns a list of
+    {'translation_text': ...} dicts. Requests arriving within BATCH_WINDOW_MS
+    of each other (or until BATCH_MAX_SENTENCES are waiting) are merged,
+    sorted by token length to limit padding, and translated by a single
+    dispatcher thread, so only one caller ever drives torch at a time.
+
+    Batches only span requests when a process serves several at once (gevent
+    or gthread workers, or the translation service). A sync worker has one
+    request in flight, so each batch holds that request's strings alone.
+    """
+
+    def __init__(self, pipe, window_ms=BATCH_WINDOW_MS, max_sentences=BATCH_MAX_SENTENCES, batch_size=BATCH_SIZE):
+        self.pipe = pipe
+        self.window = window_ms / 1000.0
+        self.max_sentences = max_sentences
+        self.batch_size = batch_size
+        self.stats = {"batches": 0, "sentences": 0, "requests": 0}
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return []
+        future = Future()
+        start_worker_thread("translation-batcher", self._run)
+        self._requests.put((list(texts), future))
+        return future.result()
+
+    def close(self):
+        """Stops the dispatcher once already-queued requests are served."""
+        self._requests.put(None)
+        stop_worker_thread(self._run)
+
+    def _collect(self):
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        count = len(first[0])
+        deadline = time.monotonic() + self.window
+        while count < self.max_sentences:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Serve what we have, then stop on the next _collect
+                self._requests.put(None)
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    def _token_lengths(self, texts):
+        tokenizer = getattr(self.pipe, 'tokenizer', None)
+        if tokenizer is None:
+            return [len(t) for t in texts]
+        return [len(ids) for ids in tokenizer(texts)['input_ids']]
+
+    def _run(self):
+        if TORCH_THREADS:
+            try:
+                import torch
+                torch.set_num_threads(int(TORCH_THREADS))
+            except ImportError:
+                pass  # the stub backend runs without torch
+
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            texts = [t for request_texts, _ in batch for t in request_texts]
+            try:
+                lengths = self._token_lengths(texts)
+                order = sorted(range(len(texts)), key=lengths.__getitem__)
+                # On a native thread under gevent, so greenlets keep serving other routes
+                started = time.perf_counter()
+                translated = run_blocking(self.pipe, [texts[i] for i in order], batch_size=self.batch_size)
+                metrics.inference_seconds.observe(time.perf_counter() - started)
+                metrics.batch_size.observe(len(texts))
+                metrics.tokens.inc(sum(lengths))
+                results = [None] * len(texts)
+                for position, item in zip(order, translated):
+                    results[position] = item
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["sentences"] += len(texts)
+                self.stats["requests"] += len(batch)
+
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(results[offset:offset + len(request_texts)])
+                offset += len(request_texts)
@@ -0,0 +1,364 @@
+"""Load test of the student/teacher request mix against a synthetic school.
+
+Seeds a throwaway SQLite file (users, teachers, classes, enrollments,
+quizzes with questions, assignments, and a long score history, with
+rollups and badges built), then replays a weighted mix of requests from
+concurrent clients and prints throughput and p50/p95/p99 latency per route.
+One request per route is sent first and timed on its own, so one-off
+startup work doesn't land in the percentiles.
+
+The same --seed gives the same school and the same request sequence.
+Requests go through Flask's test client in this process, or with
+--gunicorn N to a real gunicorn with N workers on the seeded file.
+
+--stub-translator runs lang=fr quizzes through the "stub" translation
+backend (see model_registry.py), so no model is downloaded or loaded.
+Use --save to keep the results and --compare to fail (exit status 1) when
+any route's p95 is more than --tolerance slower than a saved run.
+
+Usage: python bench.py [--users 5000] [--scores 2000000] [--clients 8] [--duration 30]
+       python bench.py --stub-translator --scores 200000 --duration 10 --save base.json
+       python bench.py --stub-translator --scores 200000 --duration 10 --compare base.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+SUBJECTS = ('Maths', 'Science', 'History', 'Geography', 'English')
+
+# Route label -> weight in the traffic mix
+MIX = {
+    'login': 12,
+    'quiz_en': 18,
+    'quiz_fr': 8,
+    'submit_score': 14,
+    'score_history': 10,
+    'score_summary': 6,
+    'assignments': 10,
+    'badges': 6,
+    'leaderboard': 4,
+    'class_analytics': 8,
+    'multi_class_analytics': 2,
+    'unassigned_students': 2,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the app's request mix on a synthetic school.")
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--classes', type=int, default=200)
+    parser.add_argument('--quizzes', type=int, default=400)
+    parser.add_argument('--questions', type=int, default=10, help="questions per quiz")
+    parser.add_argument('--scores', type=int, default=2000000)
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of measured traffic")
+    parser.add_argument('--warmup', type=float, default=3, help="seconds of unmeasured traffic first")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stub-translator', action='store_true', help="no translation model (fast CI runs)")
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help="serve with gunicorn instead of in-process")
+    parser.add_argument('--db', help="reuse (or keep) the seeded database at this path")
+    parser.add_argument('--save', metavar='FILE', help="write the results as JSON")
+    parser.add_argument('--compare', metavar='FILE', help="fail on p95 regressions against saved results")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 slowdown for --compare")
+    return parser.parse_args()
+
+
+# --- Seeding ---
+def seed_school(conn, args):
+    """Writes the synthetic school. Ids run from 1 in insertion order."""
+    import quiz_store
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+
+    conn.executemany("INSERT INTO teachers (username, password) VALUES (?, 'pass')",
+                     ((f"teacher{t}",) for t in range(1, args.teachers + 1)))
+    conn.executemany("INSERT INTO classes (class_name, teacher_id) VALUES (?, ?)",
+                     ((f"Class {c}", (c - 1) % args.teachers + 1) for c in range(1, args.classes + 1)))
+    conn.executemany("INSERT INTO users (username, password) VALUES (?, 'pass')",
+                     ((f"student{u}",) for u in range(1, args.users + 1)))
+    # Every student is in two classes
+    conn.executemany("INSERT OR IGNORE INTO enrollments (user_id, class_id) VALUES (?, ?)",
+                     ((u, rng.randint(1, args.classes)) for u in range(1, args.users + 1) for _ in range(2)))
+
+    conn.executemany("INSERT INTO quizzes (name, teacher_id) VALUES (?, ?)",
+                     ((f"Quiz {q}", (q - 1) % args.teachers + 1) for q in range(1, args.quizzes + 1)))
+    questions = []
+    for q in range(1, args.quizzes + 1):
+        for n in range(args.questions):
+            a, b = rng.randint(1, 99), rng.randint(1, 99)
+            options = [str(a + b + delta) for delta in (0, 1, -1, 10)]
+            rng.shuffle(options)
+            questions.append((q, f"Quiz {q}, question {n + 1}: what is {a} + {b}?", options, options.index(str(a + b))))
+    quiz_store.add_questions(conn, questions)
+    conn.executemany("INSERT INTO assignments (quiz_id, class_id) VALUES (?, ?)",
+                     ((rng.randint(1, args.quizzes), c) for c in range(1, args.classes + 1) for _ in range(5)))
+
+    # A year of history, oldest first like the real table
+    offsets = sorted((rng.randint(0, 365 * 86400) for _ in range(args.scores)), reverse=True)
+    conn.executemany(
+        "INSERT INTO scores (user_id, subject, score, timestamp) VALUES (?, ?, ?, ?)",
+        ((rng.randint(1, args.users), rng.choice(SUBJECTS), rng.randint(0, 20),
+          (now - timedelta(seconds=offset)).strftime('%Y-%m-%d %H:%M:%S')) for offset in offsets)
+    )
+    conn.commit()
+
+
+def prepare_database(args):
+    """Seeds args.db (or a temporary file) unless it already holds a school. Returns its path."""
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_PATH'] = path
+    os.environ.setdefault('SCORE_JOURNAL_DIR', os.path.join(os.path.dirname(os.path.abspath(path)), 'bench_journal'))
+    if args.stub_translator:
+        os.environ['TRANSLATION_BACKEND'] = 'stub'
+
+    import db
+    import migrations
+    import rollups
+    import badges
+
+    conn = db.get_connection()
+    migrations.migrate(conn)
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+        print(f"--- Reusing the school in {path} ---")
+        return path
+
+    print(f"--- Seeding {args.users} students, {args.classes} classes, {args.quizzes} quizzes "
+          f"and {args.scores} scores into {path} ---")
+    started = time.perf_counter()
+    seed_school(conn, args)
+    rollups.rebuild(conn)
+    badges.load_engine(conn).backfill(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+# --- Traffic ---
+def make_request(rng, args):
+    """(route label, method, path, JSON body or None) for one request of the mix."""
+    route = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+    user = rng.randint(1, args.users)
+    quiz = rng.randint(1, args.quizzes)
+    class_id = rng.randint(1, args.classes)
+    if route == 'login':
+        return route, 'POST', '/api/login', {'username': f"student{user}", 'password': 'pass'}
+    if route == 'quiz_en':
+        return route, 'GET', f'/api/quiz/{quiz}', None
+    if route == 'quiz_fr':
+        return route, 'GET', f'/api/quiz/{quiz}?lang=fr', None
+    if route == 'submit_score':
+        return route, 'POST', '/api/scores', {'user_id': user, 'subject': rng.choice(SUBJECTS), 'score': rng.randint(0, 20)}
+    if route == 'score_history':
+        return route, 'GET', f'/api/get_scores/{user}', None
+    if route == 'score_summary':
+        return route, 'GET', f'/api/get_score_summary/{user}', None
+    if route == 'assignments':
+        return route, 'GET', f'/api/student/assignments/{user}', None
+    if route == 'badges':
+        return route, 'GET', f'/api/get_badges/{user}', None
+    if route == 'leaderboard':
+        return route, 'GET', f'/api/leaderboard?user_id={user}', None
+    if route == 'class_analytics':
+        return route, 'GET', f'/api/teacher/analytics/{class_id}', None
+    if route == 'multi_class_analytics':
+        other = rng.randint(1, args.classes)
+        start = (datetime.now(timezone.utc) - timedelta(days=90)).strftime('%Y-%m-%d')
+        return route, 'GET', f'/api/teacher/analytics?class_id={class_id},{other}&start={start}', None
+    return route, 'GET', f'/api/teacher/unassigned_students/{class_id}', None
+
+
+def in_process_sender():
+    import app as webapp
+    local = threading.local()
+
+    def send(method, path, body):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = webapp.app.test_client()
+        response = client.open(path, method=method, json=body)
+        response.get_data()  # drain streamed bodies
+        return response.status_code
+    return send
+
+
+def http_sender(base_url):
+    def send(method, path, body):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+    return send
+
+
+def prime(send, args):
+    """Sends one request per route and prints its time.
+
+    One-off work (building the leaderboards, loading a model) happens here,
+    not in the measured run.
+    """
+    rng = random.Random(args.seed)
+    cold = {}
+    while len(cold) < len(MIX):
+        route, method, path, body = make_request(rng, args)
+        if route not in cold:
+            started = time.perf_counter()
+            send(method, path, body)
+            cold[route] = (time.perf_counter() - started) * 1000
+    print("First request per route: " + ", ".join(f"{route} {ms:.0f} ms" for route, ms in cold.items()))
+
+
+def run_clients(send, args):
+    """Runs the mix from args.clients threads. Returns {route: [(seconds, status)]}."""
+    results = {route: [] for route in MIX}
+    lock = threading.Lock()
+    warm_until = time.perf_counter() + args.warmup
+    stop_at = warm_until + args.duration
+
+    def client(n):
+        rng = random.Random(args.seed * 1000 + n)
+        samples = []
+        while True:
+            route, method, path, body = make_request(rng, args)
+            started = time.perf_counter()
+            if started >= stop_at:
+                break
+            try:
+                status = send(method, path, body)
+            except Exception as e:
+                print(f"--- BENCH: {method} {path} failed: {e} ---")
+                status = 0
+            if started >= warm_until:
+                samples.append((route, time.perf_counter() - started, status))
+        with lock:
+            for route, seconds, status in samples:
+                results[route].append((seconds, status))
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# --- Reporting ---
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(results, duration):
+    summary = {}
+    for route, samples in results.items():
+        if not samples:
+            continue
+        latencies = [seconds * 1000 for seconds, _ in samples]
+        summary[route] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, status in samples if not 200 <= status < 400),
+            "rps": round(len(samples) / duration, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+        }
+    return summary
+
+
+def print_summary(summary, duration):
+    print(f"\n{'route':<24}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, row in summary.items():
+        print(f"{route:<24}{row['requests']:>9}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+    total = sum(row['requests'] for row in summary.values())
+    print(f"\nTotal: {total} requests in {duration:.0f}s, {total / duration:.1f} req/s")
+
+
+def regressions(summary, baseline, tolerance):
+    """Routes whose p95 is more than tolerance slower than in baseline."""
+    slower = []
+    for route, row in summary.items():
+        before = baseline.get(route)
+        if before and row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            slower.append(f"{route}: p95 {before['p95_ms']} ms -> {row['p95_ms']} ms")
+    return slower
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app'],
+        env=dict(os.environ), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/api/translate/languages', timeout=5).read()
+            return proc, base_url
+        except OSError:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    prepare_database(args)
+
+    server = None
+    if args.gunicorn:
+        server, base_url = start_gunicorn(args.gunicorn)
+        send = http_sender(base_url)
+        target = f"gunicorn, {args.gunicorn} workers"
+    else:
+        send = in_process_sender()
+        target = "in-process"
+    try:
+        print(f"--- {args.clients} clients for {args.duration:.0f}s ({target}, "
+              f"{'stub' if args.stub_translator else 'real'} translator) ---")
+        prime(send, args)
+        results = run_clients(send, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(results, args.duration)
+    print_summary(summary, args.duration)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = regressions(summary, json.load(f), args.tolerance)
+        if slower:
+            print(f"\n{len(slower)} routes regressed by more than {args.tolerance:.0%}:")
+            for line in slower:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo route's p95 regressed by more than {args.tolerance:.0%}.")
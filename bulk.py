@@ -0,0 +1,398 @@
+"""Bulk import and export of questions, enrollments and scores.
+
+Files are CSV with a header row, or JSONL with one object per line:
+
+    questions     quiz_id, question_text, options, correct_answer
+                  (options: a JSON list, or "|"-separated in CSV)
+    enrollments   class_id, and user_id or username
+    scores        user_id, subject, score, and optionally timestamp
+                  ('YYYY-MM-DD HH:MM:SS', UTC) and submission_id
+
+Imports read the input as a stream and write CHUNK_SIZE rows per
+transaction with executemany. Rows that fail validation are reported by
+line number and skipped; the rest still go in. Scores go through
+score_ingest.write_batch, so rollups, badges, live events and the response
+cache stay in step. A score with a submission_id (or, failing that, a
+timestamp) gets the same key every time it is imported, so re-running an
+import never double-counts.
+
+Exports page through the table by rowid, so memory stays flat whatever the
+table size, and an exported scores file can be imported again as is.
+
+    python bulk.py import scores scores.csv
+    python bulk.py export scores --class-id 1 --format jsonl > scores.jsonl
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+import events
+import quiz_store
+import response_cache
+import score_ingest
+
+CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+EXPORT_PAGE = 1000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'jsonl')
+KINDS = ('questions', 'enrollments', 'scores')
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(requested=None, content_type=None, filename=None):
+    """'csv' or 'jsonl', from an explicit choice, a Content-Type or a file name."""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}.")
+        return requested
+    if (content_type and 'csv' in content_type) or (filename and filename.endswith('.csv')):
+        return 'csv'
+    return 'jsonl'
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, record) from a text stream. Unreadable lines yield a RowError."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, RowError(f"invalid JSON: {e.msg}")
+            continue
+        yield line_number, record if isinstance(record, dict) else RowError("expected a JSON object")
+
+
+# --- Field parsing ---
+def _required(record, field):
+    value = record.get(field)
+    if value is None or str(value).strip() == '':
+        raise RowError(f"missing {field}")
+    return value
+
+
+def _integer(record, field):
+    try:
+        return int(_required(record, field))
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be an integer")
+
+
+def _options(value):
+    if isinstance(value, list):
+        options = value
+    elif value.lstrip().startswith('['):
+        try:
+            options = json.loads(value)
+        except json.JSONDecodeError:
+            raise RowError("options is not a valid JSON list")
+    else:
+        options = value.split('|')
+    options = [str(option).strip() for option in options]
+    if len(options) < 2 or not all(options):
+        raise RowError("needs at least two non-empty options")
+    return options
+
+
+def _timestamp(record):
+    value = record.get('timestamp')
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise RowError("timestamp must be 'YYYY-MM-DD HH:MM:SS'")
+
+
+def _lookup(conn, sql_prefix, values):
+    """Rows matching `sql_prefix IN (values)`, e.g. the ids that exist in a table."""
+    values = list(values)
+    if not values:
+        return []
+    placeholders = ",".join("?" * len(values))
+    return conn.execute(f"{sql_prefix} IN ({placeholders})", values).fetchall()
+
+
+def _existing(conn, sql_prefix, values):
+    return {row[0] for row in _lookup(conn, sql_prefix, values)}
+
+
+# --- Importers: prepare() validates a chunk, write() inserts it ---
+def prepare_questions(conn, chunk):
+    parsed, errors = [], []
+    for line, record in chunk:
+        try:
+            options = _options(_required(record, 'options'))
+            answer = str(_required(record, 'correct_answer')).strip()
+            if answer not in options:
+                raise RowError("correct_answer is not one of the options")
+            parsed.append((line, (_integer(record, 'quiz_id'), str(_required(record, 'question_text')).strip(), options, options.index(answer))))
+        except RowError as e:
+            errors.append((line, str(e)))
+
+    quizzes = _existing(conn, "SELECT id FROM quizzes WHERE id", {q[0] for _, q in parsed})
+    items = []
+    for line, question in parsed:
+        if question[0] in quizzes:
+            items.append((line, question))
+        else:
+            errors.append((line, f"quiz {question[0]} does not exist"))
+    return items, errors
+
+
+def write_questions(conn, questions):
+    quiz_store.add_questions(conn, questions)
+    response_cache.bump(conn, *{f"quiz:{question[0]}" for question in questions})
+    return len(questions)
+
+
+def prepare_enrollments(conn, chunk):
+    parsed, errors = [], []
+    for line, record in chunk:
+        try:
+            class_id = _integer(record, 'class_id')
+            if str(record.get('user_id') or '').strip():
+                parsed.append((line, class_id, _integer(record, 'user_id'), None))
+            elif str(record.get('username') or '').strip():
+                parsed.append((line, class_id, None, str(record['username']).strip()))
+            else:
+                raise RowError("missing user_id or username")
+        except RowError as e:
+            errors.append((line, str(e)))
+
+    ids_by_name = dict(_lookup(conn, "SELECT username, id FROM users WHERE username", {p[3] for p in parsed if p[3]}))
+    users = _existing(conn, "SELECT id FROM users WHERE id", {p[2] for p in parsed if p[2] is not None} | set(ids_by_name.values()))
+    classes = _existing(conn, "SELECT id FROM classes WHERE id", {p[1] for p in parsed})
+    items = []
+    for line, class_id, user_id, username in parsed:
+        if username is not None:
+            user_id = ids_by_name.get(username)
+        if user_id is None:
+            errors.append((line, f"no user named '{username}'"))
+        elif user_id not in users:
+            errors.append((line, f"user {user_id} does not exist"))
+        elif class_id not in classes:
+            errors.append((line, f"class {class_id} does not exist"))
+        else:
+            items.append((line, (user_id, class_id)))
+    return items, errors
+
+
+def write_enrollments(conn, enrollments):
+    # Only rows that were really added announce themselves or invalidate caches
+    inserted = [(user_id, class_id) for user_id, class_id in dict.fromkeys(enrollments) if conn.execute(
+        "INSERT OR IGNORE INTO enrollments (user_id, class_id) VALUES (?, ?)", (user_id, class_id)).rowcount]
+
+    by_class = {}
+    for user_id, class_id in inserted:
+        by_class.setdefault(class_id, []).append(user_id)
+    for class_id, user_ids in by_class.items():
+        # One event per class rather than one per student
+        events.publish(conn, 'enrollment', [f"class:{class_id}"] + [f"user:{u}" for u in user_ids],
+                       {"class_id": class_id, "user_ids": user_ids})
+    if inserted:
+        response_cache.bump(conn, *{f"user:{u}" for u, _ in inserted}, *{f"class:{c}" for c in by_class})
+    return len(inserted)
+
+
+def prepare_scores(conn, chunk):
+    parsed, errors = [], []
+    for line, record in chunk:
+        try:
+            entry = {
+                "user_id": _integer(record, 'user_id'),
+                "subject": str(_required(record, 'subject')).strip(),
+                "score": _integer(record, 'score'),
+                "timestamp": _timestamp(record),
+                "submission_id": str(record.get('submission_id') or '').strip() or None,
+            }
+        except RowError as e:
+            errors.append((line, str(e)))
+            continue
+        if entry["submission_id"] is None:
+            if entry["timestamp"] is not None:
+                key = f"{entry['user_id']}|{entry['subject']}|{entry['score']}|{entry['timestamp']}"
+                entry["submission_id"] = "import-" + hashlib.sha1(key.encode('utf-8')).hexdigest()
+            else:
+                entry["submission_id"] = uuid.uuid4().hex
+        if entry["timestamp"] is None:
+            entry["timestamp"] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        parsed.append((line, entry))
+
+    users = _existing(conn, "SELECT id FROM users WHERE id", {entry["user_id"] for _, entry in parsed})
+    items = []
+    for line, entry in parsed:
+        if entry["user_id"] in users:
+            items.append((line, entry))
+        else:
+            errors.append((line, f"user {entry['user_id']} does not exist"))
+    return items, errors
+
+
+def write_scores(conn, entries):
+    # Rollups, badges, events and cache versions, in one transaction per chunk
+    return score_ingest.write_batch(conn, entries)
+
+
+IMPORTERS = {
+    "questions": (prepare_questions, write_questions),
+    "enrollments": (prepare_enrollments, write_enrollments),
+    "scores": (prepare_scores, write_scores),
+}
+
+
+def _add_error(report, line, message):
+    report["error_count"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": line, "error": message})
+
+
+def _import_chunk(conn, kind, chunk, report, on_chunk):
+    prepare, write = IMPORTERS[kind]
+    items, errors = prepare(conn, chunk)
+    for line, message in sorted(errors):
+        _add_error(report, line, message)
+    if not items:
+        return
+    values = [value for _, value in items]
+    try:
+        inserted = write(conn, values)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        for line, _ in items:
+            _add_error(report, line, f"not written, its chunk failed: {e}")
+        return
+    report["imported"] += inserted
+    report["skipped"] += len(values) - inserted
+    if on_chunk is not None:
+        on_chunk(kind, values)
+
+
+def import_rows(conn, kind, rows, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """Imports (line, record) rows of one kind. Returns a report dict.
+
+    "skipped" counts rows that were already there (duplicate enrollments,
+    scores with a known submission_id). on_chunk(kind, values) runs after
+    each committed chunk.
+    """
+    report = {"kind": kind, "rows": 0, "imported": 0, "skipped": 0, "error_count": 0, "errors": []}
+    chunk = []
+    for line, record in rows:
+        report["rows"] += 1
+        if isinstance(record, RowError):
+            _add_error(report, line, str(record))
+            continue
+        chunk.append((line, record))
+        if len(chunk) >= chunk_size:
+            _import_chunk(conn, kind, chunk, report, on_chunk)
+            chunk = []
+    if chunk:
+        _import_chunk(conn, kind, chunk, report, on_chunk)
+    return report
+
+
+# --- Exports: (query over rowid > ?, columns, {filter: condition}, JSON columns) ---
+EXPORTS = {
+    "questions": (
+        """SELECT q.id, q.id, q.quiz_id, q.question_text,
+                  (SELECT json_group_array(option_text) FROM
+                      (SELECT option_text FROM question_options WHERE question_id = q.id ORDER BY position)),
+                  (SELECT option_text FROM question_options WHERE question_id = q.id AND position = q.correct_index)
+           FROM questions q WHERE q.id > ?""",
+        ["id", "quiz_id", "question_text", "options", "correct_answer"],
+        {"quiz_id": "q.quiz_id = ?"},
+        {"options"},
+    ),
+    "enrollments": (
+        """SELECT e.rowid, e.class_id, e.user_id, u.username
+           FROM enrollments e JOIN users u ON u.id = e.user_id WHERE e.rowid > ?""",
+        ["class_id", "user_id", "username"],
+        {"class_id": "e.class_id = ?", "user_id": "e.user_id = ?"},
+        set(),
+    ),
+    "scores": (
+        "SELECT rowid, id, user_id, subject, score, timestamp, submission_id FROM scores WHERE rowid > ?",
+        ["id", "user_id", "subject", "score", "timestamp", "submission_id"],
+        {
+            "user_id": "user_id = ?",
+            "class_id": "user_id IN (SELECT user_id FROM enrollments WHERE class_id = ?)",
+            "since": "timestamp >= ?",
+            "until": "timestamp < date(?, '+1 day')",
+        },
+        set(),
+    ),
+}
+
+
+def export_rows(conn, kind, fmt, filters=None):
+    """Yields the export as text chunks, one page of EXPORT_PAGE rows at a time."""
+    sql, columns, conditions, json_columns = EXPORTS[kind]
+    params = []
+    for name, value in (filters or {}).items():
+        if value is not None:
+            sql += f" AND {conditions[name]}"
+            params.append(value)
+    sql += " ORDER BY 1 LIMIT ?"
+
+    if fmt == 'csv':
+        yield ",".join(columns) + "\r\n"
+    last_rowid = 0
+    while True:
+        rows = conn.execute(sql, [last_rowid] + params + [EXPORT_PAGE]).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        out = io.StringIO()
+        if fmt == 'csv':
+            csv.writer(out).writerows(row[1:] for row in rows)
+        else:
+            for row in rows:
+                record = dict(zip(columns, row[1:]))
+                for column in json_columns:
+                    record[column] = json.loads(record[column])
+                out.write(json.dumps(record) + "\n")
+        yield out.getvalue()
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Bulk import/export of questions, enrollments and scores.")
+    parser.add_argument('action', choices=('import', 'export'))
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('file', nargs='?', help="file to import (default: stdin)")
+    parser.add_argument('--format', choices=FORMATS)
+    for name in ('quiz_id', 'class_id', 'user_id', 'since', 'until'):
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, help="export filter")
+    args = parser.parse_args()
+
+    # Sets up the database, badge engine and score ingestion as the server does
+    import app as webapp
+    conn = webapp.db_connection()
+
+    if args.action == 'import':
+        fmt = detect_format(args.format, filename=args.file)
+        stream = open(args.file, encoding='utf-8', newline='') if args.file else sys.stdin
+        with stream:
+            report = import_rows(conn, args.kind, read_rows(stream, fmt), on_chunk=webapp.after_bulk_import)
+        print(json.dumps(report, indent=2))
+        sys.exit(1 if report["error_count"] else 0)
+    else:
+        conditions = EXPORTS[args.kind][2]
+        filters = {name: getattr(args, name) for name in conditions}
+        for text in export_rows(conn, args.kind, args.format or 'jsonl', filters):
+            sys.stdout.write(text)
@@ -0,0 +1,121 @@
+"""Compares translation backends against the float32 model on the quiz corpus.
+
+For each backend (torch, int8, onnx) this prints:
+  - quality vs float32: exact-match rate and chrF (character n-gram F-score)
+  - single-sentence latency p50/p95
+  - batched throughput in sentences per second
+
+The corpus is every question and option in the questions table, plus the
+built-in English quizzes from static/script.js.
+
+Usage: python compare_backends.py [lang] [backends]
+       python compare_backends.py fr torch,int8,onnx
+"""
+import re
+import sqlite3
+import sys
+import time
+from collections import Counter
+
+from model_registry import load_pipeline
+
+DB_PATH = 'mydatabase.db'
+SCRIPT_PATH = 'static/script.js'
+
+
+def load_corpus():
+    texts = []
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        for question_text, option_text in conn.execute("""
+                SELECT q.question_text, o.option_text
+                FROM questions q JOIN question_options o ON o.question_id = q.id
+                ORDER BY q.id, o.position"""):
+            texts.extend((question_text, option_text))
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Skipping database questions: {e}")
+
+    with open(SCRIPT_PATH, encoding='utf-8') as f:
+        for q, o in re.findall(r'\{ q: "(.*?)", o: \[(.*?)\], a: ".*?", lang: "en" \}', f.read()):
+            texts.append(q)
+            texts.extend(re.findall(r'"(.*?)"', o))
+
+    # Keep first occurrences only, in corpus order
+    return list(dict.fromkeys(texts))
+
+
+def chrf(hypothesis, reference, max_n=6, beta=2.0):
+    """Character n-gram F-score in [0, 100], as in sacreBLEU's chrF."""
+    hyp, ref = hypothesis.replace(' ', ''), reference.replace(' ', '')
+    precisions, recalls = [], []
+    for n in range(1, max_n + 1):
+        hyp_ngrams = Counter(hyp[i:i + n] for i in range(len(hyp) - n + 1))
+        ref_ngrams = Counter(ref[i:i + n] for i in range(len(ref) - n + 1))
+        if not hyp_ngrams or not ref_ngrams:
+            continue
+        overlap = sum((hyp_ngrams & ref_ngrams).values())
+        precisions.append(overlap / sum(hyp_ngrams.values()))
+        recalls.append(overlap / sum(ref_ngrams.values()))
+    if not precisions:
+        return 100.0 if hyp == ref else 0.0
+    p, r = sum(precisions) / len(precisions), sum(recalls) / len(recalls)
+    if p + r == 0:
+        return 0.0
+    return 100 * (1 + beta ** 2) * p * r / (beta ** 2 * p + r)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_backend(lang, backend, corpus):
+    pipe = load_pipeline(lang, backend)
+    pipe(corpus[:2])  # warm-up
+
+    latencies = []
+    for text in corpus:
+        start = time.perf_counter()
+        pipe([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    outputs = [item['translation_text'] for item in pipe(corpus, batch_size=16)]
+    throughput = len(corpus) / (time.perf_counter() - start)
+    return outputs, latencies, throughput
+
+
+if __name__ == '__main__':
+    lang = sys.argv[1] if len(sys.argv) > 1 else 'fr'
+    backends = sys.argv[2].split(',') if len(sys.argv) > 2 else ['torch', 'int8', 'onnx']
+    corpus = load_corpus()
+    print(f"--- Comparing backends for '{lang}' on {len(corpus)} sentences ---")
+
+    results = {}
+    for backend in backends:
+        try:
+            results[backend] = run_backend(lang, backend, corpus)
+        except Exception as e:
+            print(f"Skipping {backend}: {e}")
+
+    reference = results.get('torch', (None,))[0]
+    print(f"\n{'backend':<8}{'exact':>8}{'chrF':>8}{'p50 ms':>9}{'p95 ms':>9}{'sent/s':>10}")
+    for backend, (outputs, latencies, throughput) in results.items():
+        if reference:
+            exact = 100 * sum(o == r for o, r in zip(outputs, reference)) / len(corpus)
+            score = sum(chrf(o, r) for o, r in zip(outputs, reference)) / len(corpus)
+            quality = f"{exact:>7.1f}%{score:>8.1f}"
+        else:
+            quality = f"{'n/a':>8}{'n/a':>8}"
+        print(f"{backend:<8}{quality}{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{throughput:>10.1f}")
+
+    if reference:
+        print("\nLargest differences from float32:")
+        for backend, (outputs, _, _) in results.items():
+            if backend == 'torch':
+                continue
+            worst = sorted(zip(corpus, outputs, reference), key=lambda t: chrf(t[1], t[2]))[:3]
+            for source, out, ref in worst:
+                if out != ref:
+                    print(f"  [{backend}] {source!r}: {out!r} vs {ref!r}")
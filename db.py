@@ -0,0 +1,165 @@
+import collections
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+import metrics
+
+DB_PATH = os.environ.get('DATABASE_PATH', 'mydatabase.db')
+
+# Applied once per connection. WAL lets readers proceed while a score is being
+# written; synchronous=NORMAL is durable across app crashes in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-20000",      # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Compiled statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+# Connections whose thread (or greenlet) has finished wait here for the next
+# one, so a short-lived greenlet doesn't open a connection and rerun the
+# PRAGMAs for each request. Beyond this many idle ones, they are closed.
+IDLE_CONNECTIONS = int(os.environ.get('DB_IDLE_CONNECTIONS', 8))
+
+# (pid, thread-local, idle connections) for this process, made on first use
+# after fork, so under gevent (patched in the worker) the local is per greenlet
+_state = None
+
+
+def _process_state():
+    global _state
+    if _state is None or _state[0] != os.getpid():
+        _state = (os.getpid(), threading.local(), collections.deque())
+    return _state
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Records each statement's time and rows in metrics.py."""
+
+    _rows = 0
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        metrics.observe_query(sql, time.perf_counter() - started, self.rowcount)
+        self._sql = sql
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        metrics.observe_query(sql, time.perf_counter() - started, self.rowcount)
+        return self
+
+    # Rows read are counted as they are fetched and recorded when the cursor goes away
+    def __next__(self):
+        row = super().__next__()
+        self._rows += 1
+        return row
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._rows += len(rows)
+        return rows
+
+    def __del__(self):
+        if self._rows:
+            metrics.query_rows.inc(self._rows, metrics.statement_label(self._sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts don't go through cursor(), so route them explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _connect():
+    factory = TimedConnection if metrics.ENABLED else sqlite3.Connection
+    # Only one thread holds a connection at a time, but an idle one may be
+    # picked up by a different thread than opened it
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, factory=factory,
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _check_in(conn, pid):
+    """Puts a finished thread's connection back for the next one."""
+    state = _process_state()
+    if pid != state[0]:
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        return
+    if len(state[2]) < IDLE_CONNECTIONS:
+        state[2].append(conn)
+    else:
+        conn.close()
+
+
+class _Lease:
+    """A thread's hold on its connection, handed back when the thread ends."""
+
+    def __init__(self, conn, pid):
+        self.conn = conn
+        finalizer = weakref.finalize(self, _check_in, conn, pid)
+        finalizer.atexit = False
+
+
+def get_connection():
+    """Returns this thread's connection, taking an idle one or opening one.
+
+    A thread (a greenlet under gevent) keeps its connection until it ends,
+    so repeated queries hit the statement cache instead of being
+    re-prepared, and a streamed response can go on reading after teardown.
+    A connection inherited across fork() is never reused; the child opens
+    its own.
+    """
+    pid, local, idle = _process_state()
+    lease = getattr(local, 'lease', None)
+    if lease is None:
+        try:
+            conn = idle.pop()
+        except IndexError:
+            conn = _connect()
+        lease = local.lease = _Lease(conn, pid)
+    return lease.conn
+
+
+def release(exception=None):
+    """Teardown hook: rolls back anything a request left uncommitted."""
+    lease = getattr(_process_state()[1], 'lease', None)
+    if lease is not None and lease.conn.in_transaction:
+        lease.conn.rollback()
+
+
+def init_app(app):
+    app.teardown_appcontext(release)
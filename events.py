@@ -0,0 +1,209 @@
+"""Live events for the student and teacher pages, pushed over Server-Sent Events.
+
+Writers call publish() inside their own transaction, which adds a row to the
+events table, so an event exists exactly when the change it describes has
+been committed, whichever gunicorn worker made it. Each event goes to one or
+more channels:
+
+    user:<id>     a student's own page (badge awards, scores, enrollments)
+    class:<id>    teachers watching a class (chart deltas, enrollments)
+
+Each process runs one poller thread that reads new events, a range read on
+the events id every EVENTS_POLL_MS, and hands them to the in-process
+subscribers of their channels. An open stream only waits on its own queue,
+so a thousand idle connections cost one query per poll, not a thousand.
+Events are kept for EVENTS_RETENTION_S so a reconnecting client can catch up
+from its Last-Event-ID. The replay reads event_channels, one row per
+(channel, event), so only the client's own channels are read however busy
+the others are.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import db
+import logs
+from background import start_worker_thread
+
+POLL_MS = float(os.environ.get('EVENTS_POLL_MS', 250))
+HEARTBEAT_S = float(os.environ.get('EVENTS_HEARTBEAT_S', 15))
+RETENTION_S = int(os.environ.get('EVENTS_RETENTION_S', 600))
+QUEUE_MAX = int(os.environ.get('EVENTS_QUEUE_MAX', 256))
+REPLAY_MAX = 1000
+RETRY_MS = 3000
+
+log = logs.get_logger('events')
+
+_lock = threading.Lock()
+_subscribers = {}  # channel -> set of Subscription
+
+stats = {"published": 0, "delivered": 0, "dropped_streams": 0}
+
+
+def publish(conn, kind, channels, payload):
+    """Records an event. Runs inside the caller's transaction; the caller commits."""
+    event_id = conn.execute(
+        "INSERT INTO events (kind, channels, payload) VALUES (?, ?, ?)",
+        (kind, json.dumps(channels), json.dumps(payload))
+    ).lastrowid
+    conn.executemany("INSERT OR IGNORE INTO event_channels (channel, event_id) VALUES (?, ?)",
+                     [(channel, event_id) for channel in channels])
+    stats["published"] += 1
+
+
+def publish_score(conn, user_id, subject):
+    """Publishes a student's new average in a subject to them and to their classes."""
+    row = conn.execute("""
+        SELECT u.username,
+               CAST(r.score_sum AS REAL) / r.quiz_count,
+               (SELECT group_concat(class_id) FROM enrollments WHERE user_id = u.id)
+        FROM users u
+        LEFT JOIN score_rollups r ON r.user_id = u.id AND r.subject = ?
+        WHERE u.id = ?
+    """, (subject, user_id)).fetchone()
+    if row is None:
+        return
+    username, average_score, class_ids = row[0], row[1], row[2]
+    channels = [f"user:{user_id}"] + [f"class:{c}" for c in (class_ids.split(',') if class_ids else [])]
+    publish(conn, 'score', channels, {
+        "user_id": user_id, "username": username, "subject": subject, "average_score": average_score,
+    })
+
+
+class Subscription:
+    def __init__(self, channels):
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=QUEUE_MAX)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A client this far behind reconnects and catches up from Last-Event-ID
+            self.overflowed = True
+
+
+def subscribe(channels):
+    start_worker_thread("events-poller", _run)
+    subscription = Subscription(channels)
+    with _lock:
+        for channel in channels:
+            _subscribers.setdefault(channel, set()).add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        for channel in subscription.channels:
+            subscribers = _subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del _subscribers[channel]
+
+
+def _dispatch(rows):
+    with _lock:
+        for event_id, kind, channels, payload in rows:
+            event = (event_id, kind, payload)
+            targets = set()
+            for channel in json.loads(channels):
+                targets.update(_subscribers.get(channel, ()))
+            for subscription in targets:
+                subscription.deliver(event)
+            stats["delivered"] += len(targets)
+
+
+def _run():
+    conn = db.get_connection()
+    last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM events").fetchone()[0]
+    next_prune = 0
+    while True:
+        time.sleep(POLL_MS / 1000.0)
+        try:
+            # Drained a page at a time, so a burst isn't spread over several polls
+            while True:
+                rows = conn.execute(
+                    "SELECT id, kind, channels, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, REPLAY_MAX)
+                ).fetchall()
+                if rows:
+                    last_id = rows[-1][0]
+                    _dispatch(rows)
+                if len(rows) < REPLAY_MAX:
+                    break
+            if time.monotonic() >= next_prune:
+                expired = conn.execute("SELECT MAX(id) FROM events WHERE created_at < datetime('now', ?)",
+                                       (f"-{RETENTION_S} seconds",)).fetchone()[0]
+                if expired:
+                    conn.execute("DELETE FROM events WHERE id <= ?", (expired,))
+                    conn.execute("DELETE FROM event_channels WHERE event_id <= ?", (expired,))
+                conn.commit()
+                next_prune = time.monotonic() + 60
+        except Exception as e:
+            conn.rollback()
+            log.warning("Poll failed: %s", e)
+
+
+def replay(conn, channels, after_id):
+    """Every event after after_id on any of channels, for a reconnecting client.
+
+    Read a page at a time through event_channels, so events on other
+    channels can't crowd the client's own out of the limit.
+    """
+    placeholders = ",".join("?" * len(channels))
+    backlog = []
+    while True:
+        rows = conn.execute(f"""
+            SELECT DISTINCT e.id, e.kind, e.payload
+            FROM event_channels c JOIN events e ON e.id = c.event_id
+            WHERE c.channel IN ({placeholders}) AND c.event_id > ?
+            ORDER BY e.id LIMIT ?
+        """, (*channels, after_id, REPLAY_MAX)).fetchall()
+        backlog += [tuple(row) for row in rows]
+        if len(rows) < REPLAY_MAX:
+            return backlog
+        after_id = rows[-1][0]
+
+
+def _format(event):
+    event_id, kind, payload = event
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+
+def stream(subscription, backlog=()):
+    """Yields the SSE body for a subscription: backlog first, then live events.
+
+    Sends a comment line every HEARTBEAT_S so proxies keep the connection
+    open, and unsubscribes when the client goes away.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        sent = 0
+        for event in backlog:
+            yield _format(event)
+            sent = event[0]
+        while not subscription.overflowed:
+            try:
+                event = subscription.queue.get(timeout=HEARTBEAT_S)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            # The backlog and the live queue can overlap by a few events
+            if event[0] > sent:
+                yield _format(event)
+                sent = event[0]
+        stats["dropped_streams"] += 1
+    finally:
+        unsubscribe(subscription)
+
+
+def get_stats():
+    snapshot = dict(stats)
+    with _lock:
+        snapshot["channels"] = len(_subscribers)
+        snapshot["streams"] = len({s for subs in _subscribers.values() for s in subs})
+    return snapshot
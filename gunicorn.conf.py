@@ -0,0 +1,46 @@
+import gc
+import os
+import subprocess
+import sys
+
+# Shared-model deployment mode: with TRANSLATION_PRELOAD=fr,de the master
+# imports app.py (and loads the models) once, then forks the workers, so the
+# weights are shared copy-on-write. GUNICORN_PRELOAD=0/1 overrides this.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1' if os.environ.get('TRANSLATION_PRELOAD') else '0') == '1'
+
+
+def when_ready(server):
+    # Move everything the master allocated into the permanent GC generation,
+    # so collections in the workers don't write to (and un-share) those pages.
+    if preload_app:
+        gc.freeze()
+
+# Concurrent serving. Each request is a gevent greenlet, so one worker holds
+# up to worker_connections of them (every logged-in student and teacher keeps
+# an /api/events stream open), while pools.py keeps inference and heavy
+# SQLite reads on native threads and bounded. gthread (with GUNICORN_THREADS)
+# works too, at one thread per open request. Don't run sync workers: an open
+# event stream holds one for good and is killed at every worker timeout.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+# Separate translation service (see translation_service.py). With
+# TRANSLATION_SERVICE_SOCKET set the workers send model calls to it instead
+# of loading models; TRANSLATION_SERVICE_SPAWN=1 has the master run it too.
+_translation_service = None
+
+
+def on_starting(server):
+    global _translation_service
+    # Build the static assets once here rather than in every worker (see assets.py)
+    import assets
+    assets.prebuild()
+    if os.environ.get('TRANSLATION_SERVICE_SOCKET') and os.environ.get('TRANSLATION_SERVICE_SPAWN') == '1':
+        _translation_service = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translation_service.py')])
+
+
+def on_exit(server):
+    if _translation_service is not None:
+        _translation_service.terminate()
+        _translation_service.wait(timeout=30)
@@ -0,0 +1,317 @@
+"""In-memory leaderboards, kept current incrementally.
+
+Boards rank students by total points (sum of their quiz scores):
+
+    ('global',)                      every student
+    ('subject', subject)             points in one subject
+    ('class', class_id)              students enrolled in a class
+    ('window', 'day'|'week'|'month') points scored in the current period (UTC)
+
+Each board is a dict of totals plus an indexable skip list ordered by
+(-points, user_id), so updates, "my rank" and the start of a top-K page are
+O(log n).
+
+Boards are built from score_rollups when app.py starts and then caught up
+from the rows added since: scores with id > the last one applied, and
+enrollments with rowid > the last one applied. Both are range reads on the
+rowid, and they pick up writes from every gunicorn worker, not only this
+one. The two watermarks also make a cheap, cross-worker-stable ETag.
+
+Reads and builds happen outside the service lock, which is only held to
+swap in a rebuilt set of boards or apply the rows already read, so a
+rebuild or a slow catch-up query doesn't stall every leaderboard request.
+"""
+import hashlib
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+WINDOWS = ('day', 'week', 'month')
+MAX_LEVELS = 24  # ample for ~16M users
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+# Sorts after every (-points, user_id) key
+_END = _Node((float('inf'),), 0)
+
+
+class RankedSet:
+    """Indexable skip list: insert, remove, rank and index lookup in O(log n)."""
+
+    def __init__(self):
+        self.head = _Node(None, MAX_LEVELS)
+        self.head.next = [_END] * MAX_LEVELS
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key):
+        chain = [None] * MAX_LEVELS
+        steps_at_level = [0] * MAX_LEVELS
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = 1
+        while levels < MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        new = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * MAX_LEVELS
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """Number of keys smaller than key."""
+        position = 0
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def iter_from(self, index):
+        """Yields keys in order, starting at a 0-based index."""
+        if index >= self.size:
+            return
+        node = self.head
+        remaining = index + 1
+        for level in reversed(range(MAX_LEVELS)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        while node is not _END:
+            yield node.key
+            node = node.next[0]
+
+
+class Board:
+    def __init__(self):
+        self.totals = {}
+        self.ranking = RankedSet()
+
+    def add(self, user_id, points):
+        old = self.totals.get(user_id)
+        if old is not None:
+            if points == 0:
+                return
+            self.ranking.remove((-old, user_id))
+        total = (old or 0) + points
+        self.totals[user_id] = total
+        self.ranking.insert((-total, user_id))
+
+    def top(self, limit, offset=0):
+        """[(rank, user_id, points)] for one page, rank 1 = first place."""
+        entries = []
+        for i, (neg_points, user_id) in enumerate(self.ranking.iter_from(offset)):
+            if i >= limit:
+                break
+            entries.append((offset + i + 1, user_id, -neg_points))
+        return entries
+
+    def rank_of(self, user_id):
+        """(rank, points) for a user, or None if they aren't on the board."""
+        total = self.totals.get(user_id)
+        if total is None:
+            return None
+        return self.ranking.rank((-total, user_id)) + 1, total
+
+
+def window_start(window, now):
+    """Start of the current day/week/month as a 'YYYY-MM-DD HH:MM:SS' string."""
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == 'week':
+        day -= timedelta(days=day.weekday())
+    elif window == 'month':
+        day = day.replace(day=1)
+    return day.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class LeaderboardService:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.boards = {}
+        self.classes_of = {}  # user_id -> set of class ids
+        self.usernames = {}
+        self.last_score_id = 0
+        self.last_enrollment = 0
+        self.window_starts = {}
+        self.built = False
+
+    def _board(self, key):
+        board = self.boards.get(key)
+        if board is None:
+            board = self.boards[key] = Board()
+        return board
+
+    def rebuild(self, conn):
+        """Builds every board from the database in one read snapshot.
+
+        The boards are built aside and swapped in at the end; requests keep
+        being served from the old ones meanwhile.
+        """
+        with self.build_lock:
+            self._build(conn)
+
+    def _build(self, conn):
+        fresh = LeaderboardService()
+        now = datetime.now(timezone.utc)
+        fresh.window_starts = {w: window_start(w, now) for w in WINDOWS}
+
+        conn.execute("BEGIN")
+        try:
+            fresh.last_score_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM scores").fetchone()[0]
+            for user_id, subject, points in conn.execute("SELECT user_id, subject, score_sum FROM score_rollups"):
+                fresh._board(('global',)).add(user_id, points)
+                fresh._board(('subject', subject)).add(user_id, points)
+
+            for rowid, user_id, class_id in conn.execute("SELECT rowid, user_id, class_id FROM enrollments"):
+                fresh._enroll(user_id, class_id)
+                fresh.last_enrollment = max(fresh.last_enrollment, rowid)
+
+            since = min(fresh.window_starts.values())
+            for user_id, points, timestamp in conn.execute(
+                    "SELECT user_id, score, timestamp FROM scores WHERE timestamp >= ? AND id <= ?",
+                    (since, fresh.last_score_id)):
+                fresh._add_to_windows(user_id, points, timestamp)
+        finally:
+            conn.rollback()
+
+        with self.lock:
+            self.boards = fresh.boards
+            self.classes_of = fresh.classes_of
+            self.window_starts = fresh.window_starts
+            self.last_score_id = fresh.last_score_id
+            self.last_enrollment = fresh.last_enrollment
+            self.built = True
+
+    def _enroll(self, user_id, class_id):
+        classes = self.classes_of.setdefault(user_id, set())
+        if class_id in classes:
+            return
+        classes.add(class_id)
+        self._board(('class', class_id)).add(user_id, self._board(('global',)).totals.get(user_id, 0))
+
+    def _add_to_windows(self, user_id, points, timestamp):
+        for window, start in self.window_starts.items():
+            if timestamp >= start:
+                self._board(('window', window)).add(user_id, points)
+
+    def _roll_windows(self):
+        # A new day/week/month starts with an empty board
+        now = datetime.now(timezone.utc)
+        for window in WINDOWS:
+            start = window_start(window, now)
+            if start != self.window_starts.get(window):
+                self.window_starts[window] = start
+                self.boards[('window', window)] = Board()
+
+    def refresh(self, conn):
+        """Applies scores and enrollments committed since the last refresh.
+
+        Builds the boards first if app.py hasn't yet; concurrent callers wait
+        for that one build.
+        """
+        if not self.built:
+            with self.build_lock:
+                if not self.built:
+                    self._build(conn)
+        scores = conn.execute(
+            "SELECT id, user_id, subject, score, timestamp FROM scores WHERE id > ? ORDER BY id",
+            (self.last_score_id,)).fetchall()
+        enrollments = conn.execute(
+            "SELECT rowid, user_id, class_id FROM enrollments WHERE rowid > ? ORDER BY rowid",
+            (self.last_enrollment,)).fetchall()
+
+        with self.lock:
+            self._roll_windows()
+            # Rows another request applied while these were being read are skipped
+            for score_id, user_id, subject, points, timestamp in scores:
+                if score_id <= self.last_score_id:
+                    continue
+                self._board(('global',)).add(user_id, points)
+                self._board(('subject', subject)).add(user_id, points)
+                for class_id in self.classes_of.get(user_id, ()):
+                    self._board(('class', class_id)).add(user_id, points)
+                self._add_to_windows(user_id, points, timestamp)
+                self.last_score_id = score_id
+
+            for rowid, user_id, class_id in enrollments:
+                if rowid <= self.last_enrollment:
+                    continue
+                self._enroll(user_id, class_id)
+                self.last_enrollment = rowid
+
+    def etag(self, key, *params):
+        """Changes whenever any score or enrollment is added, identical across workers."""
+        if key[0] == 'window':
+            params += (self.window_starts.get(key[1]),)
+        raw = repr((key, self.last_score_id, self.last_enrollment) + params)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+    def _names(self, conn, user_ids):
+        missing = [u for u in user_ids if u not in self.usernames]
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            for user_id, username in conn.execute(f"SELECT id, username FROM users WHERE id IN ({placeholders})", missing):
+                self.usernames[user_id] = username
+        return self.usernames
+
+    def query(self, conn, key, limit=10, offset=0, user_id=None):
+        """Top-K page of a board, plus the caller's own rank if user_id is given."""
+        with self.lock:
+            board = self.boards.get(key) or Board()
+            page = board.top(limit, offset)
+            mine = board.rank_of(user_id) if user_id is not None else None
+            total_players = len(board.totals)
+        names = self._names(conn, [u for _, u, _ in page] + ([user_id] if mine else []))
+        result = {
+            "board": "/".join(str(part) for part in key),
+            "total_players": total_players,
+            "top": [{"rank": rank, "user_id": u, "username": names.get(u), "points": points} for rank, u, points in page],
+        }
+        if user_id is not None:
+            result["me"] = {"rank": mine[0], "user_id": user_id, "username": names.get(user_id), "points": mine[1]} if mine else None
+        return result
+
+
+service = LeaderboardService()
@@ -0,0 +1,51 @@
+"""Leveled logging that keeps stdout writes off the request path.
+
+Records go into an in-memory queue, and one listener thread per process
+writes them to stderr, so a request never waits on the terminal or a log
+pipe. LOG_LEVEL picks what is kept (default INFO). Per-request detail is
+logged at DEBUG, so production runs at INFO or WARNING pay only for a
+level check.
+
+    log = logs.get_logger('ai')
+    log.debug("Translating quiz %s to '%s'", quiz_id, lang)
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+_root = logging.getLogger('gamified')
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    _listener = logging.handlers.QueueListener(_queue, handler)
+    _listener.start()
+
+
+def _setup():
+    _root.setLevel(LEVEL)
+    _root.propagate = False
+    _root.addHandler(logging.handlers.QueueHandler(_queue))
+    _start_listener()
+    # The listener thread doesn't survive fork(); each gunicorn worker starts its own
+    os.register_at_fork(after_in_child=_start_listener)
+    # Write out whatever is still queued when the process exits
+    atexit.register(lambda: _listener.stop())
+
+
+def get_logger(area):
+    """The logger for one part of the app, e.g. 'ai', 'events' or 'scores'."""
+    return _root.getChild(area)
+
+
+_setup()
@@ -0,0 +1,81 @@
+"""Measures per-worker memory with and without shared (preloaded) models.
+
+Starts gunicorn with 1..N workers in two modes:
+  per-worker  every worker imports app.py and loads its own model copy
+  shared      the master loads the model before forking (preload_app)
+and prints RSS, USS and PSS per worker. USS is memory private to a worker;
+PSS splits shared pages between the processes using them, so PSS summed over
+the workers is the real footprint.
+
+Usage: python measure_workers.py [max_workers] [languages]
+       python measure_workers.py 4 fr
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import psutil
+
+MB = 1024 * 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_settled(master, workers, timeout=300):
+    """Waits for all workers to boot and their memory to stop growing."""
+    deadline = time.time() + timeout
+    last_total = None
+    while time.time() < deadline:
+        children = master.children()
+        if len(children) == workers:
+            total = sum(c.memory_info().rss for c in children)
+            if last_total is not None and abs(total - last_total) < MB:
+                return children
+            last_total = total
+        time.sleep(2)
+    raise RuntimeError("Workers did not settle in time")
+
+
+def measure(workers, shared, langs):
+    port = free_port()
+    env = dict(os.environ, TRANSLATION_PRELOAD=langs, GUNICORN_PRELOAD='1' if shared else '0')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        master = psutil.Process(proc.pid)
+        children = wait_until_settled(master, workers)
+        # One request proves the workers actually serve
+        urllib.request.urlopen(f'http://127.0.0.1:{port}/api/translate/languages', timeout=30).read()
+        rows = []
+        for child in children:
+            info = child.memory_full_info()
+            rows.append((info.rss / MB, info.uss / MB, getattr(info, 'pss', 0) / MB))
+        return rows
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == '__main__':
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    langs = sys.argv[2] if len(sys.argv) > 2 else 'fr'
+
+    print(f"--- Per-worker memory, models: {langs} ---")
+    print(f"{'mode':<11}{'workers':>8}{'RSS/worker':>12}{'USS/worker':>12}{'PSS total':>11}")
+    for shared in (False, True):
+        mode = 'shared' if shared else 'per-worker'
+        for workers in range(1, max_workers + 1):
+            rows = measure(workers, shared, langs)
+            rss = sum(r[0] for r in rows) / len(rows)
+            uss = sum(r[1] for r in rows) / len(rows)
+            pss = sum(r[2] for r in rows)
+            print(f"{mode:<11}{workers:>8}{rss:>10.0f}MB{uss:>10.0f}MB{pss:>9.0f}MB")
@@ -0,0 +1,228 @@
+"""In-process metrics, served in Prometheus text format at /metrics.
+
+    http_request_duration_seconds    per route, method and status (to the
+                                     first byte for streamed responses)
+    sqlite_query_duration_seconds    per statement: prepare and run to the
+                                     first row (all of it for writes)
+    sqlite_rows_total                per statement: rows read or written
+    translation_batch_size           sentences per model call
+    translation_inference_seconds    time in the model per batch
+    translation_tokens_total         input tokens translated
+    <component>_<stat>               the get_stats() counters of the caches,
+                                     pools, events and score ingest, read
+                                     at scrape time
+
+Each process keeps its own numbers, so under gunicorn a scrape reports the
+worker that answered it; the pid label tells the workers apart.
+METRICS_ENABLED=0 turns recording off.
+
+PROFILE_SAMPLE_MS=<n> also starts a sampling profiler: every n ms a thread
+records the stack of every other thread, and /metrics/profile returns the
+counts as collapsed stacks ("frame;frame;frame count" lines, readable by
+flamegraph.pl and speedscope). Add ?reset=1 to start a fresh window.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from functools import lru_cache
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+PROFILE_SAMPLE_MS = float(os.environ.get('PROFILE_SAMPLE_MS', 0))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_registry = []
+_collectors = []
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(values, list(series)) for values, series in self.series.items()]
+        for values, series in items:
+            labels = _labels(self.labels, values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), values + (bound,))} {cumulative}')
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount, *label_values):
+        if not ENABLED:
+            return
+        with self._lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self.series.items())
+        lines.extend(f"{self.name}{_labels(self.labels, values)} {value}" for values, value in items)
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    pairs = list(zip(names, values)) + [('pid', os.getpid())]
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def collector(prefix, get_stats):
+    """Exports the numbers in get_stats() as gauges named <prefix>_<key> at scrape time.
+
+    A nested dict (e.g. one per pool) becomes a label: {"inference": {"active": 1}}
+    is <prefix>_active{name="inference"}.
+    """
+    _collectors.append((prefix, get_stats))
+
+
+def _render_collected():
+    gauges = {}
+    for prefix, get_stats in _collectors:
+        for key, value in get_stats().items():
+            if isinstance(value, dict):
+                for stat, number in value.items():
+                    if isinstance(number, (int, float)):
+                        gauges.setdefault(f"{prefix}_{stat}", []).append(((('name', key),), number))
+            elif isinstance(value, (int, float)):
+                gauges.setdefault(f"{prefix}_{key}", []).append(((), value))
+    lines = []
+    for name, samples in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            names, values = tuple(n for n, _ in labels), tuple(v for _, v in labels)
+            lines.append(f"{name}{_labels(names, values)} {float(value)}")
+    return lines
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(_render_collected())
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics recorded by the app ---
+request_seconds = Histogram('http_request_duration_seconds', "Request latency.", ('route', 'method', 'status'))
+query_seconds = Histogram('sqlite_query_duration_seconds', "Statement prepare and run to the first row.", ('statement',))
+query_rows = Counter('sqlite_rows_total', "Rows read or written per statement.", ('statement',))
+batch_size = Histogram('translation_batch_size', "Sentences per model call.", (), BATCH_BUCKETS)
+inference_seconds = Histogram('translation_inference_seconds', "Time in the model per batch.", ())
+tokens = Counter('translation_tokens_total', "Input tokens translated (characters without a tokenizer).")
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """A statement's text with whitespace collapsed and IN (?, ?, ...) lists folded."""
+    sql = " ".join(sql.split())
+    return re.sub(r"\?(\s*,\s*\?)+", "?, ...", sql)[:200]
+
+
+def observe_query(sql, seconds, rows):
+    query_seconds.observe(seconds, statement_label(sql))
+    if rows > 0:
+        query_rows.inc(rows, statement_label(sql))
+
+
+# --- Sampling profiler ---
+_samples = _Tally()
+_samples_lock = threading.Lock()
+_sampler = None
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _sample_loop(interval):
+    me = threading.get_ident()
+    while True:
+        time.sleep(interval)
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            stacks.append(";".join(reversed(names)))
+        with _samples_lock:
+            _samples.update(stacks)
+
+
+def start_profiler(interval_ms=PROFILE_SAMPLE_MS):
+    """Starts the sampler thread in this process, if it isn't running."""
+    global _sampler
+    if interval_ms <= 0 or (_sampler is not None and _sampler.is_alive()):
+        return
+    _sampler = threading.Thread(target=_sample_loop, args=(interval_ms / 1000.0,), name="profiler", daemon=True)
+    _sampler.start()
+
+
+def _after_fork():
+    # Threads don't survive fork(): a gunicorn worker starts its own sampler
+    _samples.clear()
+    if _sampler is not None:
+        start_profiler()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def profile(reset=False):
+    """Collapsed stacks sampled so far, busiest first. None when the profiler is off."""
+    if _sampler is None or not _sampler.is_alive():
+        return None
+    with _samples_lock:
+        lines = [f"{stack} {count}" for stack, count in _samples.most_common()]
+        if reset:
+            _samples.clear()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,266 @@
+"""Versioned schema migrations.
+
+The schema version lives in SQLite's PRAGMA user_version. Each migration
+runs once, in order, inside its own transaction. To change the schema,
+append a new (version, description, statements) entry; never edit one that
+has already shipped. A statement is SQL, or a function of the connection
+for a step SQL can't express (such as logging what a backfill left out).
+"""
+import sqlite3
+
+import logs
+
+log = logs.get_logger('db')
+
+
+def _warn_unmatched_answers(conn):
+    ids = [row[0] for row in conn.execute("SELECT question_id FROM unmatched_answers ORDER BY question_id")]
+    if ids:
+        log.warning("%d question(s) have a correct_answer matching none of their options and no correct "
+                    "option; their answers are kept in unmatched_answers: %s", len(ids), ids)
+
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS scores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            subject TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS teachers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS classes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_name TEXT NOT NULL,
+            teacher_id INTEGER,
+            FOREIGN KEY (teacher_id) REFERENCES teachers (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS enrollments (
+            user_id INTEGER,
+            class_id INTEGER,
+            PRIMARY KEY (user_id, class_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (class_id) REFERENCES classes (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS badges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT,
+            icon TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS user_badges (
+            user_id INTEGER,
+            badge_id INTEGER,
+            PRIMARY KEY (user_id, badge_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (badge_id) REFERENCES badges (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS quizzes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            teacher_id INTEGER,
+            FOREIGN KEY (teacher_id) REFERENCES teachers (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id INTEGER,
+            question_text TEXT NOT NULL,
+            options TEXT NOT NULL, -- Storing options as a JSON string
+            correct_answer TEXT NOT NULL,
+            FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
+        )''',
+        # Translation cache, keyed by a hash of (model, target language, source text)
+        '''CREATE TABLE IF NOT EXISTS translations (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            target_lang TEXT NOT NULL,
+            source_text TEXT NOT NULL,
+            translated_text TEXT NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS assignments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id INTEGER,
+            class_id INTEGER,
+            FOREIGN KEY (quiz_id) REFERENCES quizzes (id),
+            FOREIGN KEY (class_id) REFERENCES classes (id)
+        )''',
+    ]),
+    (2, "indexes for route queries", [
+        # get_scores (WHERE user_id ORDER BY timestamp), badge COUNT(*) per user
+        # and the analytics AVG, all answered from the index alone
+        "CREATE INDEX IF NOT EXISTS idx_scores_user_time ON scores (user_id, timestamp, subject, score)",
+        # Analytics and unassigned-students lookups by class
+        "CREATE INDEX IF NOT EXISTS idx_enrollments_class ON enrollments (class_id, user_id)",
+        # get_student_assignments joins enrollments -> assignments on class_id
+        "CREATE INDEX IF NOT EXISTS idx_assignments_class ON assignments (class_id, quiz_id)",
+        "CREATE INDEX IF NOT EXISTS idx_assignments_quiz ON assignments (quiz_id)",
+        # get_quiz_questions
+        "CREATE INDEX IF NOT EXISTS idx_questions_quiz ON questions (quiz_id)",
+        # Teacher dashboard lists
+        "CREATE INDEX IF NOT EXISTS idx_quizzes_teacher ON quizzes (teacher_id)",
+        "CREATE INDEX IF NOT EXISTS idx_classes_teacher ON classes (teacher_id)",
+        "ANALYZE",
+    ]),
+    (3, "per-student, per-subject score rollups", [
+        '''CREATE TABLE IF NOT EXISTS score_rollups (
+            user_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            quiz_count INTEGER NOT NULL,
+            score_sum INTEGER NOT NULL,
+            min_score INTEGER NOT NULL,
+            max_score INTEGER NOT NULL,
+            last_timestamp DATETIME,
+            PRIMARY KEY (user_id, subject),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''INSERT OR REPLACE INTO score_rollups
+            SELECT user_id, subject, COUNT(*), SUM(score), MIN(score), MAX(score), MAX(timestamp)
+            FROM scores GROUP BY user_id, subject''',
+    ]),
+    (4, "idempotency key for journaled score submissions", [
+        "ALTER TABLE scores ADD COLUMN submission_id TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_submission ON scores (submission_id)",
+    ]),
+    (5, "time index for leaderboard windows", [
+        "CREATE INDEX IF NOT EXISTS idx_scores_time ON scores (timestamp)",
+    ]),
+    (6, "event log for live updates", [
+        '''CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            channels TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_events_created ON events (created_at)",
+    ]),
+    (7, "version counters for the response cache", [
+        '''CREATE TABLE IF NOT EXISTS cache_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at DATETIME NOT NULL
+        ) WITHOUT ROWID''',
+    ]),
+    (8, "options table, correct-option index and compiled quiz payloads", [
+        '''CREATE TABLE IF NOT EXISTS question_options (
+            question_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            option_text TEXT NOT NULL,
+            PRIMARY KEY (question_id, position),
+            FOREIGN KEY (question_id) REFERENCES questions (id)
+        ) WITHOUT ROWID''',
+        '''INSERT INTO question_options (question_id, position, option_text)
+            SELECT q.id, j.key, j.value FROM questions q, json_each(q.options) j''',
+        # An answer matching none of its options can't become an index; keep
+        # its text so the question can be fixed instead of served unanswered
+        '''CREATE TABLE IF NOT EXISTS unmatched_answers (
+            question_id INTEGER PRIMARY KEY,
+            correct_answer TEXT
+        )''',
+        '''INSERT INTO unmatched_answers (question_id, correct_answer)
+            SELECT q.id, q.correct_answer FROM questions q
+            WHERE NOT EXISTS (SELECT 1 FROM question_options o
+                              WHERE o.question_id = q.id AND o.option_text = q.correct_answer)''',
+        _warn_unmatched_answers,
+        # Rebuild questions without the JSON options and answer text; the
+        # answer becomes the position of the first option matching it
+        '''CREATE TABLE questions_v8 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id INTEGER,
+            question_text TEXT NOT NULL,
+            correct_index INTEGER,
+            FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
+        )''',
+        '''INSERT INTO questions_v8 (id, quiz_id, question_text, correct_index)
+            SELECT q.id, q.quiz_id, q.question_text,
+                   (SELECT MIN(o.position) FROM question_options o
+                    WHERE o.question_id = q.id AND o.option_text = q.correct_answer)
+            FROM questions q''',
+        "DROP TABLE questions",
+        "ALTER TABLE questions_v8 RENAME TO questions",
+        "CREATE INDEX IF NOT EXISTS idx_questions_quiz ON questions (quiz_id)",
+        # English quiz JSON as served, rebuilt on every change (see quiz_store.py)
+        '''CREATE TABLE IF NOT EXISTS quiz_payloads (
+            quiz_id INTEGER PRIMARY KEY,
+            payload BLOB NOT NULL
+        )''',
+    ]),
+    (9, "chunks of scores moved to the Parquet archive", [
+        # Written in the same transaction that deletes the chunk's scores (see archive.py)
+        '''CREATE TABLE IF NOT EXISTS score_archive (
+            chunk TEXT PRIMARY KEY,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            min_timestamp DATETIME NOT NULL,
+            max_timestamp DATETIME NOT NULL,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (10, "per-student index of archived score files", [
+        '''CREATE TABLE IF NOT EXISTS score_archive_users (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            class_id INTEGER NOT NULL,
+            chunk TEXT NOT NULL,
+            PRIMARY KEY (user_id, month, class_id, chunk)
+        ) WITHOUT ROWID''',
+        # Chunks archived before the index existed are read in full by archive.history()
+        "ALTER TABLE score_archive ADD COLUMN indexed INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (11, "channel index of events, for replays", [
+        '''CREATE TABLE IF NOT EXISTS event_channels (
+            channel TEXT NOT NULL,
+            event_id INTEGER NOT NULL,
+            PRIMARY KEY (channel, event_id)
+        ) WITHOUT ROWID''',
+        "CREATE INDEX IF NOT EXISTS idx_event_channels_event ON event_channels (event_id)",
+        "INSERT OR IGNORE INTO event_channels (channel, event_id) SELECT j.value, e.id FROM events e, json_each(e.channels) j",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchall()[0][0]
+
+
+def migrate(conn, verbose=False):
+    """Brings the database up to LATEST_VERSION. Safe to call on every start.
+
+    BEGIN IMMEDIATE serializes concurrent callers (e.g. gunicorn workers
+    booting together); each re-checks the version once it holds the lock.
+    """
+    if current_version(conn) >= LATEST_VERSION:
+        return
+
+    for version, description, statements in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        if verbose:
+            print(f"Applied migration {version}: {description}")
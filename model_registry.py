@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import logs
+import translation_service
+from batching import BatchingTranslator
+from pools import run_blocking
+
+# Target language -> Hugging Face model. Override with e.g.
+# TRANSLATION_MODELS="fr=Helsinki-NLP/opus-mt-en-fr,de=Helsinki-NLP/opus-mt-en-de"
+DEFAULT_MODELS = {
+    'fr': "Helsinki-NLP/opus-mt-en-fr",
+    'de': "Helsinki-NLP/opus-mt-en-de",
+}
+
+log = logs.get_logger('ai')
+
+# Rough size of one Marian checkpoint, used when the real size can't be measured
+DEFAULT_MODEL_MB = 300
+MEMORY_BUDGET_MB = float(os.environ.get('TRANSLATION_MEMORY_BUDGET_MB', 1024))
+
+# Inference backend: "torch" (float32), "int8" (dynamically quantized torch),
+# "onnx" (ONNX Runtime, needs the optional `optimum[onnxruntime]` package)
+# or "stub" (no model: returns the English text after TRANSLATION_STUB_MS per
+# batch, for benchmarks and CI; see bench.py)
+BACKENDS = ('torch', 'int8', 'onnx', 'stub')
+BACKEND = os.environ.get('TRANSLATION_BACKEND', 'torch')
+STUB_MS = float(os.environ.get('TRANSLATION_STUB_MS', 5))
+if BACKEND not in BACKENDS:
+    raise ValueError(f"TRANSLATION_BACKEND must be one of {BACKENDS}, not '{BACKEND}'")
+
+
+def _configured_models():
+    raw = os.environ.get('TRANSLATION_MODELS')
+    if not raw:
+        return dict(DEFAULT_MODELS)
+    models = {}
+    for entry in raw.split(','):
+        lang, _, name = entry.partition('=')
+        if lang.strip() and name.strip():
+            models[lang.strip()] = name.strip()
+    return models
+
+
+MODELS = _configured_models()
+
+_loaded = OrderedDict()  # lang -> {"translator", "model", "size_mb", "last_used"}
+_measured = {}  # cache model name -> size in MB, from the last time it was loaded
+_remote = {}  # lang -> RemoteTranslator, when translation_service.py runs the models
+_lock = threading.Lock()
+_load_locks = {lang: threading.Lock() for lang in MODELS}
+
+
+def supported_languages():
+    """Languages that have a translation model configured (loaded or not)."""
+    return sorted(MODELS)
+
+
+def _model_size_mb(pipe):
+    model = getattr(pipe, 'model', None)
+    if model is None or not hasattr(model, 'parameters'):
+        return DEFAULT_MODEL_MB
+    size = sum(p.numel() * p.element_size() for p in model.parameters())
+    return size / (1024 * 1024)
+
+
+def _estimated_size_mb(lang):
+    """Size a model will take once loaded: as last measured, else its checkpoint on disk, else the default."""
+    name = cache_model_name(lang)
+    if name in _measured:
+        return _measured[name]
+    if BACKEND not in ('torch', 'int8'):
+        return DEFAULT_MODEL_MB
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return DEFAULT_MODEL_MB
+    for filename in ('model.safetensors', 'pytorch_model.bin'):
+        path = try_to_load_from_cache(MODELS[lang], filename)
+        if isinstance(path, str) and os.path.exists(path):
+            return os.path.getsize(path) / (1024 * 1024)
+    return DEFAULT_MODEL_MB
+
+
+def _stub_pipeline(texts, batch_size=None):
+    time.sleep(STUB_MS / 1000.0)
+    return [{'translation_text': text} for text in texts]
+
+
+def load_pipeline(lang, backend=None):
+    """Builds a translation pipeline for a language on the given backend."""
+    backend = backend or BACKEND
+    if backend == 'stub':
+        return _stub_pipeline
+
+    from transformers import pipeline
+
+    model_name = MODELS[lang]
+    task = f"translation_en_to_{lang}"
+    log.info("Loading English to '%s' translation model %s (%s)...", lang, model_name, backend)
+
+    if backend == 'onnx':
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError:
+            raise RuntimeError("The onnx backend needs `pip install optimum[onnxruntime]`.")
+        from transformers import AutoTokenizer
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+        pipe = pipeline(task, model=model, tokenizer=AutoTokenizer.from_pretrained(model_name))
+    else:
+        pipe = pipeline(task, model=model_name)
+        if backend == 'int8':
+            import torch
+            pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    log.info("Translation model for '%s' loaded.", lang)
+    return pipe
+
+
+def cache_model_name(lang, backend=None):
+    """Model identifier used for translation cache keys.
+
+    Non-default backends get their own keys because their outputs can differ
+    slightly from the float32 model.
+    """
+    backend = backend or BACKEND
+    return MODELS[lang] if backend == 'torch' else f"{MODELS[lang]}@{backend}"
+
+
+def _evict_for(size_mb):
+    # Caller must hold _lock. Drops least recently used models until the new one fits.
+    used = sum(entry["size_mb"] for entry in _loaded.values())
+    while _loaded and used + size_mb > MEMORY_BUDGET_MB:
+        lang, entry = _loaded.popitem(last=False)
+        used -= entry["size_mb"]
+        entry["translator"].close()
+        log.info("Evicted translation model for '%s' to stay within %.0f MB.", lang, MEMORY_BUDGET_MB)
+
+
+def get_translator(lang):
+    """Returns (translator, model_name) for a language, loading it on first use.
+
+    Returns (None, None) for languages without a configured model. With
+    TRANSLATION_SERVICE_SOCKET set, the translator forwards to the local
+    translation service and nothing is loaded here.
+    """
+    if lang not in MODELS:
+        return None, None
+
+    if translation_service.SOCKET_PATH and not translation_service.serving:
+        translator = _remote.get(lang)
+        if translator is None:
+            translator = _remote[lang] = translation_service.RemoteTranslator(lang)
+        return translator, cache_model_name(lang)
+
+    with _lock:
+        entry = _loaded.get(lang)
+        if entry is not None:
+            _loaded.move_to_end(lang)
+            entry["last_used"] = time.time()
+            return entry["translator"], entry["model"]
+
+    # Load outside the registry lock so other languages stay available
+    with _load_locks[lang]:
+        with _lock:
+            entry = _loaded.get(lang)
+        if entry is None:
+            # Make room before loading, so the old and new weights are never resident together
+            with _lock:
+                _evict_for(_estimated_size_mb(lang))
+            pipe = run_blocking(load_pipeline, lang)
+            size_mb = _measured[cache_model_name(lang)] = _model_size_mb(pipe)
+            entry = {
+                "translator": BatchingTranslator(pipe),
+                "model": cache_model_name(lang),
+                "size_mb": size_mb,
+                "last_used": time.time(),
+            }
+            with _lock:
+                # Again, in case the estimate was low or another language loaded meanwhile
+                _evict_for(size_mb)
+                _loaded[lang] = entry
+    return entry["translator"], entry["model"]
+
+
+def loaded_models():
+    """Snapshot of the loaded models, least recently used first."""
+    with _lock:
+        return [
+            {
+                "lang": lang,
+                "model": entry["model"],
+                "size_mb": round(entry["size_mb"], 1),
+                "last_used": entry["last_used"],
+                "batching": dict(entry["translator"].stats),
+            }
+            for lang, entry in _loaded.items()
+        ]
+
+
+def preload(langs):
+    """Loads models up front, e.g. in the gunicorn master before it forks.
+
+    Combined with preload_app the weights are then shared copy-on-write by
+    every worker instead of being loaded once per worker. Inference must not
+    run before the fork; BatchingTranslator starts its thread on first call.
+    """
+    if translation_service.SOCKET_PATH and not translation_service.serving:
+        log.info("Models are loaded by the translation service; skipping preload.")
+        return
+    for lang in langs:
+        if lang not in MODELS:
+            log.warning("Skipping preload of '%s': no model configured.", lang)
+            continue
+        translator, _ = get_translator(lang)
+        model = getattr(translator.pipe, 'model', None)
+        if model is not None and hasattr(model, 'eval'):
+            model.eval()
@@ -0,0 +1,99 @@
+"""Keyset pagination, projections and streamed JSON for list routes.
+
+A page is asked for with ?limit= (default PAGE_SIZE, at most PAGE_MAX) and
+?cursor=, the next_cursor of the previous page. The cursor holds the sort
+key of the last row sent, so the next page is a range read on an index
+from there: a deep page costs the same as the first, and rows added in
+between don't shift pages the way OFFSET does. ?fields= picks which of
+the route's columns each item carries. Date filters (e.g. ?since=) are
+read with date_arg().
+
+The body is written as rows come off the SQLite cursor, never built up as
+a list of dicts:
+
+    {"items": [...], "next_cursor": "<cursor>" or null}
+"""
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 100))
+PAGE_MAX = 500
+FLUSH_ROWS = 50  # items per chunk handed to the server
+
+
+class BadPage(ValueError):
+    """A malformed limit, cursor, field list or date filter. app.py answers 400."""
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """The sort key values in a cursor, which must hold size of them."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadPage("cursor is not valid")
+    if not isinstance(values, list) or len(values) != size:
+        raise BadPage("cursor is not valid")
+    return values
+
+
+def page_args(args, allowed_fields, default_fields, key_size):
+    """(limit, cursor values or None, fields) from a request's query string."""
+    try:
+        limit = int(args.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise BadPage("limit must be a number")
+    if not 1 <= limit <= PAGE_MAX:
+        raise BadPage(f"limit must be between 1 and {PAGE_MAX}")
+
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor, key_size) if cursor else None
+
+    fields = default_fields
+    if args.get('fields'):
+        fields = tuple(dict.fromkeys(f.strip() for f in args['fields'].split(',')))
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            raise BadPage(f"unknown fields: {', '.join(unknown)}; allowed: {', '.join(allowed_fields)}")
+    return limit, after, fields
+
+
+def date_arg(args, name):
+    """A 'YYYY-MM-DD' query parameter, or None when it is absent."""
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise BadPage(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def stream_page(rows, limit, fields, key):
+    """Yields the page body from rows, a cursor over up to limit + 1 rows.
+
+    The extra row only tells whether there is a next page; key(row) is the
+    cursor value of a row (its ORDER BY columns).
+    """
+    out = ['{"items": [']
+    last = None
+    for n, row in enumerate(rows):
+        if n == limit:
+            break
+        out.append((',' if n else '') + json.dumps({field: row[field] for field in fields}))
+        last = row
+        if len(out) >= FLUSH_ROWS:
+            yield ''.join(out)
+            out = []
+    else:
+        last = None  # ran out of rows: this is the last page
+    next_cursor = encode_cursor(key(last)) if last is not None else None
+    out.append('], "next_cursor": ' + json.dumps(next_cursor) + '}')
+    yield ''.join(out)
@@ -0,0 +1,118 @@
+"""Bounded pools for slow work, so it can't take the whole server with it.
+
+A pool lets at most `workers` callers run at once and at most `queue` more
+wait for a turn. Anything beyond that is turned away immediately with
+PoolBusy, which app.py answers with 503 and a Retry-After header, instead
+of piling up requests until every worker is stuck behind the model.
+
+    inference   model calls for cache misses (TRANSLATION_POOL_WORKERS/_QUEUE)
+    sqlite      long analytical reads (SQLITE_POOL_WORKERS/_QUEUE)
+
+Under gevent workers (the default in gunicorn.conf.py) a request is a
+greenlet, and anything that blocks in C (a torch forward pass, a big SQLite
+query) would stall every other request in the worker. run_blocking() moves
+such calls onto gevent's native thread pool; the sqlite pool does this for
+the functions it runs, and batching.py does it for the model call itself.
+Under sync or gthread workers run_blocking() just calls the function.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+WAIT_TIMEOUT_S = float(os.environ.get('POOL_WAIT_TIMEOUT_S', 30))
+
+
+class PoolBusy(Exception):
+    def __init__(self, pool, retry_after):
+        super().__init__(f"The {pool} pool is at capacity.")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+def _gevent_active():
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Calls fn on a native thread under gevent, so other greenlets keep running."""
+    if _gevent_active():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
+
+
+class Pool:
+    def __init__(self, name, workers, queue, offload=False):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.offload = offload
+        self.active = 0
+        self.waiting = 0
+        self.avg_seconds = 1.0  # moving average of run time, for Retry-After
+        self.stats = {"completed": 0, "rejected": 0, "timed_out": 0}
+        self._cond = threading.Condition()
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained."""
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.workers))
+
+    @contextmanager
+    def slot(self):
+        """Holds one of the pool's places for the duration of the block."""
+        with self._cond:
+            if self.active >= self.workers:
+                if self.waiting >= self.queue:
+                    self.stats["rejected"] += 1
+                    raise PoolBusy(self.name, self.retry_after())
+                self.waiting += 1
+                try:
+                    if not self._cond.wait_for(lambda: self.active < self.workers, timeout=WAIT_TIMEOUT_S):
+                        self.stats["timed_out"] += 1
+                        raise PoolBusy(self.name, self.retry_after())
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.active -= 1
+                self.stats["completed"] += 1
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * elapsed
+                self._cond.notify()
+
+    def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in a slot. Raises PoolBusy if the pool is full."""
+        with self.slot():
+            if self.offload:
+                return run_blocking(fn, *args, **kwargs)
+            return fn(*args, **kwargs)
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self.stats, active=self.active, waiting=self.waiting,
+                        workers=self.workers, queue=self.queue, avg_seconds=round(self.avg_seconds, 3))
+
+
+# The batcher already moves the forward pass to a native thread, so model
+# calls aren't offloaded a second time here.
+inference = Pool('inference',
+                 int(os.environ.get('TRANSLATION_POOL_WORKERS', 4)),
+                 int(os.environ.get('TRANSLATION_POOL_QUEUE', 16)))
+sqlite = Pool('sqlite',
+              int(os.environ.get('SQLITE_POOL_WORKERS', 4)),
+              int(os.environ.get('SQLITE_POOL_QUEUE', 64)),
+              offload=True)
+
+
+def get_stats():
+    return {pool.name: pool.get_stats() for pool in (inference, sqlite)}
@@ -0,0 +1,68 @@
+import os
+import queue
+import threading
+
+import db
+import logs
+from background import start_worker_thread
+from quiz_store import quiz_texts
+from translation_cache import translate_cached
+
+# Languages every quiz is pre-translated into, e.g. TRANSLATION_LANGUAGES=fr,de
+LANGUAGES = [l.strip() for l in os.environ.get('TRANSLATION_LANGUAGES', 'fr').split(',') if l.strip()]
+
+log = logs.get_logger('ai')
+
+_jobs = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+_get_translator = None
+
+
+def _translate_quiz(quiz_id):
+    texts = quiz_texts(db.get_connection(), quiz_id)
+    if not texts:
+        return
+
+    for lang in LANGUAGES:
+        translator, model_name = _get_translator(lang)
+        if translator is None:
+            continue
+        translate_cached(translator, model_name, lang, texts)
+
+
+def _run():
+    while True:
+        quiz_id = _jobs.get()
+        with _pending_lock:
+            _pending.discard(quiz_id)
+        try:
+            _translate_quiz(quiz_id)
+        except Exception as e:
+            log.warning("Pre-translation of quiz %s failed: %s", quiz_id, e)
+        finally:
+            _jobs.task_done()
+
+
+def start(get_translator):
+    """Registers the translator lookup used by the background worker.
+
+    get_translator(lang) must return a (translator, model_name) pair, or
+    (None, None) for languages without a model.
+    """
+    global _get_translator
+    _get_translator = get_translator
+
+
+def enqueue_quiz(quiz_id):
+    """Schedules a quiz for background translation into every configured language."""
+    with _pending_lock:
+        if quiz_id in _pending:
+            return
+        _pending.add(quiz_id)
+    start_worker_thread("pretranslate", _run)
+    _jobs.put(quiz_id)
+
+
+def queue_depth():
+    return _jobs.qsize()
@@ -0,0 +1,87 @@
+"""Quiz questions: normalized storage and compiled payloads.
+
+A question's options are rows of question_options, in position order, and
+questions.correct_index names the right one by position, so nothing ever
+has to match option text (which translation changes).
+
+Each quiz also has a compiled payload in quiz_payloads: the English quiz as
+the exact JSON bytes /api/quiz serves, [{"q", "o", "a"}, ...]. It is
+rebuilt in the same transaction whenever the quiz's questions change, so
+serving an English quiz is one primary-key read with no JSON work. Quizzes
+written before the payload table existed are compiled on first read.
+"""
+import json
+
+QUIZ_SQL = """
+    SELECT q.id, q.question_text, q.correct_index, o.option_text
+    FROM questions q
+    JOIN question_options o ON o.question_id = q.id
+    WHERE q.quiz_id = ?
+    ORDER BY q.id, o.position
+"""
+
+
+def add_questions(conn, new_questions):
+    """Inserts [(quiz_id, question_text, options, correct_index)] and recompiles their quizzes.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    option_rows = []
+    for quiz_id, text, options, correct_index in new_questions:
+        question_id = conn.execute(
+            "INSERT INTO questions (quiz_id, question_text, correct_index) VALUES (?, ?, ?)",
+            (quiz_id, text, correct_index)
+        ).lastrowid
+        option_rows.extend((question_id, position, option) for position, option in enumerate(options))
+    conn.executemany("INSERT INTO question_options (question_id, position, option_text) VALUES (?, ?, ?)", option_rows)
+    for quiz_id in dict.fromkeys(question[0] for question in new_questions):
+        compile_quiz(conn, quiz_id)
+
+
+def load_quiz(conn, quiz_id):
+    """[(question_text, options, correct_index)] in question order, from one indexed read."""
+    questions = []
+    last_id = None
+    for question_id, text, correct_index, option in conn.execute(QUIZ_SQL, (quiz_id,)):
+        if question_id != last_id:
+            questions.append((text, [], correct_index))
+            last_id = question_id
+        questions[-1][1].append(option)
+    return questions
+
+
+def as_payload(questions):
+    """The API shape of loaded questions: [{"q", "o", "a"}]."""
+    return [{
+        "q": text,
+        "o": options,
+        "a": options[correct_index] if correct_index is not None else None,
+    } for text, options, correct_index in questions]
+
+
+def compile_quiz(conn, quiz_id):
+    """Rebuilds and stores a quiz's English payload. Returns it. Does not commit."""
+    payload = json.dumps(as_payload(load_quiz(conn, quiz_id)), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    conn.execute("INSERT OR REPLACE INTO quiz_payloads (quiz_id, payload) VALUES (?, ?)", (quiz_id, payload))
+    return payload
+
+
+def quiz_payload(conn, quiz_id):
+    """The compiled English payload (JSON bytes) of a quiz."""
+    row = conn.execute("SELECT payload FROM quiz_payloads WHERE quiz_id = ?", (quiz_id,)).fetchone()
+    if row is not None:
+        return row[0]
+    if conn.execute("SELECT 1 FROM questions WHERE quiz_id = ? LIMIT 1", (quiz_id,)).fetchone() is None:
+        return b'[]'
+    payload = compile_quiz(conn, quiz_id)
+    conn.commit()
+    return payload
+
+
+def quiz_texts(conn, quiz_id):
+    """Every question and option text of a quiz, in order."""
+    texts = []
+    for text, options, _ in load_quiz(conn, quiz_id):
+        texts.append(text)
+        texts.extend(options)
+    return texts
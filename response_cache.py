@@ -0,0 +1,153 @@
+"""Response cache for read-mostly GET routes, invalidated by version counters.
+
+Each cached route declares the scopes its data depends on, e.g. 'user:3',
+'class:2', 'quiz:7' or 'teacher:1'. The write paths bump those scopes in
+the cache_versions table, inside the same transaction as the change:
+
+    add_question                quiz:<id>
+    assign_quiz                 class:<id>
+    handle_quizzes (POST)       teacher:<id>
+    enroll_student_api          user:<id>, class:<id>
+    score ingestion, badges     user:<id>
+
+A request reads its scopes' versions (one primary-key lookup per scope).
+The ETag is a hash of the route, its parameters and those versions, so it
+changes exactly when the data can have changed, and is the same in every
+gunicorn worker. If-Modified-Since is only consulted when no If-None-Match
+is sent. If the client already has it the answer is 304 without
+running the route. Otherwise the body comes from this process's LRU when
+it was built at the same versions, or the route runs and the result is kept.
+
+That only holds for responses fully determined by those versions. A route
+passes anything else (e.g. a quiz served in English because translation
+failed) through uncacheable(), and it is neither kept nor given an ETag.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+import db
+
+CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 2000))
+
+_lock = threading.Lock()
+_bodies = OrderedDict()  # route key -> (etag, body, mimetype)
+
+stats = {"hits": 0, "not_modified": 0, "misses": 0}
+
+
+def bump(conn, *scopes):
+    """Invalidates everything cached under scopes. Runs in the caller's transaction."""
+    conn.executemany("""
+        INSERT INTO cache_versions (scope, version, updated_at) VALUES (?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    """, [(scope,) for scope in scopes])
+
+
+def versions(conn, scopes):
+    """({scope: version}, last modified datetime or None) for scopes."""
+    if not scopes:
+        return {}, None
+    placeholders = ",".join("?" * len(scopes))
+    rows = conn.execute(
+        f"SELECT scope, version, updated_at FROM cache_versions WHERE scope IN ({placeholders})", scopes
+    ).fetchall()
+    last_modified = max((row[2] for row in rows), default=None)
+    if last_modified is not None:
+        last_modified = datetime.strptime(last_modified, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return {row[0]: row[1] for row in rows}, last_modified
+
+
+def _settled(last_modified):
+    """last_modified if it is usable as a validator, else None.
+
+    updated_at has one-second resolution, so while its second is still
+    running another bump can land at the same time stamp. Handing that out
+    as Last-Modified would let If-Modified-Since answer 304 for a change the
+    client never saw; only a finished second is given out or compared.
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    return last_modified if last_modified is not None and last_modified < now else None
+
+
+def _not_modified(etag, last_modified):
+    # The ETag carries the versions themselves, so it decides whenever the client sent one
+    if request.if_none_match:
+        return etag in request.if_none_match
+    since = request.if_modified_since
+    return since is not None and last_modified is not None and last_modified <= since
+
+
+def cached(depends):
+    """Caches a GET route. depends(**view_args) returns the scopes its response reads."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            if request.method != 'GET':
+                return view(**view_args)
+
+            scopes = sorted(set(depends(**view_args)))
+            current, last_modified = versions(db.get_connection(), scopes)
+            last_modified = _settled(last_modified)
+            key = request.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            raw = repr((key, [(scope, current.get(scope, 0)) for scope in scopes]))
+            etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+            if _not_modified(etag, last_modified):
+                stats["not_modified"] += 1
+                return _respond("", 304, None, etag, last_modified)
+
+            with _lock:
+                entry = _bodies.get(key)
+                if entry is not None and entry[0] == etag:
+                    _bodies.move_to_end(key)
+                    stats["hits"] += 1
+                    return _respond(entry[1], 200, entry[2], etag, last_modified)
+
+            stats["misses"] += 1
+            response = make_response(view(**view_args))
+            if response.status_code != 200 or getattr(response, 'uncacheable', False):
+                return response
+            # Streamed bodies aren't kept here, but their ETag still earns a 304 next time
+            if not response.is_streamed:
+                with _lock:
+                    _bodies[key] = (etag, response.get_data(), response.mimetype)
+                    _bodies.move_to_end(key)
+                    while len(_bodies) > CACHE_SIZE:
+                        _bodies.popitem(last=False)
+            _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def uncacheable(response):
+    """Marks a response that its scopes' versions don't determine, so cached() leaves it alone."""
+    response.uncacheable = True
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def _respond(body, status, mimetype, etag, last_modified):
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers may keep the copy but must revalidate it, which is a 304 when nothing changed
+    response.headers['Cache-Control'] = 'no-cache'
+
+
+def get_stats():
+    snapshot = dict(stats)
+    snapshot["entries"] = len(_bodies)
+    return snapshot
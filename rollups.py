@@ -0,0 +1,100 @@
+"""Per-student, per-subject score rollups.
+
+score_rollups keeps count/sum/min/max/last timestamp for every (user,
+subject) pair. save_score updates it in the same transaction as the score
+INSERT, so analytics, badge rules and history summaries read one small row
+instead of aggregating the whole scores history.
+
+If the rollups ever drift from the scores table (e.g. after rows are edited
+by hand), rebuild them; scores moved to the archive (archive.py) are
+counted too:
+
+    python rollups.py
+"""
+import sqlite3
+
+import archive
+
+UPSERT_SQL = """
+    INSERT INTO score_rollups (user_id, subject, quiz_count, score_sum, min_score, max_score, last_timestamp)
+    VALUES (?, ?, 1, ?, ?, ?, (SELECT timestamp FROM scores WHERE id = ?))
+    ON CONFLICT (user_id, subject) DO UPDATE SET
+        quiz_count = quiz_count + 1,
+        score_sum = score_sum + excluded.score_sum,
+        min_score = MIN(min_score, excluded.min_score),
+        max_score = MAX(max_score, excluded.max_score),
+        last_timestamp = MAX(COALESCE(last_timestamp, excluded.last_timestamp),
+                             COALESCE(excluded.last_timestamp, last_timestamp))
+"""
+
+# Adds archived totals to the rollup rebuilt from the live scores
+MERGE_SQL = """
+    INSERT INTO score_rollups (user_id, subject, quiz_count, score_sum, min_score, max_score, last_timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, subject) DO UPDATE SET
+        quiz_count = quiz_count + excluded.quiz_count,
+        score_sum = score_sum + excluded.score_sum,
+        min_score = MIN(min_score, excluded.min_score),
+        max_score = MAX(max_score, excluded.max_score),
+        last_timestamp = MAX(COALESCE(last_timestamp, excluded.last_timestamp),
+                             COALESCE(excluded.last_timestamp, last_timestamp))
+"""
+
+
+def record_score(conn, user_id, subject, score, score_id):
+    """Folds one newly inserted score row into its rollup. Does not commit.
+
+    Scores may arrive out of order (journal replays, bulk imports of old
+    results), so last_timestamp only ever moves forward.
+    """
+    conn.execute(UPSERT_SQL, (user_id, subject, score, score, score, score_id))
+
+
+def total_quizzes(conn, user_id):
+    """Number of quizzes a user has completed, across all subjects."""
+    row = conn.execute("SELECT SUM(quiz_count) FROM score_rollups WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] or 0
+
+
+def user_summary(conn, user_id):
+    """Per-subject summary of a user's score history."""
+    rows = conn.execute("""
+        SELECT subject, quiz_count, score_sum, min_score, max_score, last_timestamp
+        FROM score_rollups WHERE user_id = ? ORDER BY subject
+    """, (user_id,)).fetchall()
+    return [{
+        "subject": row['subject'],
+        "quizzes": row['quiz_count'],
+        "average_score": row['score_sum'] / row['quiz_count'],
+        "best_score": row['max_score'],
+        "worst_score": row['min_score'],
+        "last_played": row['last_timestamp'],
+    } for row in rows]
+
+
+def rebuild(conn):
+    """Recomputes every rollup from the scores table and the archive in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM score_rollups")
+        conn.execute("""
+            INSERT INTO score_rollups
+            SELECT user_id, subject, COUNT(*), SUM(score), MIN(score), MAX(score), MAX(timestamp)
+            FROM scores GROUP BY user_id, subject
+        """)
+        conn.executemany(MERGE_SQL, archive.rollup_rows(conn))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM score_rollups").fetchone()[0]
+
+
+if __name__ == '__main__':
+    import db
+    import migrations
+
+    conn = db.get_connection()
+    migrations.migrate(conn)
+    print(f"--- Rebuilding score rollups in {db.DB_PATH} ---")
+    print(f"Rebuilt {rebuild(conn)} rollup rows.")
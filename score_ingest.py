@@ -0,0 +1,393 @@
+"""Write-behind score ingestion.
+
+POST /api/scores appends the submission to this process's journal
+(score_journal/<pid>.<segment>.jsonl, fsynced) and returns straight away. A single
+writer thread then drains submissions in batches: one transaction per batch
+inserts the scores, updates their rollups, runs badge evaluation once per
+user in the batch and publishes the students' new averages (events.py).
+
+Every submission carries a unique submission_id, stored in scores with a
+unique index, so replaying a journal never double-counts. At process start
+(and again in a forked worker's writer thread) the journals of processes
+that are no longer running are replayed and removed. The journal is written
+in segments of about SCORE_JOURNAL_SEGMENT_BYTES: a full one is closed for
+a fresh one, and removed once every submission in it has been committed, so
+under steady load the journal stays small and a restart replays little.
+
+Submissions are checked before they are journaled (BadSubmission, a 400).
+If a batch still fails, its entries are written one at a time: one that
+can never be written goes to score_journal/quarantine.jsonl with the error,
+and one that hit a busy or failing database is tried again after a
+backoff (RETRY_S, doubling up to SCORE_RETRY_MAX_S) while the writer goes
+on with the rest of the queue. A failed replay never stops the app from
+starting.
+"""
+import heapq
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import db
+import events
+from background import start_worker_thread
+import logs
+import response_cache
+import rollups
+
+JOURNAL_DIR = os.environ.get('SCORE_JOURNAL_DIR', 'score_journal')
+BATCH_WINDOW_MS = float(os.environ.get('SCORE_BATCH_WINDOW_MS', 20))
+BATCH_MAX = int(os.environ.get('SCORE_BATCH_MAX', 200))
+RETRY_S = float(os.environ.get('SCORE_RETRY_S', 1))
+RETRY_MAX_S = float(os.environ.get('SCORE_RETRY_MAX_S', 30))
+SEGMENT_BYTES = int(os.environ.get('SCORE_JOURNAL_SEGMENT_BYTES', 1 << 20))
+MAX_SUBJECT = 100
+
+log = logs.get_logger('scores')
+
+_queue = queue.Queue()  # (segment, entry, attempts)
+_journal_lock = threading.Lock()
+_journal = None  # this process's current journal segment
+_journal_pid = None
+_segment = 0
+_pending = {}  # segment -> its submissions not yet committed
+_own = set()  # paths of this process's segments, which recover() leaves alone
+_delayed = []  # heap of (due, n, item) waiting to be retried; writer thread only
+_delay_order = itertools.count()
+_award_badges = None
+_recovered_pid = None
+
+stats = {"submitted": 0, "committed": 0, "batches": 0, "replayed": 0, "quarantined": 0, "retried": 0}
+
+
+class BadSubmission(ValueError):
+    """A score submission with a missing or malformed field. app.py answers 400."""
+
+
+def _whole_number(data, field):
+    value = data.get(field)
+    # bool is an int subclass; 3.0 from a JS client is fine, 3.5 is not
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+        raise BadSubmission(f"{field} must be an integer")
+    return int(value)
+
+
+def parse_submission(data):
+    """(user_id, subject, score) from a request body, or BadSubmission."""
+    if not isinstance(data, dict):
+        raise BadSubmission("expected a JSON object")
+    user_id = _whole_number(data, 'user_id')
+    score = _whole_number(data, 'score')
+    subject = data.get('subject')
+    if not isinstance(subject, str) or not subject.strip() or len(subject) > MAX_SUBJECT:
+        raise BadSubmission(f"subject must be a non-empty string of at most {MAX_SUBJECT} characters")
+    return user_id, subject.strip(), score
+
+
+def configure(award_badges):
+    """Registers award_badges(conn, user_id, subject, score), run per user in each batch."""
+    global _award_badges
+    _award_badges = award_badges
+
+
+def _journal_path(pid, segment=0):
+    return os.path.join(JOURNAL_DIR, f"{pid}.{segment}.jsonl")
+
+
+def _open_journal():
+    # Caller holds _journal_lock. Reopened after fork so each process has its own.
+    global _journal, _journal_pid, _segment
+    if _journal is None or _journal_pid != os.getpid():
+        if _journal_pid != os.getpid():
+            _pending.clear()
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        _segment += 1
+        # A leftover from an earlier run with the same pid is for recover(), not to append to
+        while os.path.exists(_journal_path(os.getpid(), _segment)):
+            _segment += 1
+        path = _journal_path(os.getpid(), _segment)
+        _own.add(path)
+        _journal = open(path, 'a', encoding='utf-8')
+        _journal_pid = os.getpid()
+        _pending[_segment] = 0
+    return _journal
+
+
+def _compact_journal():
+    """Starts a new segment once the current one is full and removes committed ones.
+
+    Caller holds _journal_lock.
+    """
+    global _journal
+    if _journal is None or _journal_pid != os.getpid():
+        return
+    if _pending[_segment] == 0:
+        _journal.truncate(0)
+    elif _journal.tell() >= SEGMENT_BYTES:
+        _journal.close()
+        _journal = None
+        _open_journal()
+    for segment in [s for s, count in _pending.items() if count == 0 and s != _segment]:
+        path = _journal_path(os.getpid(), segment)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        _own.discard(path)
+        del _pending[segment]
+
+
+def uncommitted():
+    """Submissions this process has journaled but not yet committed."""
+    with _journal_lock:
+        return sum(_pending.values()) if _journal_pid == os.getpid() else 0
+
+
+def _ensure_writer():
+    start_worker_thread("score-writer", _run)
+
+
+def submit(user_id, subject, score):
+    """Durably records a score submission and queues it. Returns its id."""
+    entry = {
+        "submission_id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "subject": subject,
+        "score": score,
+        "timestamp": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    line = json.dumps(entry) + "\n"
+    _ensure_writer()
+    with _journal_lock:
+        journal = _open_journal()
+        journal.write(line)
+        journal.flush()
+        os.fsync(journal.fileno())
+        segment = _segment
+        _pending[segment] += 1
+        stats["submitted"] += 1
+    _queue.put((segment, entry, 0))
+    return entry["submission_id"]
+
+
+def write_batch(conn, entries):
+    """Inserts a batch of submissions in one transaction. Returns the number of new scores.
+
+    Submissions already in the table (e.g. from a replayed journal) are skipped.
+    """
+    inserted = []
+    for entry in entries:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO scores (user_id, subject, score, timestamp, submission_id) VALUES (?, ?, ?, ?, ?)",
+            (entry["user_id"], entry["subject"], entry["score"], entry["timestamp"], entry["submission_id"])
+        )
+        if cursor.rowcount == 1:
+            rollups.record_score(conn, entry["user_id"], entry["subject"], entry["score"], cursor.lastrowid)
+            inserted.append(entry)
+
+    # Badge rules read the user's rollups, so once per user covers the whole batch
+    last_by_user = {entry["user_id"]: entry for entry in inserted}
+    for entry in last_by_user.values():
+        _award_badges(conn, entry["user_id"], entry["subject"], entry["score"])
+    for user_id, subject in dict.fromkeys((entry["user_id"], entry["subject"]) for entry in inserted):
+        events.publish_score(conn, user_id, subject)
+    # New scores (and any badges) for these students
+    response_cache.bump(conn, *(f"user:{user_id}" for user_id in last_by_user))
+    conn.commit()
+    return len(inserted)
+
+
+def _due_retries():
+    due = []
+    while _delayed and _delayed[0][0] <= time.monotonic():
+        due.append(heapq.heappop(_delayed)[2])
+    return due
+
+
+def _collect():
+    """The next batch: retries now due, then whatever is queued within the window."""
+    batch = _due_retries()
+    if not batch:
+        # Waits no longer than the next retry is due
+        timeout = max(0.0, _delayed[0][0] - time.monotonic()) if _delayed else None
+        try:
+            batch.append(_queue.get(timeout=timeout))
+        except queue.Empty:
+            return _due_retries()
+    deadline = time.monotonic() + BATCH_WINDOW_MS / 1000.0
+    while len(batch) < BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _quarantine(entry, error):
+    with open(os.path.join(JOURNAL_DIR, 'quarantine.jsonl'), 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"entry": entry, "error": str(error)}, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    stats["quarantined"] += 1
+    log.error("Quarantined score submission %s: %s", entry.get("submission_id") if isinstance(entry, dict) else entry, error)
+
+
+def _write_each(conn, entries):
+    """Writes a failed batch one entry at a time. Returns (new scores, entries to try again later)."""
+    inserted, retry = 0, []
+    for entry in entries:
+        try:
+            inserted += write_batch(conn, [entry])
+        except sqlite3.OperationalError as e:
+            # Locked, disk full, I/O: nothing wrong with the entry itself
+            conn.rollback()
+            log.warning("Score submission will be retried: %s", e)
+            retry.append(entry)
+        except Exception as e:
+            conn.rollback()
+            _quarantine(entry, e)
+    return inserted, retry
+
+
+def _write(conn, entries):
+    """write_batch, falling back to _write_each. Returns (new scores, entries to try again later)."""
+    try:
+        return write_batch(conn, entries), []
+    except Exception as e:
+        conn.rollback()
+        log.warning("Batch of %d failed (%s); writing its entries one by one", len(entries), e)
+        return _write_each(conn, entries)
+
+
+def _run():
+    # In the writer rather than the first request; a no-op where app.py already ran it
+    if _recovered_pid != os.getpid():
+        recover()
+    conn = db.get_connection()
+    while True:
+        batch = _collect()
+        if not batch:
+            continue
+        finished = len(batch)
+        try:
+            _, retry = _write(conn, [entry for _, entry, _ in batch])
+            retrying = {id(entry) for entry in retry}
+            done = [item for item in batch if id(item[1]) not in retrying]
+            with _journal_lock:
+                # Written or quarantined; the ones to retry keep their segment
+                for segment, _, _ in done:
+                    if segment in _pending:
+                        _pending[segment] -= 1
+                stats["committed"] += len(done)
+                stats["batches"] += 1
+                _compact_journal()
+            for segment, entry, attempts in batch:
+                if id(entry) in retrying:
+                    due = time.monotonic() + min(RETRY_S * 2 ** attempts, RETRY_MAX_S)
+                    heapq.heappush(_delayed, (due, next(_delay_order), (segment, entry, attempts + 1)))
+            stats["retried"] += len(retry)
+            # A delayed entry stays unfinished, so flush() waits for it too
+            finished = len(done)
+        except Exception:
+            # e.g. the quarantine file can't be written: the journal keeps the batch for the next start
+            log.exception("Failed to write batch of %d", len(batch))
+        finally:
+            for _ in range(finished):
+                _queue.task_done()
+
+
+def flush():
+    """Blocks until every queued submission has been written (or quarantined)."""
+    _queue.join()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover():
+    """Replays journals left behind by processes that exited.
+
+    Runs once per process. This process's own segments are left alone,
+    while one from an earlier run that happened to share its pid is
+    replayed, so it may run after submissions have started. Never raises: a journal it can't finish is
+    left for the next start, reduced to the entries still to be written.
+    """
+    global _recovered_pid
+    _recovered_pid = os.getpid()
+    if not os.path.isdir(JOURNAL_DIR):
+        return 0
+    replayed = 0
+    try:
+        replayed = _replay_journals(db.get_connection())
+    except Exception:
+        log.exception("Replaying score journals failed; they are kept for the next start")
+    stats["replayed"] += replayed
+    if replayed:
+        log.info("Replayed %d journaled scores", replayed)
+    return replayed
+
+
+def _replay_journals(conn):
+    replayed = 0
+    for name in sorted(os.listdir(JOURNAL_DIR)):
+        # "<pid>.<segment>.jsonl", or "...jsonl.replaying.<replayer pid>" if a replay was interrupted
+        owner = name.split('.')[-1] if '.replaying.' in name else name.split('.')[0]
+        if not owner.isdigit():
+            continue
+        owner = int(owner)
+        if owner != os.getpid() and _pid_alive(owner):
+            continue
+        path = os.path.join(JOURNAL_DIR, name)
+        if path in _own:
+            continue
+        claimed = f"{path.split('.replaying.')[0]}.replaying.{os.getpid()}"
+        try:
+            # Atomic claim, so two workers starting together don't both replay it
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue
+        with open(claimed, encoding='utf-8') as f:
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write was never acknowledged
+                    continue
+        retry = []
+        for start in range(0, len(entries), BATCH_MAX):
+            inserted, failed = _write(conn, entries[start:start + BATCH_MAX])
+            replayed += inserted
+            retry += failed
+        if retry:
+            with open(claimed + '.tmp', 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in retry)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(claimed + '.tmp', claimed)
+            log.warning("%d journaled scores couldn't be written yet; kept in %s", len(retry), claimed)
+        else:
+            os.remove(claimed)
+    return replayed
+
+
+def get_stats():
+    snapshot = dict(stats)
+    snapshot["queued"] = _queue.qsize()
+    snapshot["uncommitted"] = uncommitted()
+    return snapshot
@@ -602,6 +602,8 @@ let userData = {
 };
 let userLang = "en", currentSubject = "", questionIndex = 0, score = 0;
 let currentQuiz = [];
+let studentEvents = null; // Live event stream for the logged-in student
+let quizStream = null; // { total, done, onQuestion } while a streamed quiz is still arriving
 
 
 // ---------------- DOM Elements ----------------
@@ -632,6 +634,8 @@ document.getElementById("student-logout-btn").addEventListener("click", logout);
 // ---------------- Authentication & Navigation ----------------
 function logout() {
     userData = { id: null, name: null };
+    if (studentEvents) studentEvents.close();
+    studentEvents = null;
     // Hide all main pages
     subjectPage.classList.add("hidden");
     quizPage.classList.add("hidden");
@@ -658,6 +662,7 @@ async function login() {
         userData.id = result.user_id;
         userData.name = result.username;
         loginPage.classList.add("hidden");
+        watchStudentEvents();
         showSubjects();
     } else {
         alert(`Login Failed: ${result.message}`);
@@ -686,29 +691,71 @@ async function register() {
 }
 
 
+// ---------------- Live Updates ----------------
+// Badges are pushed as they are awarded instead of re-fetching the profile.
+function watchStudentEvents() {
+    if (studentEvents) studentEvents.close();
+    studentEvents = new EventSource(`/api/events?user_id=${userData.id}`);
+    studentEvents.addEventListener('badge', (e) => {
+        JSON.parse(e.data).badges.forEach(badge => showToast(`${badge.icon || ''} New badge: ${badge.name}`));
+    });
+    studentEvents.addEventListener('enrollment', () => {
+        // A new class can bring new assignments
+        if (!subjectPage.classList.contains("hidden")) showSubjects();
+    });
+}
+
+function showToast(message) {
+    const toast = document.createElement("div");
+    toast.className = "toast";
+    toast.textContent = message;
+    document.body.appendChild(toast);
+    setTimeout(() => toast.remove(), 4000);
+}
+
+
 // ---------------- Scores & Profile Viewing ----------------
 async function viewScores() {
     if (!userData.id) return;
-    const response = await fetch(`/api/get_scores/${userData.id}`);
-    const scores = await response.json();
     const scoresListDiv = document.getElementById("scores-list");
     scoresListDiv.innerHTML = "";
+    await loadScoresPage(scoresListDiv, null);
+    subjectPage.classList.add("hidden");
+    scoresPage.classList.remove("hidden");
+}
 
-    if (scores.length === 0) {
-        scoresListDiv.innerHTML = "<p>You haven't completed any quizzes yet!</p>";
-    } else {
-        const table = document.createElement("table");
+// Score history comes a page at a time, newest first; older pages load on request
+async function loadScoresPage(scoresListDiv, cursor) {
+    const params = new URLSearchParams({ limit: 50 });
+    if (cursor) params.set("cursor", cursor);
+    const response = await fetch(`/api/get_scores/${userData.id}?${params}`);
+    const page = await response.json();
+
+    let table = scoresListDiv.querySelector("table");
+    if (!table) {
+        if (page.items.length === 0) {
+            scoresListDiv.innerHTML = "<p>You haven't completed any quizzes yet!</p>";
+            return;
+        }
+        table = document.createElement("table");
         table.innerHTML = `<tr><th>Subject</th><th>Score</th><th>Date</th></tr>`;
-        scores.forEach(score => {
-            const date = new Date(score.timestamp).toLocaleDateString();
-            const row = document.createElement("tr");
-            row.innerHTML = `<td>${score.subject}</td><td>${score.score}</td><td>${date}</td>`;
-            table.appendChild(row);
-        });
         scoresListDiv.appendChild(table);
     }
-    subjectPage.classList.add("hidden");
-    scoresPage.classList.remove("hidden");
+    page.items.forEach(score => {
+        const date = new Date(score.timestamp).toLocaleDateString();
+        const row = document.createElement("tr");
+        row.innerHTML = `<td>${score.subject}</td><td>${score.score}</td><td>${date}</td>`;
+        table.appendChild(row);
+    });
+
+    scoresListDiv.querySelector(".more-btn")?.remove();
+    if (page.next_cursor) {
+        const moreBtn = document.createElement("button");
+        moreBtn.className = "more-btn";
+        moreBtn.textContent = "Show older scores";
+        moreBtn.onclick = () => loadScoresPage(scoresListDiv, page.next_cursor);
+        scoresListDiv.appendChild(moreBtn);
+    }
 }
 
 async function viewProfile() {
@@ -863,21 +910,79 @@ async function startCustomQuiz(quizId, quizName) {
     const loadingOverlay = document.getElementById('loading-overlay');
     loadingOverlay.classList.remove('hidden');
 
-    const response = await fetch(`/api/quiz/${quizId}?lang=${userLang}`);
-    const questions = await response.json();
-    
-    loadingOverlay.classList.add('hidden');
+    if (userLang === 'en') {
+        // Nothing to translate: the server sends the quiz's pre-encoded JSON as is
+        const response = await fetch(`/api/quiz/${quizId}`);
+        loadingOverlay.classList.add('hidden');
+        if (!response.ok) return alert('Could not load this quiz, please try again in a moment.');
+        const questions = await response.json();
+        if (!questions.length) return alert('This quiz has no questions yet!');
+        return startQuizFlow(quizName, questions);
+    }
+
+    // Questions arrive one JSON object per line: {"total": n} first, then each
+    // question as soon as it is translated. The quiz starts on the first one.
+    const response = await fetch(`/api/quiz/${quizId}?lang=${userLang}&stream=1`);
+    if (!response.ok) {
+        loadingOverlay.classList.add('hidden');
+        return alert('Could not load this quiz, please try again in a moment.');
+    }
+    const questions = [];
+    const stream = { total: 0, done: false, onQuestion: null };
+    let started = false;
+
+    const onLine = (line) => {
+        const item = JSON.parse(line);
+        if (item.total !== undefined) {
+            stream.total = item.total;
+            return;
+        }
+        questions.push(item);
+        if (!started) {
+            started = true;
+            loadingOverlay.classList.add('hidden');
+            startQuizFlow(quizName, questions, stream);
+        } else if (stream.onQuestion) {
+            const resume = stream.onQuestion;
+            stream.onQuestion = null;
+            resume();
+        }
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    try {
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            lines.filter(line => line.trim()).forEach(onLine);
+        }
+        if (buffered.trim()) onLine(buffered);
+    } catch (error) {
+        console.error("Quiz stream interrupted:", error);
+    }
+    stream.done = true;
+    if (stream.onQuestion) {
+        // The stream ended short while the student was waiting; finish with what arrived
+        stream.onQuestion = null;
+        loadingOverlay.classList.add('hidden');
+        showResult();
+    }
 
-    if (questions.length === 0) {
+    if (!started) {
+        loadingOverlay.classList.add('hidden');
         return alert('This quiz has no questions yet!');
     }
-    
-    startQuizFlow(quizName, questions);
 }
 
-function startQuizFlow(subjectName, questions) {
+function startQuizFlow(subjectName, questions, stream = null) {
     currentSubject = subjectName;
     currentQuiz = questions;
+    quizStream = stream;
     score = 0;
     questionIndex = 0;
     subjectPage.classList.add("hidden");
@@ -939,8 +1044,17 @@ function checkAnswer(btn, correct) {
 
 function nextQuestion() {
     questionIndex++;
+    const total = quizStream ? quizStream.total : currentQuiz.length;
     if (questionIndex < currentQuiz.length) {
         loadQuestion();
+    } else if (questionIndex < total && !quizStream.done) {
+        // Caught up with a streamed quiz; carry on when the next question lands
+        const loadingOverlay = document.getElementById('loading-overlay');
+        loadingOverlay.classList.remove('hidden');
+        quizStream.onQuestion = () => {
+            loadingOverlay.classList.add('hidden');
+            loadQuestion();
+        };
     } else {
         showResult();
     }
@@ -2,11 +2,13 @@
 let teacherData = null;
 let currentQuizId = null;
 let analyticsChart = null; // To hold the chart instance
+let classEvents = null; // Live event stream for the selected class
 
 // --- DOM ELEMENTS ---
 const rosterManagementDiv = document.getElementById('roster-management');
 const unassignedStudentSelect = document.getElementById('unassigned-student-select');
 const enrollStudentBtn = document.getElementById('enroll-student-btn');
+const studentSearchInput = document.getElementById('student-search');
 const loginPage = document.getElementById('teacher-login-page');
 const dashboardPage = document.getElementById('dashboard-page');
 const loginBtn = document.getElementById('teacher-login-btn');
@@ -18,9 +20,17 @@ const addQuestionModal = document.getElementById('add-question-modal');
 
 // --- EVENT LISTENERS ---
 enrollStudentBtn.addEventListener('click', handleEnrollStudent);
+let studentSearchTimer = null;
+studentSearchInput.addEventListener('input', () => {
+    clearTimeout(studentSearchTimer);
+    studentSearchTimer = setTimeout(() => {
+        if (classSelect.value) loadUnassignedStudents(classSelect.value);
+    }, 250);
+});
 loginBtn.addEventListener('click', handleTeacherLogin);
 classSelect.addEventListener('change', handleClassSelection);
 document.getElementById('logout-btn').addEventListener('click', () => {
+    watchClass(null);
     dashboardPage.classList.add('hidden');
     loginPage.classList.remove('hidden');
     document.getElementById('teacher-username').value = '';
@@ -69,16 +79,16 @@ function populateClassDropdown(classes) {
 
 async function handleClassSelection() {
     const classId = classSelect.value;
+    watchClass(classId);
     if (classId) {
         rosterManagementDiv.classList.remove('hidden');
         loadUnassignedStudents(classId); // Load students for the selected class
     } else {
         rosterManagementDiv.classList.add('hidden');
     }
-    if (!classId) {
-        if (analyticsChart) analyticsChart.destroy();
-        return;
-    }
+    if (analyticsChart) analyticsChart.destroy();
+    analyticsChart = null;
+    if (!classId) return;
     const response = await fetch(`/api/teacher/analytics/${classId}`);
     if (!response.ok) {
         alert('Could not fetch analytics for this class.');
@@ -89,20 +99,27 @@ async function handleClassSelection() {
 }
 
 async function loadUnassignedStudents(classId) {
-    const response = await fetch(`/api/teacher/unassigned_students/${classId}`);
-    const students = await response.json();
+    // One page of matches; the search box narrows it server-side
+    const params = new URLSearchParams({ limit: 100, q: studentSearchInput.value.trim() });
+    const response = await fetch(`/api/teacher/unassigned_students/${classId}?${params}`);
+    const page = await response.json();
 
     unassignedStudentSelect.innerHTML = '<option value="">-- Select a student to add --</option>';
-    if (students.length === 0) {
-        unassignedStudentSelect.innerHTML = '<option value="">-- All students enrolled --</option>';
+    if (page.items.length === 0) {
+        unassignedStudentSelect.innerHTML = params.get('q')
+            ? '<option value="">-- No matching students --</option>'
+            : '<option value="">-- All students enrolled --</option>';
     }
     
-    students.forEach(student => {
+    page.items.forEach(student => {
         const option = document.createElement('option');
         option.value = student.id;
         option.textContent = student.username;
         unassignedStudentSelect.appendChild(option);
     });
+    if (page.next_cursor) {
+        unassignedStudentSelect.insertAdjacentHTML('beforeend', '<option value="" disabled>-- More students: refine the search --</option>');
+    }
 }
 
 async function handleEnrollStudent() {
@@ -142,6 +159,42 @@ function renderChart(data) {
     });
 }
 
+// --- LIVE UPDATES ---
+// New scores arrive as per-student averages and are patched into the chart,
+// so the analytics endpoint is only fetched when a class is selected.
+function watchClass(classId) {
+    if (classEvents && classEvents.classId === classId) return;
+    if (classEvents) classEvents.close();
+    classEvents = null;
+    if (!classId) return;
+
+    classEvents = new EventSource(`/api/events?class_id=${classId}`);
+    classEvents.classId = classId;
+    classEvents.addEventListener('score', (e) => applyScoreDelta(JSON.parse(e.data)));
+    classEvents.addEventListener('enrollment', () => loadUnassignedStudents(classId));
+}
+
+function applyScoreDelta(delta) {
+    if (!analyticsChart) {
+        // The class had no data yet; draw the chart from this first score
+        renderChart({ labels: [], datasets: [] });
+    }
+    const data = analyticsChart.data;
+    let column = data.labels.indexOf(delta.username);
+    if (column === -1) {
+        column = data.labels.push(delta.username) - 1;
+        data.datasets.forEach(ds => ds.data.push(0));
+    }
+    let dataset = data.datasets.find(ds => ds.label === delta.subject);
+    if (!dataset) {
+        const hue = (data.datasets.length * 67) % 360;
+        dataset = { label: delta.subject, data: data.labels.map(() => 0), backgroundColor: `hsla(${hue}, 70%, 50%, 0.5)` };
+        data.datasets.push(dataset);
+    }
+    dataset.data[column] = delta.average_score;
+    analyticsChart.update();
+}
+
 // --- QUIZ MANAGEMENT LOGIC ---
 async function loadTeacherQuizzes() {
     const response = await fetch(`/api/teacher/quizzes?teacher_id=${teacherData.teacher_id}`);
@@ -199,7 +252,7 @@ async function handleSaveQuestion() {
     await fetch('/api/teacher/questions', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ quiz_id: currentQuizId, question_text, options, correct_answer })
+        body: JSON.stringify({ quiz_id: currentQuizId, question_text, options, correct_answer, correct_index: correctIndex - 1 })
     });
 
     // Clear fields and hide modal
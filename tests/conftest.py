@@ -0,0 +1,55 @@
+"""Shared setup: the app on a throwaway database, journal and archive.
+
+The modules read their paths from the environment at import, so it is set
+here before anything from the app is imported. Run from the repository root:
+
+    python -m pytest -q
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix='gamified-tests-')
+os.environ.update(
+    DATABASE_PATH=os.path.join(_tmp, 'test.db'),
+    SCORE_JOURNAL_DIR=os.path.join(_tmp, 'score_journal'),
+    SCORE_ARCHIVE_DIR=os.path.join(_tmp, 'score_archive'),
+    SCORE_ARCHIVE_CHUNK='40',
+    SCORE_RETRY_S='0',
+    TRANSLATION_BACKEND='stub',
+    TRANSLATION_SERVICE_RETRY_S='0',
+)
+os.environ.pop('TRANSLATION_SERVICE_SOCKET', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as webapp  # noqa: E402
+import db  # noqa: E402
+import response_cache  # noqa: E402
+
+_names = itertools.count(1)
+
+
+@pytest.fixture
+def conn():
+    return db.get_connection()
+
+
+@pytest.fixture
+def client():
+    # Each test starts from cold response caches
+    with response_cache._lock:
+        response_cache._bodies.clear()
+    return webapp.app.test_client()
+
+
+@pytest.fixture
+def make_user(conn):
+    """Registers a student with a fresh username and returns their id."""
+    def make():
+        cursor = conn.execute("INSERT INTO users (username, password) VALUES (?, 'p')", (f"student{next(_names)}",))
+        conn.commit()
+        return cursor.lastrowid
+    return make
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+import archive
+import response_cache
+
+
+def history(client, user_id, query='', limit=7):
+    """Every page of a student's score history, following next_cursor."""
+    items, cursor = [], None
+    while True:
+        url = f'/api/get_scores/{user_id}?limit={limit}{query}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['items']) <= limit
+        items += page['items']
+        cursor = page['next_cursor']
+        if not cursor:
+            return items
+
+
+@pytest.fixture
+def students(conn, make_user):
+    """Three students with scores from 2023 to now, two sharing a class, one in two classes."""
+    cursor = conn.execute("INSERT INTO classes (class_name, teacher_id) VALUES ('7A', 1)")
+    first_class = cursor.lastrowid
+    second_class = conn.execute("INSERT INTO classes (class_name, teacher_id) VALUES ('7B', 1)").lastrowid
+    user_ids = [make_user() for _ in range(3)]
+    conn.executemany("INSERT INTO enrollments (user_id, class_id) VALUES (?, ?)",
+                     [(user_ids[0], first_class), (user_ids[0], second_class), (user_ids[1], first_class)])
+    rng = random.Random(25)
+    rows = []
+    for _ in range(150):
+        year = rng.choice([2023, 2024, 2026])
+        month = rng.randint(1, 12) if year < 2026 else rng.randint(9, 10)
+        # Repeated timestamps, so paging has to break ties on the id
+        rows.append((rng.choice(user_ids), rng.choice(['Maths', 'Physics']), rng.randint(0, 20),
+                     f"{year}-{month:02}-{rng.randint(1, 3):02} 10:00:00"))
+    conn.executemany("INSERT INTO scores (user_id, subject, score, timestamp) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    return user_ids
+
+
+QUERIES = ['', '&subject=Maths', '&since=2023-06-01&until=2024-03-31', '&since=2024-12-01', '&fields=id,score']
+
+
+def test_history_pages_are_unchanged_by_archiving(client, conn, students):
+    before = {(u, q): history(client, u, q) for u in students for q in QUERIES}
+    assert all(before[u, ''] for u in students)
+
+    assert archive.archive_scores(conn, '2025-01-01') > 0
+    live = conn.execute(f"SELECT COUNT(*) FROM scores WHERE user_id IN ({','.join('?' * len(students))})",
+                        students).fetchone()[0]
+    assert 0 < live < sum(len(before[u, '']) for u in students)
+
+    # Archiving doesn't change what a student sees, so nothing bumped the cached pages
+    with response_cache._lock:
+        response_cache._bodies.clear()
+    after = {(u, q): history(client, u, q) for u in students for q in QUERIES}
+    assert after == before
+
+
+def test_history_opens_only_the_students_files(client, conn, students, make_user, monkeypatch):
+    archive.archive_scores(conn, '2025-01-01')
+    opened = []
+    scan = archive._scan
+
+    def recording_scan(files, columns, filters):
+        opened.extend(files)
+        return scan(files, columns, filters)
+    monkeypatch.setattr(archive, '_scan', recording_scan)
+
+    history(client, students[1], '&until=2024-12-31')
+    months = {m for (m,) in conn.execute(
+        "SELECT DISTINCT month FROM score_archive_users WHERE user_id = ?", (students[1],))}
+    assert opened and {path.split('month=')[1][:7] for path, _ in opened} <= months
+
+    opened.clear()
+    assert history(client, make_user()) == []
+    assert opened == []
+
+
+@pytest.mark.parametrize('url', [
+    '/api/get_scores/1?since=2024-13-01',
+    '/api/get_scores/1?until=yesterday',
+    '/api/teacher/analytics?class_id=1&start=2024/01/01',
+    '/api/teacher/analytics?class_id=1&end=2024-02-30',
+    '/api/teacher/report/1?start=01-01-2024',
+    '/api/teacher/report/1?end=2024-1-1x',
+])
+def test_malformed_dates_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert 'YYYY-MM-DD' in response.get_data(as_text=True)
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import assets
+
+
+@pytest.fixture
+def dist(tmp_path, monkeypatch):
+    """A fresh build in its own directory."""
+    monkeypatch.setattr(assets, 'DIST_DIR', str(tmp_path))
+    monkeypatch.setattr(assets, 'MANIFEST_PATH', str(tmp_path / 'manifest.json'))
+    monkeypatch.setattr(assets, 'BUILD_ON_START', True)
+    monkeypatch.setattr(assets, '_manifest', None)
+    return assets.load()
+
+
+def test_missing_built_asset_falls_back_to_its_source(client, dist):
+    built = dist["assets"]["script.js"]
+    assert client.get(f'/assets/{built}').headers['Cache-Control'] == assets.IMMUTABLE
+
+    for name in os.listdir(assets.DIST_DIR):
+        if name.startswith(built):
+            os.remove(os.path.join(assets.DIST_DIR, name))
+    response = client.get(f'/assets/{built}')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    with open(os.path.join(assets.STATIC_DIR, 'script.js'), 'rb') as f:
+        assert response.get_data() == f.read()
+
+
+def test_missing_built_page_falls_back_to_the_source_page(client, dist):
+    for name in os.listdir(assets.DIST_DIR):
+        if name.startswith('index.html'):
+            os.remove(os.path.join(assets.DIST_DIR, name))
+    assert client.get('/').status_code == 200
+
+
+def test_workers_forked_after_prebuild_only_read_the_manifest(dist, monkeypatch):
+    assets.prebuild()
+
+    def build():
+        raise AssertionError("rebuilt after prebuild()")
+    monkeypatch.setattr(assets, 'build', build)
+    monkeypatch.setattr(assets, '_source_digest', lambda sources: 'changed')
+    assert assets.load() == dist
@@ -0,0 +1,28 @@
+import json
+
+import events
+
+
+def import_enrollments(client, body):
+    response = client.post('/api/bulk/enrollments/import', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_duplicate_enrollments_publish_and_invalidate_nothing(client, conn, make_user):
+    class_id = conn.execute("INSERT INTO classes (class_name, teacher_id) VALUES ('8C', 1)").lastrowid
+    users = [make_user(), make_user()]
+    conn.commit()
+    body = "class_id,user_id\n" + "".join(f"{class_id},{u}\n" for u in users + users[:1])
+
+    report = import_enrollments(client, body)
+    assert (report["imported"], report["skipped"]) == (2, 1)
+    [(_, _, payload)] = events.replay(conn, [f"class:{class_id}"], 0)
+    assert json.loads(payload)["user_ids"] == users
+
+    versions_before = conn.execute("SELECT scope, version FROM cache_versions ORDER BY scope").fetchall()
+    last_event = conn.execute("SELECT MAX(id) FROM events").fetchone()[0]
+    report = import_enrollments(client, body)
+    assert (report["imported"], report["skipped"]) == (0, 3)
+    assert conn.execute("SELECT MAX(id) FROM events").fetchone()[0] == last_event
+    assert conn.execute("SELECT scope, version FROM cache_versions ORDER BY scope").fetchall() == versions_before
@@ -0,0 +1,19 @@
+import events
+
+
+def test_replay_is_not_crowded_out_by_other_channels(conn, monkeypatch):
+    monkeypatch.setattr(events, 'REPLAY_MAX', 5)
+    after = conn.execute("SELECT IFNULL(MAX(id), 0) FROM events").fetchone()[0]
+    mine = []
+    for i in range(40):
+        events.publish(conn, 'score', ['class:9001'], {"i": i})
+        if i % 4 == 0:
+            events.publish(conn, 'badge', ['user:9002', 'class:9003'], {"i": i})
+            mine.append(conn.execute("SELECT MAX(id) FROM events").fetchone()[0])
+    conn.commit()
+
+    backlog = events.replay(conn, ['user:9002', 'class:9003'], after)
+    # Each event once, even though it is on both of the client's channels, and in order
+    assert [event_id for event_id, _, _ in backlog] == mine
+    assert events.replay(conn, ['user:9002'], mine[5]) == backlog[6:]
+    assert events.replay(conn, ['class:9004'], after) == []
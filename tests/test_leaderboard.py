@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-5', 'offset=-1', 'limit=ten', 'offset=1.5'])
+def test_out_of_range_paging_is_rejected(client, query):
+    response = client.get(f'/api/leaderboard?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_large_limit_is_capped_not_rejected(client):
+    response = client.get('/api/leaderboard?limit=1000&offset=0')
+    assert response.status_code == 200
+    assert len(response.get_json()['top']) <= 100
@@ -0,0 +1,24 @@
+import json
+import sqlite3
+
+import migrations
+
+
+def test_unmatched_correct_answer_is_flagged_not_dropped(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'v7.db'), isolation_level=None)
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', [m for m in migrations.MIGRATIONS if m[0] <= 7])
+        patch.setattr(migrations, 'LATEST_VERSION', 7)
+        migrations.migrate(conn)
+    conn.executemany("INSERT INTO questions (quiz_id, question_text, options, correct_answer) VALUES (1, ?, ?, ?)", [
+        ("2 + 2 = ?", json.dumps(["3", "4"]), "4"),
+        ("Capital of Italy?", json.dumps(["Paris", "Madrid"]), "Rome"),
+    ])
+    warnings = []
+    monkeypatch.setattr(migrations.log, 'warning', lambda *args: warnings.append(args))
+
+    migrations.migrate(conn)
+
+    assert conn.execute("SELECT id, correct_index FROM questions ORDER BY id").fetchall() == [(1, 1), (2, None)]
+    assert conn.execute("SELECT question_id, correct_answer FROM unmatched_answers").fetchall() == [(2, "Rome")]
+    assert len(warnings) == 1 and warnings[0][-1] == [2]
@@ -0,0 +1,22 @@
+from collections import OrderedDict
+
+import model_registry
+
+
+def test_old_model_is_evicted_before_the_new_one_loads(monkeypatch):
+    monkeypatch.setattr(model_registry, '_loaded', OrderedDict())
+    monkeypatch.setattr(model_registry, '_measured', {})
+    monkeypatch.setattr(model_registry, 'MEMORY_BUDGET_MB', model_registry.DEFAULT_MODEL_MB * 1.5)
+    resident_at_load = []
+    load_pipeline = model_registry.load_pipeline
+
+    def recording_load(lang, backend=None):
+        resident_at_load.append(list(model_registry._loaded))
+        return load_pipeline(lang, backend)
+    monkeypatch.setattr(model_registry, 'load_pipeline', recording_load)
+
+    model_registry.get_translator('fr')
+    model_registry.get_translator('de')
+
+    assert resident_at_load == [[], []]
+    assert [entry["lang"] for entry in model_registry.loaded_models()] == ['de']
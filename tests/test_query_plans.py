@@ -0,0 +1,128 @@
+"""Fails if any route query makes SQLite scan a whole table.
+
+Calls every API route through Flask's test client while tracing the SQL it
+runs, and checks the EXPLAIN QUERY PLAN of each SELECT. A plan step of
+"SCAN <table>" (with or without an index) means a full pass over the table
+and fails the route's test, unless the query is listed in ALLOWED_SCANS
+with the reason it has to read everything.
+"""
+import pytest
+
+import db
+import paging
+import score_ingest
+from translation_cache import translate_cached
+
+# Query text fragment -> why a full scan is expected
+ALLOWED_SCANS = {
+    "SELECT user_id, subject, score_sum FROM score_rollups": "one-time leaderboard build",
+    "SELECT rowid, user_id, class_id FROM enrollments": "one-time leaderboard build",
+    "FROM score_archive": "one row per archived chunk of scores",
+}
+
+
+def write_scores(client, ids):
+    for score in (20, 10, 15):
+        client.post('/api/scores', json={'user_id': ids['user'], 'subject': 'Maths', 'score': score})
+    score_ingest.flush()
+    # Scores are written by the ingest thread; run its queries here so they are traced
+    score_ingest.write_batch(db.get_connection(), [{'submission_id': f"plan-check-{ids['user']}", 'user_id': ids['user'],
+                                                    'subject': 'Maths', 'score': 20, 'timestamp': '2024-01-01 00:00:00'}])
+
+
+def reconnect_events(client, ids):
+    # The backlog read of a reconnecting event stream
+    client.get(f"/api/events?user_id={ids['user']}&class_id={ids['class']}", headers={'Last-Event-ID': '1'},
+               buffered=False).close()
+
+
+def translate(client, ids):
+    # The translated-quiz path, with an identity "translator" so no model loads
+    translate_cached(lambda texts: [{'translation_text': t} for t in texts], 'plan-check', 'fr', ['2 + 2 = ?'])
+
+
+# Run in order, each against the rows the earlier ones wrote
+STEPS = [
+    ('login', lambda c, i: c.post('/api/login', json={'username': i['username'], 'password': 'pass'})),
+    ('teacher login', lambda c, i: c.post('/api/teacher/login', json={'username': i['teacher_name'], 'password': 'pass'})),
+    ('enroll', lambda c, i: c.post('/api/teacher/enroll', json={'user_id': i['user'], 'class_id': i['class']})),
+    ('add question', lambda c, i: c.post('/api/teacher/questions', json={
+        'quiz_id': i['quiz'], 'question_text': '2 + 2 = ?', 'options': ['3', '4'], 'correct_answer': '4'})),
+    ('assign', lambda c, i: c.post('/api/teacher/assign', json={'quiz_id': i['quiz'], 'class_id': i['class']})),
+    ('scores', write_scores),
+    ('badges', lambda c, i: c.get(f"/api/get_badges/{i['user']}")),
+    ('score history', lambda c, i: c.get(f"/api/get_scores/{i['user']}")),
+    ('score history page', lambda c, i: c.get(
+        f"/api/get_scores/{i['user']}?limit=1&subject=Maths&since=2020-01-01&until=2099-12-31&cursor="
+        + paging.encode_cursor(['2099-01-01 00:00:00', 99]))),
+    ('score summary', lambda c, i: c.get(f"/api/get_score_summary/{i['user']}")),
+    ('class analytics', lambda c, i: c.get(f"/api/teacher/analytics/{i['class']}")),
+    ('multi-class analytics', lambda c, i: c.get(
+        f"/api/teacher/analytics?class_id={i['class']},{i['class'] + 1}&start=2020-01-01&end=2099-12-31")),
+    ('class report', lambda c, i: c.get(f"/api/teacher/report/{i['class']}?by=month&start=2020-01-01&end=2099-12-31")),
+    ('teacher quizzes', lambda c, i: c.get(f"/api/teacher/quizzes?teacher_id={i['teacher']}")),
+    ('assignments', lambda c, i: c.get(f"/api/student/assignments/{i['user']}")),
+    ('quiz', lambda c, i: c.get(f"/api/quiz/{i['quiz']}")),
+    ('unassigned students', lambda c, i: c.get(f"/api/teacher/unassigned_students/{i['class']}")),
+    ('unassigned students page', lambda c, i: c.get(
+        f"/api/teacher/unassigned_students/{i['class']}?q=stu&cursor=" + paging.encode_cursor([0]))),
+    ('global leaderboard', lambda c, i: c.get(f"/api/leaderboard?user_id={i['user']}")),
+    ('class leaderboard', lambda c, i: c.get(f"/api/leaderboard/class/{i['class']}?user_id={i['user']}")),
+    ('subject leaderboard', lambda c, i: c.get(f"/api/leaderboard/subject/Maths?user_id={i['user']}")),
+    ('window leaderboard', lambda c, i: c.get(f"/api/leaderboard/window/week?user_id={i['user']}")),
+    ('event replay', reconnect_events),
+    ('bulk enrollments import', lambda c, i: c.post(
+        '/api/bulk/enrollments/import', data=f'{{"class_id": {i["class"]}, "username": "{i["username"]}"}}\n',
+        content_type='application/x-ndjson')),
+    ('bulk questions import', lambda c, i: c.post(
+        '/api/bulk/questions/import', data=f"quiz_id,question_text,options,correct_answer\n{i['quiz']},3 + 3 = ?,5|6,6\n",
+        content_type='text/csv')),
+    ('bulk scores import', lambda c, i: c.post(
+        '/api/bulk/scores/import', data=f"user_id,subject,score,timestamp\n{i['user']},Maths,12,2024-01-02 00:00:00\n",
+        content_type='text/csv')),
+    ('questions export', lambda c, i: c.get(f"/api/bulk/questions/export?quiz_id={i['quiz']}")),
+    ('enrollments export', lambda c, i: c.get(f"/api/bulk/enrollments/export?class_id={i['class']}")),
+    ('scores export by class', lambda c, i: c.get(
+        f"/api/bulk/scores/export?format=csv&class_id={i['class']}&since=2020-01-01&until=2099-12-31")),
+    ('scores export by user', lambda c, i: c.get(f"/api/bulk/scores/export?user_id={i['user']}")),
+    ('translation cache', translate),
+]
+
+
+def full_scans(conn, statement):
+    plan = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+    # Scans of a subquery's own rows (e.g. one question's options, in order) aren't table scans
+    return [row[3] for row in plan
+            if row[3].startswith('SCAN ') and row[3] != 'SCAN CONSTANT ROW' and not row[3].startswith('SCAN (subquery')]
+
+
+@pytest.fixture(scope='module')
+def ids():
+    conn = db.get_connection()
+    teacher = conn.execute("INSERT INTO teachers (username, password) VALUES ('plans_teacher', 'pass')").lastrowid
+    class_id = conn.execute("INSERT INTO classes (class_name, teacher_id) VALUES ('Grade 5 Physics', ?)",
+                            (teacher,)).lastrowid
+    user = conn.execute("INSERT INTO users (username, password) VALUES ('plans_student', 'pass')").lastrowid
+    quiz = conn.execute("INSERT INTO quizzes (name, teacher_id) VALUES ('Quiz 1', ?)", (teacher,)).lastrowid
+    conn.commit()
+    return {'teacher': teacher, 'teacher_name': 'plans_teacher', 'class': class_id,
+            'user': user, 'username': 'plans_student', 'quiz': quiz}
+
+
+@pytest.mark.parametrize('step', [step for _, step in STEPS], ids=[label for label, _ in STEPS])
+def test_route_queries_use_indexes(client, conn, ids, step):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        response = step(client, ids)
+        if response is not None:
+            # Exports stream, so their queries run as the body is read
+            response.get_data()
+    finally:
+        conn.set_trace_callback(None)
+
+    assert statements
+    selects = [s.strip() for s in dict.fromkeys(statements) if s.lstrip().upper().startswith('SELECT')]
+    scans = {statement: full_scans(conn, statement) for statement in selects
+             if not any(fragment in statement for fragment in ALLOWED_SCANS)}
+    assert {statement: found for statement, found in scans.items() if found} == {}
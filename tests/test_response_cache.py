@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+
+import response_cache
+
+
+def set_updated_at(conn, scope, stamp):
+    response_cache.bump(conn, scope)
+    conn.execute("UPDATE cache_versions SET updated_at = ? WHERE scope = ?", (stamp, scope))
+    conn.commit()
+
+
+def test_if_modified_since_answers_once_the_second_is_over(client, conn, make_user):
+    user_id = make_user()
+    set_updated_at(conn, f"user:{user_id}", '2024-01-01 10:00:00')
+    response = client.get(f'/api/get_badges/{user_id}')
+    since = response.headers['Last-Modified']
+    assert client.get(f'/api/get_badges/{user_id}', headers={'If-Modified-Since': since}).status_code == 304
+
+    response_cache.bump(conn, f"user:{user_id}")
+    conn.commit()
+    assert client.get(f'/api/get_badges/{user_id}', headers={'If-Modified-Since': since}).status_code == 200
+
+
+def test_a_change_in_the_current_second_is_not_hidden_by_if_modified_since(client, conn, make_user):
+    user_id = make_user()
+    response_cache.bump(conn, f"user:{user_id}")
+    conn.commit()
+    response = client.get(f'/api/get_badges/{user_id}')
+    assert 'Last-Modified' not in response.headers
+
+    # A client holding a date in this same second still gets the page, as a second bump may follow
+    now = datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+    assert client.get(f'/api/get_badges/{user_id}', headers={'If-Modified-Since': now}).status_code == 200
+
+
+def test_etag_is_checked_before_if_modified_since(client, conn, make_user):
+    user_id = make_user()
+    set_updated_at(conn, f"user:{user_id}", '2024-01-01 10:00:00')
+    first = client.get(f'/api/get_badges/{user_id}')
+    set_updated_at(conn, f"user:{user_id}", '2024-01-01 10:00:00')
+
+    # The date still matches, but the version (and so the ETag) moved on
+    response = client.get(f'/api/get_badges/{user_id}', headers={
+        'If-None-Match': first.headers['ETag'], 'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != first.headers['ETag']
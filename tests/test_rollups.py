@@ -0,0 +1,41 @@
+import rollups
+
+
+def add_score(conn, user_id, score, timestamp):
+    score_id = conn.execute("INSERT INTO scores (user_id, subject, score, timestamp) VALUES (?, 'Maths', ?, ?)",
+                            (user_id, score, timestamp)).lastrowid
+    rollups.record_score(conn, user_id, 'Maths', score, score_id)
+    conn.commit()
+
+
+def rollup(conn, user_id):
+    return tuple(conn.execute(
+        "SELECT quiz_count, score_sum, min_score, max_score, last_timestamp FROM score_rollups "
+        "WHERE user_id = ? AND subject = 'Maths'", (user_id,)).fetchone())
+
+
+def test_an_older_score_does_not_move_last_timestamp_back(conn, make_user):
+    user_id = make_user()
+    add_score(conn, user_id, 10, '2026-05-02 09:00:00')
+    add_score(conn, user_id, 4, '2024-01-15 12:00:00')
+    assert rollup(conn, user_id) == (2, 14, 4, 10, '2026-05-02 09:00:00')
+
+    add_score(conn, user_id, 7, '2026-05-03 08:00:00')
+    assert rollup(conn, user_id)[4] == '2026-05-03 08:00:00'
+
+
+def test_a_rollup_without_a_timestamp_takes_the_first_one(conn, make_user):
+    user_id = make_user()
+    conn.execute("INSERT INTO score_rollups (user_id, subject, quiz_count, score_sum, min_score, max_score, last_timestamp) "
+                 "VALUES (?, 'Maths', 1, 5, 5, 5, NULL)", (user_id,))
+    add_score(conn, user_id, 8, '2025-03-01 10:00:00')
+    assert rollup(conn, user_id) == (2, 13, 5, 8, '2025-03-01 10:00:00')
+
+
+def test_rebuild_matches_incremental_rollups(conn, make_user):
+    user_id = make_user()
+    for score, timestamp in ((3, '2025-06-01 10:00:00'), (9, '2023-02-01 10:00:00'), (6, '2025-01-01 10:00:00')):
+        add_score(conn, user_id, score, timestamp)
+    incremental = rollup(conn, user_id)
+    rollups.rebuild(conn)
+    assert rollup(conn, user_id) == incremental == (3, 18, 3, 9, '2025-06-01 10:00:00')
@@ -0,0 +1,172 @@
+import glob
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+import score_ingest
+
+
+def score_count(conn, user_id):
+    return conn.execute("SELECT COUNT(*) FROM scores WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def own_segments():
+    return glob.glob(os.path.join(score_ingest.JOURNAL_DIR, f"{os.getpid()}.*.jsonl"))
+
+
+def journal_size():
+    return sum(os.path.getsize(path) for path in own_segments())
+
+
+def dead_pid():
+    pid = 999_999
+    while score_ingest._pid_alive(pid):
+        pid -= 1
+    return pid
+
+
+def test_submission_is_acknowledged_then_written(client, conn, make_user):
+    user_id = make_user()
+    response = client.post('/api/scores', json={"user_id": user_id, "subject": "Maths", "score": 12})
+    assert response.status_code == 202
+    score_ingest.flush()
+    row = conn.execute("SELECT subject, score, submission_id FROM scores WHERE user_id = ?", (user_id,)).fetchone()
+    assert tuple(row) == ("Maths", 12, response.get_json()["submission_id"])
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    [1, 2],
+    {"subject": "Maths", "score": 1},
+    {"user_id": {"x": 1}, "subject": "Maths", "score": 1},
+    {"user_id": True, "subject": "Maths", "score": 1},
+    {"user_id": 1, "subject": "", "score": 1},
+    {"user_id": 1, "subject": "x" * 101, "score": 1},
+    {"user_id": 1, "subject": "Maths", "score": "7"},
+    {"user_id": 1, "subject": "Maths", "score": 7.5},
+])
+def test_malformed_submission_is_rejected_before_journaling(client, body):
+    submitted, size = score_ingest.stats["submitted"], journal_size()
+    response = client.post('/api/scores', json=body)
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+    assert (score_ingest.stats["submitted"], journal_size()) == (submitted, size)
+
+
+def test_unknown_user_is_rejected(client):
+    submitted = score_ingest.stats["submitted"]
+    response = client.post('/api/scores', json={"user_id": 10 ** 9, "subject": "Maths", "score": 1})
+    assert response.status_code == 400
+    assert score_ingest.stats["submitted"] == submitted
+
+
+def test_bad_entry_is_quarantined_and_the_rest_of_its_batch_written(client, conn, make_user):
+    user_id = make_user()
+    quarantined = score_ingest.stats["quarantined"]
+    score_ingest._ensure_writer()
+    bad = {"submission_id": "bad-entry", "user_id": {"x": 1}, "subject": "Maths", "score": 1,
+           "timestamp": "2024-01-01 00:00:00"}
+    score_ingest._queue.put((None, bad, 0))
+    for score in (3, 4, 5):
+        client.post('/api/scores', json={"user_id": user_id, "subject": "Maths", "score": score})
+    score_ingest.flush()
+
+    assert score_count(conn, user_id) == 3
+    assert score_ingest.stats["quarantined"] == quarantined + 1
+    assert score_ingest.uncommitted() == 0
+    with open(os.path.join(score_ingest.JOURNAL_DIR, 'quarantine.jsonl'), encoding='utf-8') as f:
+        assert json.loads(f.readlines()[-1])["entry"]["submission_id"] == "bad-entry"
+
+
+def test_recover_replays_a_dead_process_journal_once(conn, make_user):
+    user_id = make_user()
+    entries = [{"submission_id": f"replay-{user_id}-{i}", "user_id": user_id, "subject": "Physics", "score": i,
+                "timestamp": "2024-02-01 10:00:00"} for i in range(3)]
+    os.makedirs(score_ingest.JOURNAL_DIR, exist_ok=True)
+    path = score_ingest._journal_path(dead_pid())
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        f.write('{"submission_id": "torn')  # a crash mid-write, never acknowledged
+
+    assert score_ingest.recover() == 3
+    assert score_count(conn, user_id) == 3
+    assert not os.path.exists(path)
+
+    # The same journal again (e.g. a replay interrupted before its file was removed) adds nothing
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+    assert score_ingest.recover() == 0
+    assert score_count(conn, user_id) == 3
+
+
+def test_recover_keeps_entries_it_cannot_write_yet(conn, make_user, monkeypatch):
+    user_id = make_user()
+    entry = {"submission_id": f"locked-{user_id}", "user_id": user_id, "subject": "Maths", "score": 9,
+             "timestamp": "2024-03-01 10:00:00"}
+    path = score_ingest._journal_path(dead_pid())
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + "\n")
+    monkeypatch.setattr(score_ingest, '_write', lambda conn, entries: (0, list(entries)))
+
+    assert score_ingest.recover() == 0
+    leftover = [name for name in os.listdir(score_ingest.JOURNAL_DIR) if '.replaying.' in name]
+    assert len(leftover) == 1
+    with open(os.path.join(score_ingest.JOURNAL_DIR, leftover[0]), encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [entry]
+
+    monkeypatch.undo()
+    assert score_ingest.recover() == 1
+    assert score_count(conn, user_id) == 1
+
+
+def test_recover_never_raises(monkeypatch):
+    def broken(conn):
+        raise RuntimeError("disk on fire")
+    monkeypatch.setattr(score_ingest, '_replay_journals', broken)
+    assert score_ingest.recover() == 0
+
+
+def test_journal_segments_are_removed_once_committed(client, conn, make_user, monkeypatch):
+    user_id = make_user()
+    monkeypatch.setattr(score_ingest, 'SEGMENT_BYTES', 300)
+    for score in range(30):
+        client.post('/api/scores', json={"user_id": user_id, "subject": "Maths", "score": score})
+        if score % 7 == 0:
+            score_ingest.flush()
+    score_ingest.flush()
+
+    assert score_count(conn, user_id) == 30
+    # Only the current segment is left, emptied
+    assert len(own_segments()) == 1
+    assert journal_size() == 0
+
+
+def test_a_retried_submission_does_not_hold_up_the_queue(client, conn, make_user, monkeypatch):
+    user_id = make_user()
+    monkeypatch.setattr(score_ingest, 'RETRY_S', 1.5)
+    write_batch, failed = score_ingest.write_batch, []
+
+    def locked_twice(conn, entries):
+        # Both the batch and the one-by-one attempt after it hit the lock
+        if any(entry["score"] == 99 for entry in entries) and len(failed) < 2:
+            failed.append(True)
+            raise sqlite3.OperationalError("database is locked")
+        return write_batch(conn, entries)
+    monkeypatch.setattr(score_ingest, 'write_batch', locked_twice)
+
+    client.post('/api/scores', json={"user_id": user_id, "subject": "Maths", "score": 99})
+    time.sleep(0.1)
+    started = time.monotonic()
+    for score in (1, 2):
+        client.post('/api/scores', json={"user_id": user_id, "subject": "Maths", "score": score})
+    while score_count(conn, user_id) < 2 and time.monotonic() - started < 1:
+        time.sleep(0.02)
+    assert score_count(conn, user_id) == 2
+    assert time.monotonic() - started < 1
+
+    score_ingest.flush()
+    assert score_count(conn, user_id) == 3
+    assert score_ingest.uncommitted() == 0
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+import model_registry
+import pretranslate
+import translation_service
+
+OPTIONS = [(["3", "4"], "4"), (["Paris", "Rome"], "Paris")]
+
+
+@pytest.fixture
+def quiz(client, monkeypatch):
+    """(quiz id, its question texts), with nothing translated ahead of time."""
+    monkeypatch.setattr(pretranslate, 'enqueue_quiz', lambda quiz_id: None)
+    quiz_id = client.post('/api/teacher/quizzes', json={"name": "Arithmetic", "teacher_id": 1}).get_json()["quiz_id"]
+    # Texts unique to the quiz, so no earlier test's translations are in the cache
+    texts = [f"Question {i} of quiz {quiz_id}?" for i in range(len(OPTIONS))]
+    for text, (options, answer) in zip(texts, OPTIONS):
+        client.post('/api/teacher/questions', json={"quiz_id": quiz_id, "question_text": text,
+                                                    "options": options, "correct_answer": answer})
+    return quiz_id, texts
+
+
+@pytest.fixture
+def service_down(tmp_path, monkeypatch):
+    """Sends translations to a translation service socket nobody listens on."""
+    monkeypatch.setattr(translation_service, 'SOCKET_PATH', str(tmp_path / 'missing.sock'))
+    monkeypatch.setattr(model_registry, '_remote', {})
+
+
+def english(questions):
+    return [q["q"] for q in questions]
+
+
+def read_stream(response):
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {"total": len(OPTIONS)}
+    return lines[1:]
+
+
+def test_english_is_served_from_the_compiled_payload_and_revalidated(client, quiz):
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}')
+    assert response.status_code == 200
+    assert english(response.get_json()) == texts
+    etag = response.headers['ETag']
+    assert client.get(f'/api/quiz/{quiz_id}', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_language_without_a_model_gets_english(client, quiz):
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}?lang=xx')
+    assert english(response.get_json()) == texts
+
+
+def test_translated_quiz_is_cached(client, quiz):
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}?lang=fr')
+    assert response.status_code == 200
+    assert len(response.get_json()) == len(texts)
+    assert 'ETag' in response.headers
+
+
+def test_english_fallback_is_neither_cached_nor_etagged(client, quiz, service_down):
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}?lang=fr')
+    assert response.status_code == 200
+    assert english(response.get_json()) == texts
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_translation_is_served_once_the_service_is_back(client, quiz, monkeypatch):
+    quiz_id, _ = quiz
+    with monkeypatch.context() as patch:
+        patch.setattr(translation_service, 'SOCKET_PATH', '/nonexistent/translation.sock')
+        patch.setattr(model_registry, '_remote', {})
+        assert 'ETag' not in client.get(f'/api/quiz/{quiz_id}?lang=fr').headers
+    # The fallback wasn't kept, so this one is translated (and cacheable) again
+    assert 'ETag' in client.get(f'/api/quiz/{quiz_id}?lang=fr').headers
+
+
+def test_fallback_stream_is_not_etagged(client, quiz, service_down):
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}?lang=fr&stream=1')
+    assert english(read_stream(response)) == texts
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_translated_stream_is_not_etagged(client, quiz):
+    # It may fall back to English part way through, so versions don't determine it
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}?lang=fr&stream=1')
+    assert len(read_stream(response)) == len(texts)
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_untranslated_stream_is_etagged(client, quiz):
+    quiz_id, texts = quiz
+    response = client.get(f'/api/quiz/{quiz_id}?lang=xx&stream=1')
+    assert english(read_stream(response)) == texts
+    assert 'ETag' in response.headers
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import db
+
+LRU_SIZE = int(os.environ.get('TRANSLATION_CACHE_SIZE', 10000))
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+
+# Hit/miss counters, exposed through /api/translate/stats
+stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+
+def cache_key(model, target_lang, text):
+    """Content address for one translated string."""
+    raw = f"{model}\x00{target_lang}\x00{text}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _remember(key, value):
+    # Caller must hold _lock
+    _lru[key] = value
+    _lru.move_to_end(key)
+    while len(_lru) > LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def translate_cached(translator, model, target_lang, texts):
+    """Translates a list of strings, running the model only on uncached ones.
+
+    Lookups go to the in-process LRU first, then the SQLite table. Strings
+    found in neither are translated in one batch and written to both.
+    """
+    keys = [cache_key(model, target_lang, t) for t in texts]
+    results = {}
+
+    with _lock:
+        for key in keys:
+            if key in _lru:
+                _lru.move_to_end(key)
+                results[key] = _lru[key]
+                stats["memory_hits"] += 1
+
+    pending = [k for k in dict.fromkeys(keys) if k not in results]
+    if not pending:
+        return [results[k] for k in keys]
+
+    conn = db.get_connection()
+
+    placeholders = ",".join("?" * len(pending))
+    rows = conn.execute(
+        f"SELECT cache_key, translated_text FROM translations WHERE cache_key IN ({placeholders})",
+        pending
+    ).fetchall()
+    with _lock:
+        for row in rows:
+            results[row['cache_key']] = row['translated_text']
+            _remember(row['cache_key'], row['translated_text'])
+        stats["db_hits"] += len(rows)
+
+    # Translate each distinct missing string once
+    source_by_key = dict(zip(keys, texts))
+    missing = [k for k in pending if k not in results]
+    if missing:
+        translated = translator([source_by_key[k] for k in missing])
+        new_rows = []
+        with _lock:
+            for key, item in zip(missing, translated):
+                results[key] = item['translation_text']
+                _remember(key, item['translation_text'])
+                new_rows.append((key, model, target_lang, source_by_key[key], item['translation_text']))
+            stats["misses"] += len(missing)
+        conn.executemany(
+            "INSERT OR REPLACE INTO translations (cache_key, model, target_lang, source_text, translated_text) VALUES (?, ?, ?, ?, ?)",
+            new_rows
+        )
+        conn.commit()
+
+    return [results[k] for k in keys]
+
+
+def get_stats():
+    """Returns a snapshot of the hit/miss counters plus the LRU size."""
+    with _lock:
+        snapshot = dict(stats)
+        snapshot["lru_entries"] = len(_lru)
+    lookups = snapshot["memory_hits"] + snapshot["db_hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = (snapshot["memory_hits"] + snapshot["db_hits"]) / lookups if lookups else 0.0
+    return snapshot
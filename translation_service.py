@@ -0,0 +1,258 @@
+"""Local translation service: model processes pinned to cores, behind a Unix socket.
+
+With every web worker running its own Marian model, the torch thread pools
+of all workers compete for the same cores and throughput collapses under
+concurrent translation. This service runs the models instead:
+
+    python translation_service.py          (or TRANSLATION_SERVICE_SPAWN=1,
+                                            see gunicorn.conf.py)
+
+It starts TRANSLATION_SERVICE_WORKERS processes, each pinned to its own set
+of TRANSLATION_SERVICE_THREADS cores with torch limited to that many
+threads. All of them accept on one Unix socket (TRANSLATION_SERVICE_SOCKET),
+so the kernel spreads connections over them. Within a process, concurrent
+requests are merged into shared forward passes by BatchingTranslator, and
+the master restarts any worker that dies.
+
+The protocol is one JSON line each way per connection:
+    {"op": "translate", "lang": "fr", "texts": [...]}  ->  {"translations": [...]}
+    {"op": "health"}                                   ->  {"ok": true, "pid": ..., ...}
+
+When TRANSLATION_SERVICE_SOCKET is set, model_registry hands the web
+workers a RemoteTranslator for each language instead of loading models.
+A call that can't connect, times out (TRANSLATION_SERVICE_TIMEOUT_S) or
+gets an error raises TranslationUnavailable, and app.py serves the quiz in
+English, as it does for unsupported languages. After a failure the client
+doesn't try again for RETRY_S, so requests fall back at once instead of
+each waiting out the timeout.
+
+    python translation_service.py --health     (exit status 1 if it's down)
+"""
+import json
+import os
+import socket
+import threading
+import time
+
+import logs
+
+SOCKET_PATH = os.environ.get('TRANSLATION_SERVICE_SOCKET')
+THREADS = int(os.environ.get('TRANSLATION_SERVICE_THREADS', 2))
+WORKERS = int(os.environ.get('TRANSLATION_SERVICE_WORKERS', 0))  # 0: as many as the cores allow
+TIMEOUT_S = float(os.environ.get('TRANSLATION_SERVICE_TIMEOUT_S', 10))
+RETRY_S = float(os.environ.get('TRANSLATION_SERVICE_RETRY_S', 5))
+MAX_LINE = 16 * 1024 * 1024
+
+log = logs.get_logger('ai')
+
+# True inside the service's own processes, which load models locally
+serving = False
+
+
+class TranslationUnavailable(Exception):
+    """The service couldn't translate: callers serve the English text instead."""
+
+
+def _send_line(sock, message):
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _read_line(sock, deadline=None):
+    chunks, size = [], 0
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("timed out")
+            sock.settimeout(remaining)
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size += len(chunk)
+        if chunk.endswith(b'\n'):
+            return json.loads(b''.join(chunks))
+        if size > MAX_LINE:
+            raise ValueError("message too large")
+
+
+# --- Client side (web workers) ---
+stats = {"calls": 0, "failures": 0, "skipped": 0}
+_down_until = 0.0
+
+
+def call(message, timeout=TIMEOUT_S):
+    """Sends one request to the service and returns its reply. Raises TranslationUnavailable."""
+    global _down_until
+    if time.monotonic() < _down_until:
+        stats["skipped"] += 1
+        raise TranslationUnavailable("translation service marked down")
+    stats["calls"] += 1
+    deadline = time.monotonic() + timeout
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(SOCKET_PATH)
+            _send_line(sock, message)
+            reply = _read_line(sock, deadline)
+    except (OSError, ValueError) as e:
+        stats["failures"] += 1
+        _down_until = time.monotonic() + RETRY_S
+        log.warning("Translation service unavailable (%s); serving English for %.0fs", e, RETRY_S)
+        raise TranslationUnavailable(str(e))
+    if "error" in reply:
+        stats["failures"] += 1
+        raise TranslationUnavailable(reply["error"])
+    return reply
+
+
+class RemoteTranslator:
+    """Pipeline-shaped stand-in for a local model: translator(texts) -> [{'translation_text'}]."""
+
+    def __init__(self, lang):
+        self.lang = lang
+
+    def __call__(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        reply = call({"op": "translate", "lang": self.lang, "texts": list(texts)})
+        return [{'translation_text': text} for text in reply["translations"]]
+
+
+def health(timeout=2.0):
+    """The health reply of whichever worker answers, or {"ok": False, "error": ...}."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(SOCKET_PATH)
+            _send_line(sock, {"op": "health"})
+            return _read_line(sock, time.monotonic() + timeout)
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": str(e)}
+
+
+def get_stats():
+    snapshot = dict(stats)
+    snapshot["down"] = time.monotonic() < _down_until
+    return snapshot
+
+
+# --- Service side ---
+def core_sets(workers, threads):
+    """Splits the cores this process may use into one set per worker."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    if not workers:
+        workers = max(1, len(cores) // threads)
+    sets = []
+    for i in range(workers):
+        start = (i * threads) % len(cores)
+        sets.append({cores[(start + j) % len(cores)] for j in range(min(threads, len(cores)))})
+    return sets
+
+
+def _handle(conn, cores):
+    import model_registry
+    with conn:
+        try:
+            conn.settimeout(TIMEOUT_S)
+            request = _read_line(conn)
+            if request.get("op") == "health":
+                reply = {"ok": True, "pid": os.getpid(), "cores": sorted(cores),
+                         "languages": model_registry.supported_languages(),
+                         "models": model_registry.loaded_models()}
+            elif request.get("op") == "translate":
+                translator, _ = model_registry.get_translator(request.get("lang"))
+                if translator is None:
+                    reply = {"error": f"no model for '{request.get('lang')}'"}
+                else:
+                    reply = {"translations": [item['translation_text'] for item in translator(request["texts"])]}
+            else:
+                reply = {"error": "unknown op"}
+        except Exception as e:
+            reply = {"error": str(e)}
+        try:
+            _send_line(conn, reply)
+        except OSError:
+            pass  # the client gave up (timed out) already
+
+
+def _serve(listener, cores):
+    """Body of one worker process: pin, cap torch threads, then accept forever."""
+    import signal
+
+    global serving
+    serving = True
+    # The master's handlers came along with fork(); terminate() should just stop a worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    # Before torch is imported, so its thread pools are sized to the pinned cores
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[name] = str(len(cores))
+    import batching
+    batching.TORCH_THREADS = str(len(cores))
+    log.info("Translation worker %d serving on cores %s", os.getpid(), sorted(cores))
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except OSError as e:
+            # e.g. out of file descriptors: back off rather than exit
+            log.warning("accept failed: %s", e)
+            time.sleep(0.1)
+            continue
+        threading.Thread(target=_handle, args=(conn, cores), daemon=True).start()
+
+
+def run(workers=WORKERS, threads=THREADS):
+    """Binds the socket, starts one process per core set and restarts any that die."""
+    import multiprocessing
+    import signal
+
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(SOCKET_PATH)
+    listener.listen(128)
+
+    context = multiprocessing.get_context('fork')
+    sets = core_sets(workers, threads)
+    processes = [None] * len(sets)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    log.info("Translation service on %s with %d workers x %d threads", SOCKET_PATH, len(sets), threads)
+    try:
+        while not stopping.is_set():
+            for i, cores in enumerate(sets):
+                if processes[i] is None or not processes[i].is_alive():
+                    if processes[i] is not None:
+                        log.warning("Translation worker %s exited (%s); restarting", processes[i].pid, processes[i].exitcode)
+                    processes[i] = context.Process(target=_serve, args=(listener, cores), daemon=True)
+                    processes[i].start()
+            stopping.wait(1.0)
+    finally:
+        for process in processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in processes:
+            if process is not None:
+                process.join(timeout=10)
+        listener.close()
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+
+
+if __name__ == '__main__':
+    import sys
+    # Run as the importable module, so model_registry sees `serving` set in the workers
+    import translation_service
+
+    if not SOCKET_PATH:
+        print("Set TRANSLATION_SERVICE_SOCKET, e.g. /tmp/translation.sock")
+        sys.exit(1)
+    if '--health' in sys.argv:
+        reply = translation_service.health()
+        print(json.dumps(reply, indent=2))
+        sys.exit(0 if reply.get("ok") else 1)
+    translation_service.run()